@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Mide como escalan las operaciones de GeneradorExcelMensual con el tamanio del libro:
+- crear_excel_nuevo
+- construccion del libro (crear_o_actualizar_hoja_mes + agregar_gasto_a_hoja por mes)
+- wb.save / load_workbook
+- crear_o_actualizar_hoja_mes y agregar_gasto_a_hoja sobre un libro cargado
+- RegeneradorMeses sobre todas las hojas de un libro recien guardado, con 1 y con
+  --workers procesos; falla si el modo paralelo no termina en paralelo
+
+Cada tamanio corre en un proceso nuevo para que el pico de RSS sea propio.
+Los resultados se guardan en JSON y se comparan entre commits con --comparar.
+
+Uso:
+  python benchmarks/bench_excel_mensual.py --meses 1 12 36 120 --variables 20
+  python benchmarks/bench_excel_mensual.py --comparar base.json nuevo.json --umbral 0.10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+import openpyxl  # noqa: E402
+import psutil  # noqa: E402
+
+from excel_mensual import GeneradorExcelMensual  # noqa: E402
+from regeneracion_meses import RegeneradorMeses  # noqa: E402
+
+CATEGORIAS = ['Alimentacion', 'Transporte', 'Hogar', 'Salud', 'Entretenimiento', 'Otros']
+CONCEPTOS = ['almuerzo', 'mercado', 'taxi', 'gasolina', 'farmacia', 'cine', 'domicilio', 'cafe']
+METRICAS = ('mediana_ms', 'rss_pico_mb', 'bytes')
+
+
+class MedidorRss:
+    """Muestrea el RSS del proceso en un hilo y guarda el pico durante el bloque `with`."""
+
+    def __init__(self, intervalo=0.002):
+        self.intervalo = intervalo
+        self.proceso = psutil.Process()
+        self.pico = 0
+        self._activo = False
+        self._hilo = None
+
+    def _muestrear(self):
+        while self._activo:
+            self.pico = max(self.pico, self.proceso.memory_info().rss)
+            time.sleep(self.intervalo)
+
+    def __enter__(self):
+        self.pico = self.proceso.memory_info().rss
+        self._activo = True
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._activo = False
+        self._hilo.join()
+        self.pico = max(self.pico, self.proceso.memory_info().rss)
+
+
+def gasto_sintetico(rng, anio, mes):
+    return {
+        'monto': rng.randrange(2000, 400000, 500),
+        'concepto': rng.choice(CONCEPTOS),
+        'categoria': rng.choice(CATEGORIAS),
+        'fecha': f'{anio:04d}-{mes:02d}-{rng.randint(1, 28):02d}',
+    }
+
+
+def meses_hacia_atras(cantidad):
+    ahora = datetime.now()
+    anio, mes = ahora.year, ahora.month
+    for _ in range(cantidad):
+        yield anio, mes
+        mes -= 1
+        if mes == 0:
+            anio, mes = anio - 1, 12
+
+
+def construir_libro(generador, meses, variables, repeticiones, semilla):
+    """Libro sintetico de `meses` hojas con 0..`variables` gastos por mes (reproducible)."""
+    rng = random.Random(semilla)
+    capacidad = generador.FILA_VARIABLES_DATA_FIN - generador.FILA_VARIABLES_DATA_INICIO + 1
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for i, (anio, mes) in enumerate(meses_hacia_atras(meses)):
+        ws = generador.crear_o_actualizar_hoja_mes(wb, generador.MESES[mes - 1], anio)
+        tope = min(variables, capacidad)
+        if i == 0:
+            # La hoja del mes en curso deja filas libres para medir agregar_gasto_a_hoja.
+            tope = min(tope, max(capacidad - repeticiones, 0))
+        for _ in range(rng.randint(0, tope) if i else tope):
+            generador.agregar_gasto_a_hoja(ws, gasto_sintetico(rng, anio, mes))
+    return wb
+
+
+def medir(nombre, funcion, repeticiones):
+    tiempos = []
+    with MedidorRss() as rss:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+    return {
+        'operacion': nombre,
+        'mediana_ms': round(statistics.median(tiempos) * 1000, 2),
+        'min_ms': round(min(tiempos) * 1000, 2),
+        'max_ms': round(max(tiempos) * 1000, 2),
+        'rss_pico_mb': round(rss.pico / 1024 / 1024, 1),
+    }
+
+
+def correr_tamanio(config, meses, variables, repeticiones, semilla):
+    """Se ejecuta en un proceso hijo: todas las operaciones para un tamanio de libro."""
+    generador = GeneradorExcelMensual(config)
+    resultados = []
+    estado = {}
+
+    def construir():
+        estado['wb'] = construir_libro(generador, meses, variables, repeticiones, semilla)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'bench.xlsx')
+        resultados.append(medir('crear_excel_nuevo', generador.crear_excel_nuevo, repeticiones))
+        resultados.append(medir('construir_libro', construir, repeticiones))
+        resultados.append(medir('wb.save', lambda: estado['wb'].save(ruta), repeticiones))
+        resultados[-1]['bytes'] = os.path.getsize(ruta)
+        del estado['wb']
+
+        def cargar():
+            estado['wb'] = openpyxl.load_workbook(ruta)
+
+        resultados.append(medir('load_workbook', cargar, repeticiones))
+
+        wb = estado['wb']
+        anio, mes = next(meses_hacia_atras(1))
+        hoja = generador._nombre_hoja_mes(generador.MESES[mes - 1], anio)
+        rng = random.Random(semilla)
+        resultados.append(medir(
+            'crear_o_actualizar_hoja_mes',
+            lambda: generador.crear_o_actualizar_hoja_mes(wb, generador.MESES[mes - 1], anio),
+            repeticiones,
+        ))
+        resultados.append(medir(
+            'agregar_gasto_a_hoja',
+            lambda: generador.agregar_gasto_a_hoja(wb[hoja], gasto_sintetico(rng, anio, mes)),
+            repeticiones,
+        ))
+
+    for fila in resultados:
+        fila.update({'meses': meses, 'variables': variables})
+    return resultados
+
+
+def correr_regeneracion(config, meses, variables, repeticiones, semilla, workers):
+    """
+    Regenera todas las hojas de un libro tal como lo guarda la app, en secuencial y
+    con `workers` procesos. Corre en el proceso principal: los hijos del Pool son
+    daemon y no pueden abrir el pool de procesos del regenerador.
+    """
+    generador = GeneradorExcelMensual(config)
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'bench.xlsx')
+        copia = os.path.join(tmp, 'regenerado.xlsx')
+        construir_libro(generador, meses, variables, repeticiones, semilla).save(ruta)
+
+        for cantidad in sorted({1, workers}):
+            regenerador = RegeneradorMeses(config, cantidad)
+            modos = set()
+
+            def regenerar():
+                # Siempre desde el libro original: la primera regeneracion reescribe styles.xml
+                shutil.copy(ruta, copia)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    modos.add(regenerador.regenerar(copia, '1900-01', '2999-12')['modo'])
+
+            fila = medir(f'regenerar_rango_{cantidad}w', regenerar, repeticiones)
+            esperado = 'paralelo' if min(cantidad, meses) > 1 else 'secuencial'
+            if modos != {esperado}:
+                raise RuntimeError(
+                    f'Regenerar con {cantidad} worker(s) termino en modo {sorted(modos)}; se esperaba {esperado}'
+                )
+            fila.update({'meses': meses, 'variables': variables, 'modo': esperado})
+            resultados.append(fila)
+    return resultados
+
+
+def _commit_actual():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        sucio = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ, capture_output=True, text=True
+        ).stdout.strip()
+        return f'{commit}-sucio' if sucio else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconocido'
+
+
+def ejecutar(args):
+    commit = _commit_actual()
+    datos = {
+        'meta': {
+            'commit': commit,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'openpyxl': openpyxl.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'meses': args.meses,
+            'variables': args.variables,
+            'repeticiones': args.repeticiones,
+            'semilla': args.semilla,
+            'workers': args.workers,
+        },
+        'resultados': [],
+    }
+
+    contexto = multiprocessing.get_context('spawn')
+    print(f'{"meses":>6}{"operacion":>30}{"mediana ms":>12}{"min ms":>10}{"RSS MB":>9}{"KB":>9}')
+    for meses in args.meses:
+        with contexto.Pool(1) as pool:
+            filas = pool.apply(correr_tamanio, (args.config, meses, args.variables, args.repeticiones, args.semilla))
+        filas += correr_regeneracion(args.config, meses, args.variables, args.repeticiones, args.semilla, args.workers)
+        for fila in filas:
+            kb = f'{fila["bytes"] / 1024:.0f}' if 'bytes' in fila else ''
+            print(f'{meses:>6}{fila["operacion"]:>30}{fila["mediana_ms"]:>12.1f}{fila["min_ms"]:>10.1f}'
+                  f'{fila["rss_pico_mb"]:>9.1f}{kb:>9}')
+        datos['resultados'].extend(filas)
+
+    salida = args.salida or str(RAIZ / 'benchmarks' / 'resultados' / f'excel_mensual_{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    print(f'Resultados guardados en {salida}')
+
+
+def comparar(ruta_base, ruta_nuevo, umbral):
+    """Compara dos corridas; devuelve la cantidad de regresiones por encima del umbral."""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(ruta_nuevo, encoding='utf-8') as f:
+        nuevo = json.load(f)
+
+    indice = {(r['meses'], r['operacion']): r for r in base['resultados']}
+    print(f'Base {base["meta"]["commit"]} -> nuevo {nuevo["meta"]["commit"]} (umbral {umbral:.0%})')
+    print(f'{"meses":>6}{"operacion":>30}{"metrica":>13}{"base":>12}{"nuevo":>12}{"cambio":>9}')
+
+    regresiones = 0
+    for fila in nuevo['resultados']:
+        previa = indice.get((fila['meses'], fila['operacion']))
+        if not previa:
+            continue
+        for metrica in METRICAS:
+            if metrica not in fila or not previa.get(metrica):
+                continue
+            cambio = fila[metrica] / previa[metrica] - 1
+            marca = ''
+            if cambio > umbral:
+                marca = '  REGRESION'
+                regresiones += 1
+            print(f'{fila["meses"]:>6}{fila["operacion"]:>30}{metrica:>13}{previa[metrica]:>12}'
+                  f'{fila[metrica]:>12}{cambio:>+9.1%}{marca}')
+
+    print(f'{regresiones} regresion(es) por encima del {umbral:.0%}')
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de GeneradorExcelMensual por tamanio de libro')
+    parser.add_argument('--meses', type=int, nargs='+', default=[1, 12, 36, 120])
+    parser.add_argument('--variables', type=int, default=20, help='Maximo de gastos variables por mes')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=2024)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Procesos para medir RegeneradorMeses en paralelo')
+    parser.add_argument('--config', default=str(RAIZ / 'config' / 'configuracion.example.json'))
+    parser.add_argument('--salida', help='Ruta del JSON (por defecto benchmarks/resultados/excel_mensual_<commit>.json)')
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NUEVO'), help='Comparar dos JSON de resultados')
+    parser.add_argument('--umbral', type=float, default=0.10, help='Cambio relativo que cuenta como regresion')
+    args = parser.parse_args()
+
+    if args.comparar:
+        if comparar(args.comparar[0], args.comparar[1], args.umbral):
+            raise SystemExit(1)
+        return
+    ejecutar(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Mide peticiones por segundo del servidor web (web_server.py) con y sin
+conexiones persistentes.
+
+Compara:
+- `http/1.0`: el comportamiento anterior de CustomHandler, una conexion TCP
+  nueva por peticion
+- `hilos`: CustomHandler con HTTP/1.1 keep-alive
+- `asyncio`: ServidorAsync (--async) con keep-alive
+
+Cada cliente es un hilo que repite GET sobre las rutas indicadas; la
+configuracion se lee de una copia temporal de configuracion.example.json.
+
+Uso:
+  python benchmarks/bench_keep_alive.py --clientes 8 --peticiones 500
+  python benchmarks/bench_keep_alive.py --rutas /api/config /app.js
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+import web_server  # noqa: E402
+
+
+class HandlerHttp10(web_server.CustomHandler):
+    """CustomHandler como era antes: HTTP/1.0, una conexion por peticion."""
+
+    protocol_version = 'HTTP/1.0'
+
+
+class HandlerSilencioso:
+    def log_message(self, format, *args):
+        pass
+
+
+def iniciar_hilos(handler):
+    clase = type('Handler', (HandlerSilencioso, handler), {})
+    servidor = web_server.ThreadingTCPServer(('127.0.0.1', 0), clase)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor.server_address[1], servidor.shutdown
+
+
+def iniciar_async(workers):
+    # Puerto libre: se pide uno al sistema y se suelta antes de arrancar
+    with contextlib.closing(socket.socket()) as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    servidor = web_server.ServidorAsync(port, workers)
+    listo = threading.Event()
+    threading.Thread(target=servidor.serve_forever, kwargs={'al_iniciar': listo.set}, daemon=True).start()
+    listo.wait(10)
+    return port, lambda: None
+
+
+def cliente(port, rutas, peticiones, persistente, latencias, errores):
+    conexion = None
+    for i in range(peticiones):
+        if conexion is None:
+            conexion = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        inicio = time.perf_counter()
+        try:
+            conexion.request('GET', rutas[i % len(rutas)], headers={'Accept-Encoding': 'gzip'})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status >= 400:
+                errores.append(respuesta.status)
+        except (OSError, http.client.HTTPException) as e:
+            errores.append(type(e).__name__)
+            conexion.close()
+            conexion = None
+            continue
+        latencias.append(time.perf_counter() - inicio)
+        if not persistente or respuesta.will_close:
+            conexion.close()
+            conexion = None
+    if conexion is not None:
+        conexion.close()
+
+
+def medir(nombre, port, args, persistente):
+    latencias, errores = [], []
+    hilos = [
+        threading.Thread(target=cliente, args=(port, args.rutas, args.peticiones, persistente, latencias, errores))
+        for _ in range(args.clientes)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    p99 = latencias[int(len(latencias) * 0.99) - 1] if latencias else 0
+    print(f'{nombre:<12}{len(latencias) / total:>12.0f}{statistics.median(latencias) * 1000:>12.2f}'
+          f'{p99 * 1000:>10.2f}{len(errores):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de conexiones persistentes del servidor web')
+    parser.add_argument('--clientes', type=int, default=8)
+    parser.add_argument('--peticiones', type=int, default=500, help='Peticiones por cliente')
+    parser.add_argument('--rutas', nargs='+', default=['/api/config', '/', '/app.js', '/styles.css'])
+    parser.add_argument('--workers', type=int, default=None, help='Hilos de las rutas rapidas de la API')
+    parser.add_argument('--config', default=str(RAIZ / 'config' / 'configuracion.example.json'))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / 'configuracion.json'
+        shutil.copyfile(args.config, config_path)
+        web_server.CONFIG_FILE = config_path
+        web_server.CONFIG_CACHE = web_server.CacheConfig(config_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            web_server.recursos_estaticos().precargar()
+
+        print(f'{args.clientes} clientes x {args.peticiones} peticiones, rutas: {" ".join(args.rutas)}')
+        print(f'{"modo":<12}{"pet/s":>12}{"mediana ms":>12}{"p99 ms":>10}{"errores":>9}')
+        for nombre, iniciar, persistente in (
+            ('http/1.0', lambda: iniciar_hilos(HandlerHttp10), False),
+            ('hilos', lambda: iniciar_hilos(web_server.CustomHandler), True),
+            ('asyncio', lambda: iniciar_async(args.workers), True),
+        ):
+            port, detener = iniciar()
+            medir(nombre, port, args, persistente)
+            detener()
+
+
+if __name__ == '__main__':
+    main()
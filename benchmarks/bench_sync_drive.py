@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Mide sincronizar_con_drive y GestorExcel.agregar_gastos contra el Drive simulado
+(src/drive_simulado.py), sin red ni credenciales.
+
+La red se modela con latencia, ancho de banda y errores inyectados; la salida
+incluye tiempos, peticiones HTTP, fallas y bytes transferidos por operacion.
+
+Uso:
+  python benchmarks/bench_sync_drive.py --latencia-ms 80 --ancho-banda-kbps 2048
+  python benchmarks/bench_sync_drive.py --error-500 0.05 --error-timeout 0.02 --repeticiones 10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+import drive_simulado  # noqa: E402
+from bot_whatsapp import GestorExcel  # noqa: E402
+from google_drive_v2 import sincronizar_con_drive  # noqa: E402
+
+GASTOS = [
+    {'monto': 18000, 'concepto': 'almuerzo', 'categoria': 'Alimentacion', 'fecha': '2026-01-15'},
+    {'monto': 9500, 'concepto': 'taxi', 'categoria': 'Transporte', 'fecha': '2026-01-15'},
+]
+
+
+def preparar_config(base, tmp, args):
+    with open(base, 'r', encoding='utf-8-sig') as f:
+        config = json.load(f)
+    gd = config.setdefault('google_drive', {})
+    gd['archivo_excel_id'] = ''
+    gd['carpeta_backup_id'] = ''
+    gd.setdefault('subida', {})['espera_base_s'] = args.espera_base_s
+    gd['simulado'] = {
+        'directorio': os.path.join(tmp, 'drive'),
+        'latencia_ms': args.latencia_ms,
+        'jitter_ms': args.jitter_ms,
+        'ancho_banda_kbps': args.ancho_banda_kbps,
+        'errores': {
+            '429': args.error_429,
+            '500': args.error_500,
+            'timeout': args.error_timeout,
+        },
+        'semilla': args.semilla,
+    }
+    ruta = os.path.join(tmp, 'configuracion.json')
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def medir(nombre, funcion, repeticiones, verboso):
+    tiempos, fallidas = [], 0
+    drive_simulado.reiniciar_estadisticas()
+    for _ in range(repeticiones):
+        salida = contextlib.nullcontext() if verboso else contextlib.redirect_stdout(io.StringIO())
+        inicio = time.perf_counter()
+        with salida:
+            ok = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+        fallidas += 0 if ok else 1
+
+    totales = dict(drive_simulado.ESTADISTICAS)
+    print(f'{nombre:<24}{statistics.median(tiempos) * 1000:>12.1f}{min(tiempos) * 1000:>10.1f}'
+          f'{totales["peticiones"] / repeticiones:>12.1f}{totales["fallas"]:>8}'
+          f'{totales["bytes_subidos"] / repeticiones / 1024:>11.0f}'
+          f'{totales["bytes_descargados"] / repeticiones / 1024:>11.0f}{fallidas:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de sincronizacion contra Drive simulado')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--latencia-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--ancho-banda-kbps', type=float, default=0, help='0 = sin limite')
+    parser.add_argument('--error-429', type=float, default=0)
+    parser.add_argument('--error-500', type=float, default=0)
+    parser.add_argument('--error-timeout', type=float, default=0)
+    parser.add_argument('--espera-base-s', type=float, default=0.05, help='Backoff base de los reintentos')
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--config', default=str(RAIZ / 'config' / 'configuracion.example.json'))
+    parser.add_argument('--verboso', action='store_true', help='Mostrar la salida de cada operacion')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Cache y temporales del proyecto dentro del directorio del benchmark
+        tempfile.tempdir = tmp
+        config_path = preparar_config(args.config, tmp, args)
+        os.environ.pop(drive_simulado.VARIABLE_ENTORNO, None)
+
+        print(f'Drive simulado: latencia {args.latencia_ms:.0f} ms, ancho de banda '
+              f'{args.ancho_banda_kbps or "sin limite"} KB/s, errores 429/500/timeout '
+              f'{args.error_429}/{args.error_500}/{args.error_timeout}')
+        print(f'{"operacion":<24}{"mediana ms":>12}{"min ms":>10}{"peticiones":>12}{"fallas":>8}'
+              f'{"KB subidos":>11}{"KB bajados":>11}{"fallidas":>10}')
+
+        # Primera sincronizacion: crea carpeta, libro y enlace
+        medir('sync inicial', lambda: sincronizar_con_drive(config_path, 'actual').get('success'), 1, args.verboso)
+        medir('sync mes actual', lambda: sincronizar_con_drive(config_path, 'actual').get('success'),
+              args.repeticiones, args.verboso)
+        medir('bot agregar_gastos', lambda: GestorExcel(config_path).agregar_gastos(list(GASTOS)),
+              args.repeticiones, args.verboso)
+
+
+if __name__ == '__main__':
+    main()
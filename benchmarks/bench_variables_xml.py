@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compara el registro de un gasto en la hoja del mes sobre un libro de N meses:
+- openpyxl completo: load_workbook + agregar_gasto_a_hoja + wb.save
+- hoja parcial: LibroXlsxPerezoso + openpyxl solo sobre la hoja del mes
+- parche XML: ParcheVariablesXml sobre la parte de la hoja
+
+Uso: python benchmarks/bench_variables_xml.py --meses 36 --repeticiones 5
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+import openpyxl  # noqa: E402
+
+from excel_mensual import GeneradorExcelMensual  # noqa: E402
+from variables_xml import ParcheVariablesXml  # noqa: E402
+from xlsx_perezoso import LibroXlsxPerezoso  # noqa: E402
+
+GASTO = {'monto': 18000, 'concepto': 'almuerzo', 'categoria': 'Alimentacion', 'fecha': '2026-01-15'}
+
+
+def construir_libro(generador, meses, variables, ruta):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    ahora = datetime.now()
+    anio, mes = ahora.year, ahora.month
+    for _ in range(meses):
+        ws = generador.crear_o_actualizar_hoja_mes(wb, generador.MESES[mes - 1], anio)
+        for i in range(variables):
+            generador.agregar_gasto_a_hoja(ws, dict(GASTO, concepto=f'gasto {i}'))
+        mes -= 1
+        if mes == 0:
+            anio, mes = anio - 1, 12
+    wb.save(ruta)
+
+
+def via_openpyxl(generador, ruta, hoja):
+    wb = openpyxl.load_workbook(ruta)
+    generador.agregar_gasto_a_hoja(wb[hoja], GASTO)
+    wb.save(ruta)
+
+
+def via_hoja_parcial(generador, ruta, hoja):
+    libro = LibroXlsxPerezoso(ruta)
+    ws = libro.cargar_hoja(hoja)
+    generador.agregar_gasto_a_hoja(ws, GASTO)
+    libro.actualizar_hoja(ws)
+    libro.guardar()
+
+
+def via_parche_xml(generador, ruta, hoja):
+    libro = LibroXlsxPerezoso(ruta)
+    ParcheVariablesXml(libro, hoja, generador).agregar([GASTO])
+    libro.guardar()
+
+
+def medir(funcion, generador, base, hoja, repeticiones, tmp):
+    tiempos = []
+    for i in range(repeticiones):
+        ruta = os.path.join(tmp, f'run_{funcion.__name__}_{i}.xlsx')
+        shutil.copy(base, ruta)
+        inicio = time.perf_counter()
+        funcion(generador, ruta, hoja)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de registro de gastos en H:K')
+    parser.add_argument('--meses', type=int, default=36)
+    parser.add_argument('--variables', type=int, default=10, help='Gastos ya registrados por mes')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--config', default=str(RAIZ / 'config' / 'configuracion.example.json'))
+    args = parser.parse_args()
+
+    generador = GeneradorExcelMensual(args.config)
+    ahora = datetime.now()
+    hoja = generador._nombre_hoja_mes(generador.MESES[ahora.month - 1], ahora.year)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, 'base.xlsx')
+        construir_libro(generador, args.meses, args.variables, base)
+        print(f'Libro de {args.meses} meses, {os.path.getsize(base) / 1024:.0f} KB, hoja objetivo {hoja}')
+        print(f'{"ruta":<28}{"mediana ms":>12}{"min ms":>10}{"x vs openpyxl":>16}')
+
+        referencia = None
+        for funcion in (via_openpyxl, via_hoja_parcial, via_parche_xml):
+            tiempos = medir(funcion, generador, base, hoja, args.repeticiones, tmp)
+            mediana = statistics.median(tiempos)
+            referencia = referencia or mediana
+            print(f'{funcion.__name__:<28}{mediana * 1000:>12.1f}{min(tiempos) * 1000:>10.1f}'
+                  f'{referencia / mediana:>15.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,15 @@ from generador_excel import GeneradorExcelGastos
 import schedule
 import time
 
+try:
+    import config_archivo
+except ModuleNotFoundError:
+    from src import config_archivo
+
 class AutomatizadorGastos:
     
     def __init__(self, config_path='config/configuracion.json'):
+        self.config_path = config_path
         with open(config_path, 'r', encoding='utf-8') as f:
             self.config = json.load(f)
         self.generador = GeneradorExcelGastos(config_path)
@@ -97,20 +103,17 @@ class AutomatizadorGastos:
             self.crear_nueva_hoja_mensual()
     
     def cambiar_sueldo(self, nuevo_sueldo):
-        self.config['sueldo']['valor_fijo'] = nuevo_sueldo
-        
-        with open('config/configuracion.json', 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
+        # Solo se escribe la ruta cambiada: lo que la web haya guardado mientras tanto se conserva
+        self.config = config_archivo.aplicar_parche(self.config_path, {'sueldo': {'valor_fijo': nuevo_sueldo}})
         
         print(f'Sueldo actualizado a: ${nuevo_sueldo:,.0f} COP')
         self._registrar_log(f'Sueldo modificado a: {nuevo_sueldo}')
     
     def actualizar_gasto_fijo(self, concepto, nuevo_valor):
         if concepto in self.config['gastos_fijos']:
-            self.config['gastos_fijos'][concepto]['valor'] = nuevo_valor
-            
-            with open('config/configuracion.json', 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            self.config = config_archivo.aplicar_parche(
+                self.config_path, {'gastos_fijos': {concepto: {'valor': nuevo_valor}}}
+            )
             
             print(f'Gasto fijo "{concepto}" actualizado a: ${nuevo_valor:,.0f} COP')
             self._registrar_log(f'Gasto fijo modificado - {concepto}: {nuevo_valor}')
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import random
+from datetime import datetime
+
+# Fragmentacion por contenido (FastCDC): los cortes dependen de los bytes, no de
+# las posiciones, asi un cambio local solo altera los fragmentos que lo rodean.
+FRAGMENTO_MIN = 16 * 1024
+FRAGMENTO_PROMEDIO = 64 * 1024
+FRAGMENTO_MAX = 256 * 1024
+_MASCARA_ESTRICTA = (1 << 18) - 1
+_MASCARA_LAXA = (1 << 14) - 1
+_UINT64 = (1 << 64) - 1
+_RNG_GEAR = random.Random(0x5EED)
+_GEAR = [_RNG_GEAR.getrandbits(64) for _ in range(256)]
+
+MIME_CARPETA = 'application/vnd.google-apps.folder'
+
+
+def _siguiente_corte(datos, inicio):
+    n = len(datos)
+    restante = n - inicio
+    if restante <= FRAGMENTO_MIN:
+        return n
+    fin = inicio + min(restante, FRAGMENTO_MAX)
+    normal = inicio + min(restante, FRAGMENTO_PROMEDIO)
+    h = 0
+    i = inicio + FRAGMENTO_MIN
+    while i < normal:
+        h = ((h << 1) + _GEAR[datos[i]]) & _UINT64
+        if not h & _MASCARA_ESTRICTA:
+            return i + 1
+        i += 1
+    while i < fin:
+        h = ((h << 1) + _GEAR[datos[i]]) & _UINT64
+        if not h & _MASCARA_LAXA:
+            return i + 1
+        i += 1
+    return fin
+
+
+def fragmentar(datos):
+    """Divide `datos` en fragmentos definidos por contenido; devuelve [(sha256, bytes)]."""
+    fragmentos = []
+    inicio = 0
+    while inicio < len(datos):
+        corte = _siguiente_corte(datos, inicio)
+        trozo = datos[inicio:corte]
+        fragmentos.append((hashlib.sha256(trozo).hexdigest(), trozo))
+        inicio = corte
+    return fragmentos
+
+
+class AlmacenBackups:
+    """
+    Backups incrementales con deduplicacion en Drive:
+    - cada archivo se parte en fragmentos direccionados por sha256 (carpeta `blobs`)
+    - cada snapshot es un manifiesto JSON con la lista de fragmentos por archivo (carpeta `snapshots`)
+    - solo se suben fragmentos que Drive aun no tiene; restaurar reensambla cualquier snapshot
+    El indice local (logs/backups/indice.json) recuerda los fragmentos ya subidos.
+    """
+
+    def __init__(self, drive, carpeta_origen='excel_templates', dir_local='logs/backups'):
+        self.drive = drive
+        self.transferencias = drive.transferencias()
+        self.carpeta_origen = carpeta_origen
+        self.dir_local = dir_local
+        self.dir_blobs_local = os.path.join(dir_local, 'blobs')
+        self.ruta_indice = os.path.join(dir_local, 'indice.json')
+        os.makedirs(self.dir_blobs_local, exist_ok=True)
+        self.indice = self._cargar_indice()
+
+    def _cargar_indice(self):
+        try:
+            with open(self.ruta_indice, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+        except (OSError, ValueError):
+            indice = {}
+        indice.setdefault('blobs', {})
+        indice.setdefault('carpetas', {})
+        indice.setdefault('ultimo_manifiesto', None)
+        return indice
+
+    def _guardar_indice(self):
+        temporal = f'{self.ruta_indice}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.indice, f, indent=2)
+        os.replace(temporal, self.ruta_indice)
+
+    # Carpetas y listados en Drive
+
+    def _carpeta(self, nombre, padre):
+        clave = f'{padre}/{nombre}'
+        if clave in self.indice['carpetas']:
+            return self.indice['carpetas'][clave]
+        items = self.transferencias.listar(padre, query=f"mimeType='{MIME_CARPETA}' and name='{nombre}'", campos='id')
+        if items:
+            carpeta_id = items[0]['id']
+        else:
+            carpeta_id = self.transferencias.reintentar(lambda servicio: servicio.files().create(
+                body={'name': nombre, 'mimeType': MIME_CARPETA, 'parents': [padre]},
+                fields='id'
+            ).execute())['id']
+        self.indice['carpetas'][clave] = carpeta_id
+        return carpeta_id
+
+    def _listar(self, carpeta_id):
+        return self.transferencias.listar(carpeta_id, campos='id, name, size, createdTime')
+
+    def _preparar_carpetas(self, raiz_id):
+        self.carpeta_blobs = self._carpeta('blobs', raiz_id)
+        self.carpeta_snapshots = self._carpeta('snapshots', raiz_id)
+        if not self.indice['blobs']:
+            # Indice local perdido o primera vez: reconstruirlo desde Drive
+            for archivo in self._listar(self.carpeta_blobs):
+                self.indice['blobs'][archivo['name']] = archivo['id']
+
+    def _descargar_bytes(self, file_id):
+        transferencia, = self.transferencias.descargar([{'file_id': file_id}])
+        if not transferencia.ok:
+            raise transferencia.error
+        return transferencia.resultado
+
+    # Backup
+
+    def _archivos_origen(self):
+        for root, _dirs, files in os.walk(self.carpeta_origen):
+            for file in sorted(files):
+                if file.endswith('.xlsx'):
+                    ruta = os.path.join(root, file)
+                    yield ruta, os.path.relpath(ruta, self.carpeta_origen).replace(os.sep, '/')
+
+    def crear_snapshot(self, raiz_id):
+        """Sube los fragmentos nuevos y el manifiesto del snapshot; devuelve un resumen."""
+        self._preparar_carpetas(raiz_id)
+        previo = {a['ruta']: a for a in (self.indice.get('ultimo_manifiesto') or {}).get('archivos', [])}
+
+        manifiesto = {'version': 1, 'creado_en': datetime.now().isoformat(timespec='seconds'), 'archivos': []}
+        bytes_total = reutilizados = 0
+        pendientes = {}
+        for ruta, relativa in self._archivos_origen():
+            with open(ruta, 'rb') as f:
+                datos = f.read()
+            sha = hashlib.sha256(datos).hexdigest()
+            bytes_total += len(datos)
+
+            anterior = previo.get(relativa)
+            if anterior and anterior['sha256'] == sha:
+                # Archivo identico al ultimo snapshot: se reutiliza su lista de fragmentos
+                fragmentos = anterior['fragmentos']
+                reutilizados += len(fragmentos)
+            else:
+                fragmentos = []
+                for sha_fragmento, trozo in fragmentar(datos):
+                    fragmentos.append(sha_fragmento)
+                    if sha_fragmento in self.indice['blobs'] or sha_fragmento in pendientes:
+                        reutilizados += 1
+                    else:
+                        pendientes[sha_fragmento] = trozo
+
+            manifiesto['archivos'].append({
+                'ruta': relativa,
+                'bytes': len(datos),
+                'sha256': sha,
+                'fragmentos': fragmentos,
+            })
+
+        # Fragmentos nuevos en paralelo; el manifiesto solo se sube si llegaron todos
+        nuevos = len(pendientes)
+        bytes_subidos = sum(len(trozo) for trozo in pendientes.values())
+        transferencias = self.transferencias.subir([
+            {'datos': trozo, 'nombre': sha, 'carpeta_id': self.carpeta_blobs}
+            for sha, trozo in pendientes.items()
+        ])
+        for sha, transferencia in zip(pendientes, transferencias):
+            if transferencia.ok:
+                self.indice['blobs'][sha] = transferencia.resultado
+        fallidos = [t for t in transferencias if not t.ok]
+        if fallidos:
+            self._guardar_indice()
+            raise RuntimeError(f'{len(fallidos)} fragmento(s) no se pudieron subir; el snapshot no se registro')
+
+        nombre = f'snapshot_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        contenido = json.dumps(manifiesto, indent=2).encode('utf-8')
+        subida, = self.transferencias.subir([{
+            'datos': contenido,
+            'nombre': nombre,
+            'carpeta_id': self.carpeta_snapshots,
+            'mimetype': 'application/json',
+        }])
+        if not subida.ok:
+            self._guardar_indice()
+            raise subida.error
+        manifiesto_id = subida.resultado
+        self.indice['ultimo_manifiesto'] = manifiesto
+        self._guardar_indice()
+
+        return {
+            'snapshot': nombre,
+            'manifiesto_id': manifiesto_id,
+            'archivos': len(manifiesto['archivos']),
+            'bytes_total': bytes_total,
+            'bytes_subidos': bytes_subidos + len(contenido),
+            'fragmentos_nuevos': nuevos,
+            'fragmentos_reutilizados': reutilizados,
+            'transferencia': self.transferencias.resumen(transferencias),
+        }
+
+    # Restauracion
+
+    def listar_snapshots(self, raiz_id):
+        self._preparar_carpetas(raiz_id)
+        snapshots = [a for a in self._listar(self.carpeta_snapshots) if a['name'].startswith('snapshot_')]
+        return sorted(snapshots, key=lambda a: a['name'])
+
+    def _fragmento(self, sha):
+        with open(os.path.join(self.dir_blobs_local, sha), 'rb') as f:
+            datos = f.read()
+        if hashlib.sha256(datos).hexdigest() != sha:
+            raise ValueError(f'Fragmento {sha} corrupto en Drive')
+        return datos
+
+    def _traer_fragmentos(self, shas):
+        """Descarga en paralelo a la cache local los fragmentos que falten o esten danados."""
+        faltantes = []
+        for sha in dict.fromkeys(shas):
+            ruta = os.path.join(self.dir_blobs_local, sha)
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() == sha:
+                        continue
+            if sha not in self.indice['blobs']:
+                raise ValueError(f'Fragmento {sha} no encontrado en Drive')
+            faltantes.append({'file_id': self.indice['blobs'][sha], 'ruta': ruta, 'etiqueta': sha})
+
+        transferencias = self.transferencias.descargar(faltantes)
+        fallidos = [t for t in transferencias if not t.ok]
+        if fallidos:
+            raise RuntimeError(f'{len(fallidos)} fragmento(s) no se pudieron descargar')
+        return self.transferencias.resumen(transferencias)
+
+    def restaurar(self, raiz_id, destino, snapshot=None):
+        """Reensambla un snapshot (por nombre; el mas reciente si es None) en `destino`."""
+        snapshots = self.listar_snapshots(raiz_id)
+        if snapshot:
+            snapshots = [s for s in snapshots if s['name'] == snapshot]
+        if not snapshots:
+            raise ValueError(f'Snapshot no encontrado: {snapshot or "(ninguno)"}')
+
+        manifiesto = json.loads(self._descargar_bytes(snapshots[-1]['id']))
+        self._traer_fragmentos(sha for archivo in manifiesto['archivos'] for sha in archivo['fragmentos'])
+        restaurados = []
+        for archivo in manifiesto['archivos']:
+            datos = b''.join(self._fragmento(sha) for sha in archivo['fragmentos'])
+            if hashlib.sha256(datos).hexdigest() != archivo['sha256']:
+                raise ValueError(f'El archivo {archivo["ruta"]} no coincide con su sha256 tras reensamblar')
+            ruta = os.path.join(destino, *archivo['ruta'].split('/'))
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, 'wb') as f:
+                f.write(datos)
+            restaurados.append(ruta)
+        self._guardar_indice()
+        return restaurados
@@ -1,10 +1,26 @@
 import json
 import os
 import re
-import tempfile
+import threading
+import time
 from datetime import datetime
 from typing import Dict, List, Tuple
 
+try:
+    import metricas
+    from escritura_agrupada import EscrituraAgrupada
+    from idempotencia import RegistroIdempotencia
+except ModuleNotFoundError:
+    from src import metricas
+    from src.escritura_agrupada import EscrituraAgrupada
+    from src.idempotencia import RegistroIdempotencia
+
+MENSAJE_SIN_MONTOS = (
+    'No pude identificar montos en tu mensaje.\n'
+    'Ejemplos: "almuerzo 18000 y uber 12000" o "mercado 85000; farmacia 23000".'
+)
+MENSAJE_ERROR_REGISTRO = 'Error al registrar los gastos. Verifica la conexion y el archivo Excel.'
+
 
 class ProcesadorMensajes:
     def __init__(self, config_path='config/configuracion.json'):
@@ -230,6 +246,16 @@ class ProcesadorMensajes:
         return resultado
 
     def procesar_mensaje_multiple(self, mensaje: str) -> List[Dict]:
+        inicio = time.perf_counter()
+        gastos = self._procesar_mensaje_multiple(mensaje)
+        metricas.DURACION_PARSER.observar(time.perf_counter() - inicio)
+        metricas.MENSAJES_PARSER.inc()
+        metricas.CARACTERES_PARSER.inc(valor=len(mensaje or ''))
+        if gastos:
+            metricas.GASTOS_PARSER.inc(valor=len(gastos))
+        return gastos
+
+    def _procesar_mensaje_multiple(self, mensaje: str) -> List[Dict]:
         txt = (mensaje or '').strip()
         if not txt:
             return []
@@ -368,9 +394,8 @@ class ProcesadorMensajes:
 class GestorExcel:
     def __init__(self, config_path='config/configuracion.json'):
         self.config_path = config_path
-        self.temp_dir = os.path.join(tempfile.gettempdir(), 'control_gastos')
-        os.makedirs(self.temp_dir, exist_ok=True)
-        self.archivo_temp = os.path.join(self.temp_dir, 'ControlDeGastos.xlsx')
+        # md5 de la revision descargada; la subida solo pisa esa revision
+        self.revision_base = None
         self.meses = [
             'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
             'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre'
@@ -391,7 +416,10 @@ class GestorExcel:
             drive = GoogleDriveManager(self.config_path)
             if not drive.autenticar():
                 return None
-            return drive.descargar_excel_drive(self.archivo_temp)
+            # Sin ruta: cada descarga va a un temporal propio
+            ruta = drive.descargar_excel_drive()
+            self.revision_base = drive.revision_base if ruta else None
+            return ruta
         except Exception as e:
             print(f'Error descargando de Drive: {e}')
             return None
@@ -407,7 +435,9 @@ class GestorExcel:
             if not drive.autenticar():
                 return False
 
-            file_id = drive.subir_excel_drive(ruta_local, actualizar=True)
+            file_id = drive.subir_excel_drive(ruta_local, actualizar=True, base_md5=self.revision_base)
+            if file_id is not None:
+                self.revision_base = drive.revision_base
             return file_id is not None
         except Exception as e:
             print(f'Error subiendo a Drive: {e}')
@@ -416,60 +446,148 @@ class GestorExcel:
     def agregar_gastos(self, gastos: List[Dict]) -> bool:
         from openpyxl import load_workbook
         try:
+            import eventos
             from excel_mensual import GeneradorExcelMensual
+            from google_drive_v2 import escritura_excel
         except ModuleNotFoundError:
+            from src import eventos
             from src.excel_mensual import GeneradorExcelMensual
+            from src.google_drive_v2 import escritura_excel
 
         if not gastos:
             return False
 
+        ruta_excel = None
         try:
-            print(f'Procesando {len(gastos)} gasto(s)...')
-            print('Descargando Excel desde Drive...')
-            ruta_excel = self.descargar_excel_drive()
-
-            generador = GeneradorExcelMensual(self.config_path)
-            if not ruta_excel or not os.path.exists(ruta_excel):
-                print('Creando nuevo Excel...')
-                wb = generador.crear_excel_nuevo()
-                ruta_excel = generador.guardar_excel_temporal(wb)
-                print(f'Excel creado en: {ruta_excel}')
-            else:
-                print(f'Cargando Excel existente: {ruta_excel}')
-                wb = load_workbook(ruta_excel)
+            # Mismo turno que sincronizacion y regeneracion: nadie sube entre la descarga y la subida
+            with escritura_excel():
+                print(f'Procesando {len(gastos)} gasto(s)...')
+                print('Descargando Excel desde Drive...')
+                with eventos.etapa('descargar'):
+                    ruta_excel = self.descargar_excel_drive()
+
+                with eventos.etapa('actualizar', gastos=len(gastos)):
+                    generador = GeneradorExcelMensual(self.config_path)
+                    hoja_actual, mes_actual, anio_actual = self._nombre_hoja_actual()
+                    print(f'Mes actual: {mes_actual} {anio_actual}')
+
+                    if not ruta_excel or not os.path.exists(ruta_excel):
+                        print('Creando nuevo Excel...')
+                        wb = generador.crear_excel_nuevo()
+                        ruta_excel = generador.guardar_excel_temporal(wb)
+                        print(f'Excel creado en: {ruta_excel}')
+                    elif self._agregar_con_parche_xml(ruta_excel, generador, gastos):
+                        wb = None
+                    elif self._agregar_en_hoja_parcial(ruta_excel, generador, gastos):
+                        wb = None
+                    else:
+                        print(f'Cargando Excel existente: {ruta_excel}')
+                        with metricas.DURACION_LIBRO.medir('cargar'):
+                            wb = load_workbook(ruta_excel)
+
+                    if wb is not None:
+                        print(f'Hojas disponibles: {wb.sheetnames}')
+
+                        if hoja_actual not in wb.sheetnames and mes_actual not in wb.sheetnames:
+                            print(f'Creando hoja para {hoja_actual}...')
+                        elif hoja_actual not in wb.sheetnames and mes_actual in wb.sheetnames:
+                            print(f'Migrando hoja legacy "{mes_actual}" a "{hoja_actual}"...')
+                        else:
+                            print(f'Actualizando estructura de hoja {hoja_actual} sin perder registros...')
+
+                        ws = generador.crear_o_actualizar_hoja_mes(wb, mes_actual, anio_actual)
+                        for gasto in gastos:
+                            generador.agregar_gasto_a_hoja(ws, gasto)
+
+                if wb is not None:
+                    print('Guardando Excel local...')
+                    with eventos.etapa('guardar'), metricas.DURACION_LIBRO.medir('guardar'):
+                        wb.save(ruta_excel)
+                    print(f'Excel guardado en: {ruta_excel}')
+
+                print('Sincronizando con Google Drive...')
+                with eventos.etapa('subir'):
+                    exito_sync = self.subir_excel_drive(ruta_excel)
+                if not exito_sync:
+                    # La copia local es temporal (se borra al terminar): sin subida no hay registro
+                    print('Error sincronizando con Drive; los gastos no quedaron registrados')
+                    return False
+                print('Sincronizado con Drive exitosamente')
+                return True
+        except Exception as e:
+            print(f'ERROR al agregar gastos: {e}')
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            if ruta_excel and os.path.exists(ruta_excel):
+                os.remove(ruta_excel)
 
-            hoja_actual, mes_actual, anio_actual = self._nombre_hoja_actual()
-            print(f'Mes actual: {mes_actual} {anio_actual}')
-            print(f'Hojas disponibles: {wb.sheetnames}')
+    def _agregar_con_parche_xml(self, ruta_excel: str, generador, gastos: List[Dict]) -> bool:
+        """Inserta H:K directamente en el XML de la hoja; False si el layout no se reconoce."""
+        import zipfile
+        try:
+            from variables_xml import ParcheVariablesXml
+            from xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
+        except ModuleNotFoundError:
+            from src.variables_xml import ParcheVariablesXml
+            from src.xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
 
-            if hoja_actual not in wb.sheetnames and mes_actual not in wb.sheetnames:
-                print(f'Creando hoja para {hoja_actual}...')
-            elif hoja_actual not in wb.sheetnames and mes_actual in wb.sheetnames:
-                print(f'Migrando hoja legacy "{mes_actual}" a "{hoja_actual}"...')
-            else:
-                print(f'Actualizando estructura de hoja {hoja_actual} sin perder registros...')
+        hoja_actual, _mes_actual, _anio_actual = self._nombre_hoja_actual()
+        try:
+            libro = LibroXlsxPerezoso(ruta_excel)
+        except (HojaNoSoportada, zipfile.BadZipFile):
+            return False
+
+        try:
+            if hoja_actual not in libro.nombres_hojas:
+                return False
+            parche = ParcheVariablesXml(libro, hoja_actual, generador)
+            filas = parche.agregar(gastos)
+            libro.guardar(ruta_excel)
+            print(f'Gastos escritos directo en XML de {hoja_actual} (filas {filas})')
+            return True
+        except HojaNoSoportada as e:
+            print(f'Ruta XML no disponible ({e}), usando openpyxl')
+            return False
+        finally:
+            libro.cerrar()
+
+    def _agregar_en_hoja_parcial(self, ruta_excel: str, generador, gastos: List[Dict]) -> bool:
+        """Actualiza solo la hoja del mes dentro del zip; False si hace falta la carga completa."""
+        import zipfile
+        try:
+            from xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
+        except ModuleNotFoundError:
+            from src.xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
+
+        hoja_actual, mes_actual, anio_actual = self._nombre_hoja_actual()
+        try:
+            libro = LibroXlsxPerezoso(ruta_excel)
+        except (HojaNoSoportada, zipfile.BadZipFile) as e:
+            print(f'Carga parcial no disponible ({e}), usando carga completa')
+            return False
 
-            ws = generador.crear_o_actualizar_hoja_mes(wb, mes_actual, anio_actual)
+        try:
+            if hoja_actual not in libro.nombres_hojas:
+                return False
+
+            print(f'Cargando solo la hoja {hoja_actual} de {len(libro.nombres_hojas)}...')
+            ws = libro.cargar_hoja(hoja_actual)
+            ws = generador.crear_o_actualizar_hoja_mes(ws.parent, mes_actual, anio_actual)
             for gasto in gastos:
                 generador.agregar_gasto_a_hoja(ws, gasto)
 
-            print('Guardando Excel local...')
-            wb.save(ruta_excel)
+            print('Guardando Excel local (solo la hoja del mes)...')
+            libro.actualizar_hoja(ws)
+            libro.guardar(ruta_excel)
             print(f'Excel guardado en: {ruta_excel}')
-
-            print('Sincronizando con Google Drive...')
-            exito_sync = self.subir_excel_drive(ruta_excel)
-            if exito_sync:
-                print('Sincronizado con Drive exitosamente')
-            else:
-                print('Error sincronizando con Drive, pero los gastos se guardaron localmente')
-
             return True
-        except Exception as e:
-            print(f'ERROR al agregar gastos: {e}')
-            import traceback
-            traceback.print_exc()
+        except HojaNoSoportada as e:
+            print(f'Carga parcial no disponible ({e}), usando carga completa')
             return False
+        finally:
+            libro.cerrar()
 
     def agregar_gasto(self, datos_gasto: Dict) -> bool:
         return self.agregar_gastos([datos_gasto])
@@ -503,6 +621,10 @@ class BotWhatsApp:
     def __init__(self):
         self.procesador = ProcesadorMensajes()
         self.gestor_excel = GestorExcel()
+        # Solo se serializa lo que escribe cada mensaje: ayuda y consultas no esperan a nadie
+        self._lock_config = threading.Lock()
+        self._escritura_excel = EscrituraAgrupada(self._agregar_lotes, 'bot_excel')
+        self.idempotencia = RegistroIdempotencia()
 
     def procesar_entrada(self, mensaje: str, numero_remitente: str = None) -> str:
         if self.procesador.es_comando(mensaje):
@@ -512,26 +634,143 @@ class BotWhatsApp:
             if resultado['tipo'] == 'consulta':
                 return self._manejar_consulta(resultado['accion'])
             if resultado['tipo'] == 'configuracion':
-                return self._manejar_configuracion(resultado)
+                with metricas.lock_medido(self._lock_config, 'bot_config'):
+                    return self._manejar_configuracion(resultado)
             if resultado['tipo'] == 'error':
                 return resultado['mensaje']
             return resultado.get('mensaje', 'Comando no reconocido')
 
         gastos = self.procesador.procesar_mensaje_multiple(mensaje)
         if not gastos:
-            return (
-                'No pude identificar montos en tu mensaje.\n'
-                'Ejemplos: "almuerzo 18000 y uber 12000" o "mercado 85000; farmacia 23000".'
-            )
+            return MENSAJE_SIN_MONTOS
 
-        exito = self.gestor_excel.agregar_gastos(gastos)
+        exito = self._escritura_excel.escribir(gastos)
         if not exito:
-            return 'Error al registrar los gastos. Verifica la conexion y el archivo Excel.'
+            return MENSAJE_ERROR_REGISTRO
+        return self._respuesta_gastos(gastos)
 
+    def _respuesta_gastos(self, gastos: List[Dict]) -> str:
         if len(gastos) == 1:
             return self.procesador.generar_respuesta(gastos[0])
         return self.procesador.generar_respuesta_multiple(gastos)
 
+    @staticmethod
+    def _fecha_cliente(valor) -> str:
+        """
+        Dia del gasto segun el cliente: ISO 8601 o epoch en segundos/milisegundos.
+        Regla de zona: si el cliente manda offset ('2026-10-18T14:03:00-05:00') se
+        usa su dia; sin offset (ISO sin zona o epoch) se usa la hora local del
+        servidor, como los mensajes que llegan sin fecha. None si no viene.
+        """
+        if valor in (None, ''):
+            return None
+        if isinstance(valor, bool):
+            raise ValueError(f'Fecha invalida: {valor!r}')
+        if isinstance(valor, (int, float)):
+            segundos = valor / 1000 if valor > 1e11 else valor
+            try:
+                return datetime.fromtimestamp(segundos).strftime('%Y-%m-%d')
+            except (ValueError, OverflowError, OSError):
+                # Epoch fuera del rango que admite la plataforma (p. ej. 1e20)
+                raise ValueError(f'Fecha invalida: {valor!r}')
+        texto = str(valor).strip()
+        if texto.endswith('Z'):
+            texto = texto[:-1] + '+00:00'
+        try:
+            return datetime.fromisoformat(texto).strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f'Fecha invalida: {valor!r}')
+
+    def procesar_lote(self, mensajes: List, numero_remitente: str = None) -> List[Dict]:
+        """
+        Varios mensajes (p. ej. la cola offline del celular) con una sola escritura del
+        Excel. Cada item es un texto o un dict con `mensaje` y opcionalmente `fecha`
+        (del cliente), `clave` de idempotencia y `numero_remitente`. Devuelve un
+        resultado por mensaje, en el mismo orden: `estado` es registrado, comando,
+        sin_montos, duplicado (clave ya aplicada), en_proceso (otra peticion esta
+        aplicando la clave: reintentar) o error.
+        """
+        resultados = []
+        reservadas = {}
+        repetidas = []
+        pendientes = []
+        try:
+            for indice, item in enumerate(mensajes):
+                if not isinstance(item, dict):
+                    item = {'mensaje': item}
+                clave = item.get('clave')
+                resultado = {'indice': indice, 'clave': clave, 'estado': 'error', 'respuesta': '', 'gastos': 0}
+                resultados.append(resultado)
+
+                texto = str(item.get('mensaje') or '').strip()
+                if not texto:
+                    resultado['respuesta'] = 'El campo "mensaje" es obligatorio.'
+                    continue
+                remitente = item.get('numero_remitente') or numero_remitente
+
+                if clave:
+                    clave_registro = f'{remitente or ""}:{clave}'
+                    if clave_registro in reservadas:
+                        # Misma clave dos veces en el lote: responde lo mismo que la primera
+                        repetidas.append((resultado, reservadas[clave_registro]))
+                        continue
+                    previo = self.idempotencia.reservar(clave_registro)
+                    if previo is not None and previo.get('estado') == 'en_proceso':
+                        resultado.update(estado='en_proceso', respuesta=previo['respuesta'])
+                        continue
+                    if previo is not None:
+                        resultado.update(estado='duplicado', respuesta=previo.get('respuesta', ''),
+                                         gastos=previo.get('gastos', 0))
+                        continue
+                    reservadas[clave_registro] = resultado
+
+                try:
+                    fecha = self._fecha_cliente(item.get('fecha'))
+                except (ValueError, OverflowError, OSError) as e:
+                    resultado['respuesta'] = str(e)
+                    continue
+
+                if self.procesador.es_comando(texto):
+                    resultado.update(estado='comando', respuesta=self.procesar_entrada(texto, remitente))
+                    continue
+
+                gastos = self.procesador.procesar_mensaje_multiple(texto)
+                if not gastos:
+                    resultado.update(estado='sin_montos', respuesta=MENSAJE_SIN_MONTOS)
+                    continue
+                if fecha:
+                    for gasto in gastos:
+                        gasto['fecha'] = fecha
+                resultado['gastos'] = len(gastos)
+                pendientes.append((resultado, gastos))
+
+            if pendientes:
+                print(f'Lote de {len(mensajes)} mensaje(s): {len(pendientes)} con gastos en una sola escritura')
+                exito = self._escritura_excel.escribir([gasto for _resultado, gastos in pendientes for gasto in gastos])
+                for resultado, gastos in pendientes:
+                    if exito:
+                        resultado.update(estado='registrado', respuesta=self._respuesta_gastos(gastos))
+                    else:
+                        resultado['respuesta'] = MENSAJE_ERROR_REGISTRO
+            for resultado, original in repetidas:
+                resultado.update(estado='duplicado' if original['estado'] != 'error' else 'error',
+                                 respuesta=original['respuesta'], gastos=original['gastos'])
+
+            self.idempotencia.confirmar({
+                clave: {'estado': resultado['estado'], 'respuesta': resultado['respuesta'], 'gastos': resultado['gastos']}
+                for clave, resultado in reservadas.items() if resultado['estado'] != 'error'
+            })
+        finally:
+            # Lo que no se confirmo (error o excepcion) se puede reintentar
+            self.idempotencia.liberar(reservadas)
+        return resultados
+
+    def _agregar_lotes(self, lotes: List[List[Dict]]) -> bool:
+        """Los gastos de todos los mensajes en espera, en una sola descarga y subida del Excel."""
+        if len(lotes) > 1:
+            print(f'Agrupando {len(lotes)} mensajes en una sola escritura del Excel')
+        return self.gestor_excel.agregar_gastos([gasto for gastos in lotes for gasto in gastos])
+
     def _manejar_consulta(self, accion: str) -> str:
         if accion == 'saldo':
             resumen = self.gestor_excel.obtener_resumen()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import metricas
+except ModuleNotFoundError:
+    from src import metricas
+
+# Todas las escrituras de configuracion.json del proceso (web, bot, Drive) pasan por aca.
+# Reentrante: quien valida una version (If-Match) puede aplicar el parche sin soltarlo
+LOCK = threading.RLock()
+
+
+def fusionar_parche(destino, parche):
+    """
+    JSON Merge Patch (RFC 7396): los objetos se fusionan por clave, null borra
+    la clave y cualquier otro valor (listas incluidas) reemplaza al anterior.
+    """
+    if not isinstance(parche, dict):
+        return parche
+    resultado = dict(destino) if isinstance(destino, dict) else {}
+    for clave, valor in parche.items():
+        if valor is None:
+            resultado.pop(clave, None)
+        else:
+            resultado[clave] = fusionar_parche(resultado.get(clave), valor)
+    return resultado
+
+
+def leer_config(ruta):
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def escribir_config(ruta, config):
+    """
+    Escritura atomica: temporal en la misma carpeta + os.replace. Un lector (u otro
+    proceso) ve el archivo anterior o el nuevo completo, nunca uno a medias.
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(carpeta, exist_ok=True)
+    with LOCK:
+        descriptor, temporal = tempfile.mkstemp(prefix='.configuracion_', suffix='.tmp', dir=carpeta)
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp crea el archivo con 0600: se conservan los permisos del anterior
+            try:
+                os.chmod(temporal, os.stat(ruta).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(temporal, 0o644)
+            os.replace(temporal, ruta)
+        except BaseException:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+            raise
+
+
+def aplicar_parche(ruta, parche):
+    """
+    Aplica `parche` (merge patch) sobre la configuracion actual en disco y la
+    escribe de forma atomica: solo cambian las rutas del parche, lo que otro
+    escritor haya guardado en el resto se conserva. Devuelve la configuracion nueva.
+    """
+    with metricas.lock_medido(LOCK, 'config'):
+        try:
+            config = leer_config(ruta)
+        except FileNotFoundError:
+            config = {}
+        nueva = fusionar_parche(config, parche)
+        if nueva != config:
+            escribir_config(ruta, nueva)
+        return nueva
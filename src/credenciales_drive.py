@@ -0,0 +1,141 @@
+import os
+import pickle
+import threading
+from datetime import datetime, timezone
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google_auth_oauthlib.flow import InstalledAppFlow
+
+# Un gestor por archivo de token, compartido por todos los GoogleDriveManager del proceso
+_GESTORES = {}
+_LOCK_GESTORES = threading.Lock()
+
+
+class GestorCredenciales:
+    """
+    Credenciales OAuth de Drive en memoria:
+    - token.pickle se lee una sola vez por proceso
+    - un temporizador refresca el token `margen_s` segundos antes de que venza
+      y lo persiste de forma atomica (archivo temporal + os.replace)
+    - obtener() solo refresca en linea si el token ya llego vencido (p. ej. al arrancar)
+    """
+
+    MARGEN_S = 300
+    REINTENTO_S = 60
+
+    def __init__(self, token_path, credentials_path, scopes, margen_s=None):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self.margen_s = self.MARGEN_S if margen_s is None else margen_s
+        self.creds = None
+        self._cargado = False
+        self._lock = threading.RLock()
+        self._temporizador = None
+
+    def _cargar(self):
+        self._cargado = True
+        if os.path.exists(self.token_path):
+            with open(self.token_path, 'rb') as token:
+                self.creds = pickle.load(token)
+
+    def _persistir(self):
+        temporal = f'{self.token_path}.tmp'
+        with open(temporal, 'wb') as token:
+            pickle.dump(self.creds, token)
+        os.replace(temporal, self.token_path)
+
+    def _segundos_para_vencer(self):
+        expiry = getattr(self.creds, 'expiry', None)
+        if expiry is None:
+            return None
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        return (expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+    def _refrescar(self):
+        self.creds.refresh(Request())
+        self._persistir()
+
+    def _programar(self, espera=None):
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        if espera is None:
+            restante = self._segundos_para_vencer()
+            if restante is None or not getattr(self.creds, 'refresh_token', None):
+                return
+            espera = max(restante - self.margen_s, 0)
+        self._temporizador = threading.Timer(espera, self._refrescar_en_segundo_plano)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _refrescar_en_segundo_plano(self):
+        with self._lock:
+            try:
+                self._refrescar()
+            except RefreshError as e:
+                # Refresh token revocado: el proximo obtener() pedira iniciar sesion de nuevo
+                print(f'No se pudo refrescar el token de Drive ({e}); se requiere iniciar sesion')
+                self.creds = None
+                self._temporizador = None
+                return
+            except Exception as e:
+                print(f'Error refrescando el token de Drive ({e}); reintento en {self.REINTENTO_S}s')
+                self._programar(self.REINTENTO_S)
+                return
+            self._programar()
+
+    def obtener(self):
+        """Credenciales validas o None si no hay forma de obtenerlas."""
+        # Camino rapido sin lock: no espera a un refresco en curso (el token sigue vigente)
+        creds = self.creds
+        if creds is not None and creds.valid and self._temporizador is not None:
+            return creds
+
+        with self._lock:
+            if not self._cargado:
+                self._cargar()
+
+            if self.creds and self.creds.valid:
+                if self._temporizador is None:
+                    self._programar()
+                return self.creds
+
+            if self.creds and self.creds.expired and self.creds.refresh_token:
+                try:
+                    self._refrescar()
+                    self._programar()
+                    return self.creds
+                except RefreshError as e:
+                    print(f'El token de Drive ya no es valido ({e}); se pedira iniciar sesion')
+                    self.creds = None
+
+            if not os.path.exists(self.credentials_path):
+                print('ERROR: No se encontró el archivo credentials.json')
+                print('Por favor descarga tus credenciales de Google Cloud Console')
+                print(f'y guárdalas en {self.credentials_path}')
+                return None
+
+            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+            self.creds = flow.run_local_server(port=0)
+            self._persistir()
+            self._programar()
+            return self.creds
+
+    def detener(self):
+        with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+
+
+def gestor_credenciales(token_path='config/token.pickle', credentials_path='config/credentials.json', scopes=None):
+    """Gestor compartido para `token_path` (se crea la primera vez)."""
+    clave = os.path.abspath(token_path)
+    with _LOCK_GESTORES:
+        gestor = _GESTORES.get(clave)
+        if gestor is None:
+            gestor = GestorCredenciales(token_path, credentials_path, scopes)
+            _GESTORES[clave] = gestor
+        return gestor
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Protege el archivo de estado entre hilos del mismo proceso (servidor web + sondeo).
+_LOCK_ESTADO = threading.Lock()
+
+
+def _md5(ruta):
+    h = hashlib.md5()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class RastreadorCambiosDrive:
+    """
+    Cache local del Excel de Drive validada con la Changes API:
+    - guarda un startPageToken y consulta changes().list bajo demanda
+      (como maximo una vez cada `intervalo_s`) o desde un hilo de sondeo
+    - la copia en cache solo se invalida si cambio nuestro archivo
+      (otro md5, eliminado o en la papelera)
+    El estado vive junto a la copia en cache, no en configuracion.json.
+    Tambien guarda las ultimas revisiones por md5 (`bases/`): son la base de la
+    fusion a tres vias cuando otro cliente edito el Excel antes de subirlo.
+    """
+
+    BASES_GUARDADAS = 5
+
+    CAMPOS_CAMBIOS = 'nextPageToken,newStartPageToken,changes(fileId,removed,file(md5Checksum,trashed))'
+
+    def __init__(self, drive, cache_dir=None):
+        self.drive = drive
+        ajustes = drive.config.get('google_drive', {}).get('cambios') or {}
+        self.intervalo_s = float(ajustes.get('intervalo_s', 15))
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'control_gastos', 'cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.ruta_estado = os.path.join(self.cache_dir, 'estado_cambios.json')
+        self.ruta_cache = os.path.join(self.cache_dir, drive.nombre_archivo)
+        self.dir_bases = os.path.join(self.cache_dir, 'bases')
+
+    def _leer_estado(self):
+        try:
+            with open(self.ruta_estado, 'r', encoding='utf-8') as f:
+                estado = json.load(f)
+            return estado if isinstance(estado, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _escribir_estado(self, estado):
+        temporal = f'{self.ruta_estado}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, indent=2)
+        os.replace(temporal, self.ruta_estado)
+
+    def _cache_utilizable(self, estado):
+        return (
+            estado.get('vigente')
+            and estado.get('file_id')
+            and estado.get('file_id') == self.drive.archivo_excel_id
+            and os.path.exists(self.ruta_cache)
+            and os.path.getsize(self.ruta_cache) == estado.get('bytes')
+        )
+
+    def necesita_token(self):
+        return not self._leer_estado().get('page_token')
+
+    def inicializar(self, page_token=None):
+        """
+        Obtiene un startPageToken si no hay uno; se llama antes de descargar.
+        `page_token` es uno ya pedido (p. ej. en el batch de metadatos de la sincronizacion).
+        """
+        with _LOCK_ESTADO:
+            estado = self._leer_estado()
+            if estado.get('page_token') or not (page_token or self.drive.service):
+                return
+            if page_token is None:
+                page_token = self.drive.service.changes().getStartPageToken().execute()['startPageToken']
+            estado['page_token'] = page_token
+            estado['revisado_en'] = time.time()
+            self._escribir_estado(estado)
+
+    def revisar(self, forzar=False):
+        """
+        True si la copia en cache sigue siendo la version de Drive.
+        Solo consulta la Changes API si paso `intervalo_s` desde la ultima revision.
+        """
+        with _LOCK_ESTADO:
+            estado = self._leer_estado()
+            if not self._cache_utilizable(estado) or not estado.get('page_token'):
+                return False
+            if not forzar and time.time() - estado.get('revisado_en', 0) < self.intervalo_s:
+                return True
+            if not self.drive.service:
+                return False
+
+            try:
+                ultimo = self._consultar_cambios(estado)
+            except Exception as e:
+                print(f'No se pudo consultar cambios en Drive ({e}); se descartara la cache')
+                estado.pop('page_token', None)
+                estado['vigente'] = False
+                self._escribir_estado(estado)
+                return False
+
+            if ultimo is not None:
+                archivo = ultimo.get('file') or {}
+                if ultimo.get('removed') or archivo.get('trashed'):
+                    print('El Excel fue eliminado o enviado a la papelera en Drive')
+                    estado['vigente'] = False
+                elif archivo.get('md5Checksum') != estado.get('md5'):
+                    print('El Excel cambio en Drive desde la ultima descarga')
+                    estado['vigente'] = False
+
+            estado['revisado_en'] = time.time()
+            self._escribir_estado(estado)
+            return bool(estado['vigente'])
+
+    def confirmar(self, md5_remoto):
+        """
+        Valida la cache con un md5 que Drive acaba de devolver, sin recorrer la
+        Changes API. True si la copia en cache sigue siendo la version de Drive.
+        """
+        with _LOCK_ESTADO:
+            estado = self._leer_estado()
+            if not self._cache_utilizable(estado):
+                return False
+            if md5_remoto != estado.get('md5'):
+                print('El Excel cambio en Drive desde la ultima descarga')
+                estado['vigente'] = False
+            estado['revisado_en'] = time.time()
+            self._escribir_estado(estado)
+            return bool(estado['vigente'])
+
+    def copia_vigente(self):
+        """md5 de la copia en cache si sigue marcada como vigente (sin consultar Drive)."""
+        estado = self._leer_estado()
+        return estado.get('md5') if self._cache_utilizable(estado) else None
+
+    def _consultar_cambios(self, estado):
+        """Recorre las paginas de cambios; devuelve el ultimo cambio de nuestro archivo (o None)."""
+        ultimo = None
+        token = estado['page_token']
+        while token:
+            respuesta = self.drive.service.changes().list(
+                pageToken=token,
+                spaces='drive',
+                includeRemoved=True,
+                pageSize=1000,
+                fields=self.CAMPOS_CAMBIOS,
+            ).execute()
+            for cambio in respuesta.get('changes', []):
+                if cambio.get('fileId') == estado['file_id']:
+                    ultimo = cambio
+            if 'newStartPageToken' in respuesta:
+                estado['page_token'] = respuesta['newStartPageToken']
+            token = respuesta.get('nextPageToken')
+        return ultimo
+
+    def registrar(self, ruta_local, file_id, md5_remoto=None):
+        """Guarda en cache la version que acabamos de descargar o subir; devuelve su md5."""
+        md5 = _md5(ruta_local)
+        if md5_remoto and md5_remoto != md5:
+            print('Advertencia: el md5 de Drive no coincide con el archivo local; no se usa la cache')
+            self.invalidar()
+            return None
+
+        with _LOCK_ESTADO:
+            if os.path.abspath(ruta_local) != os.path.abspath(self.ruta_cache):
+                temporal = f'{self.ruta_cache}.tmp'
+                shutil.copyfile(ruta_local, temporal)
+                os.replace(temporal, self.ruta_cache)
+            self._guardar_base(md5)
+            estado = self._leer_estado()
+            estado.update({
+                'file_id': file_id,
+                'md5': md5,
+                'bytes': os.path.getsize(self.ruta_cache),
+                'vigente': True,
+            })
+            self._escribir_estado(estado)
+        return md5
+
+    def _guardar_base(self, md5):
+        os.makedirs(self.dir_bases, exist_ok=True)
+        destino = os.path.join(self.dir_bases, f'{md5}.xlsx')
+        if not os.path.exists(destino):
+            temporal = f'{destino}.tmp'
+            shutil.copyfile(self.ruta_cache, temporal)
+            os.replace(temporal, destino)
+        else:
+            os.utime(destino)
+        bases = sorted(
+            (os.path.join(self.dir_bases, nombre) for nombre in os.listdir(self.dir_bases) if nombre.endswith('.xlsx')),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for vieja in bases[self.BASES_GUARDADAS:]:
+            os.remove(vieja)
+
+    def ruta_base(self, md5):
+        """Copia local de la revision con ese md5, si todavia se conserva."""
+        ruta = os.path.join(self.dir_bases, f'{md5}.xlsx') if md5 else None
+        return ruta if ruta and os.path.exists(ruta) else None
+
+    def revision(self):
+        """md5 de la version en cache (la ultima descargada o subida)."""
+        return self._leer_estado().get('md5')
+
+    def invalidar(self):
+        with _LOCK_ESTADO:
+            estado = self._leer_estado()
+            estado['vigente'] = False
+            self._escribir_estado(estado)
+
+    def copiar_cache(self, ruta_destino):
+        """
+        Copia la cache a `ruta_destino` y devuelve (ruta, md5). Copia y md5 se leen
+        juntos bajo el lock: otro hilo puede estar registrando una revision nueva.
+        """
+        with _LOCK_ESTADO:
+            if os.path.abspath(ruta_destino) != os.path.abspath(self.ruta_cache):
+                shutil.copyfile(self.ruta_cache, ruta_destino)
+            return ruta_destino, self._leer_estado().get('md5')
+
+
+def iniciar_sondeo(config_path='config/configuracion.json', intervalo_s=60):
+    """Hilo daemon que revisa cambios en Drive cada `intervalo_s` segundos."""
+    try:
+        from google_drive_v2 import GoogleDriveManager
+    except ModuleNotFoundError:
+        from src.google_drive_v2 import GoogleDriveManager
+
+    def _bucle():
+        drive = GoogleDriveManager(config_path)
+        if not drive.autenticar():
+            print('Sondeo de cambios en Drive desactivado: no se pudo autenticar')
+            return
+        while True:
+            try:
+                drive._cargar_configuracion()
+                RastreadorCambiosDrive(drive).revisar(forzar=True)
+            except Exception as e:
+                print(f'Error en sondeo de cambios de Drive: {e}')
+            time.sleep(intervalo_s)
+
+    hilo = threading.Thread(target=_bucle, name='sondeo-drive', daemon=True)
+    hilo.start()
+    return hilo
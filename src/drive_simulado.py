@@ -0,0 +1,540 @@
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httplib2
+
+VARIABLE_ENTORNO = 'CONTROL_GASTOS_DRIVE_SIMULADO'
+MIME_CARPETA = 'application/vnd.google-apps.folder'
+
+# Un lock por directorio: varias instancias (una por GoogleDriveManager) comparten el estado en disco
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+# Totales de todas las instancias del proceso (para benchmarks)
+ESTADISTICAS = {'peticiones': 0, 'fallas': 0, 'bytes_subidos': 0, 'bytes_descargados': 0}
+
+
+def reiniciar_estadisticas():
+    for clave in ESTADISTICAS:
+        ESTADISTICAS[clave] = 0
+
+
+def _contar(estadisticas, clave, valor=1):
+    estadisticas[clave] += valor
+    ESTADISTICAS[clave] += valor
+
+
+def _lock_directorio(directorio):
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(os.path.abspath(directorio), threading.RLock())
+
+
+def _ahora_iso():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class _Falla(Exception):
+    def __init__(self, estado, razon, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.razon = razon
+        self.mensaje = mensaje
+
+
+class HttpDriveSimulado:
+    """
+    Sustituto de httplib2.Http que atiende la API REST de Drive v3 desde un directorio.
+    Se usa con build('drive', 'v3', http=HttpDriveSimulado(...)), asi googleapiclient
+    (subidas reanudables, descargas por rangos, HttpError) se ejercita tal cual.
+
+    Cubre lo que usa el proyecto: files (list/get/create/update/delete, media,
+    subidas multipart y reanudables), permissions, revisions, changes y batch.
+
+    Parametros de simulacion:
+    - latencia_ms: espera fija por peticion (mas `jitter_ms` aleatorio)
+    - ancho_banda_kbps: limita la velocidad de subida y descarga de contenido
+    - errores: probabilidad por peticion de {"429", "500", "503", "timeout"}
+    """
+
+    def __init__(self, directorio, latencia_ms=0, jitter_ms=0, ancho_banda_kbps=0, errores=None, semilla=None):
+        self.directorio = directorio
+        self.latencia_ms = float(latencia_ms or 0)
+        self.jitter_ms = float(jitter_ms or 0)
+        self.ancho_banda_kbps = float(ancho_banda_kbps or 0)
+        self.errores = {str(k): float(v) for k, v in (errores or {}).items()}
+        self._rng = random.Random(semilla)
+        self._lock = _lock_directorio(directorio)
+        self._sesiones = {}
+        self.estadisticas = {'peticiones': 0, 'fallas': 0, 'bytes_subidos': 0, 'bytes_descargados': 0}
+
+        self.dir_contenido = os.path.join(directorio, 'contenido')
+        self.ruta_estado = os.path.join(directorio, 'drive.json')
+        os.makedirs(self.dir_contenido, exist_ok=True)
+        self._estado = self._cargar_estado()
+
+    @classmethod
+    def desde_config(cls, config):
+        """Instancia segun google_drive.simulado o la variable de entorno; None si no aplica."""
+        ajustes = dict((config.get('google_drive') or {}).get('simulado') or {})
+        directorio = os.environ.get(VARIABLE_ENTORNO) or ajustes.get('directorio')
+        if not directorio:
+            return None
+        return cls(
+            directorio,
+            latencia_ms=ajustes.get('latencia_ms', 0),
+            jitter_ms=ajustes.get('jitter_ms', 0),
+            ancho_banda_kbps=ajustes.get('ancho_banda_kbps', 0),
+            errores=ajustes.get('errores'),
+            semilla=ajustes.get('semilla'),
+        )
+
+    # Estado persistente
+
+    def _cargar_estado(self):
+        try:
+            with open(self.ruta_estado, 'r', encoding='utf-8') as f:
+                estado = json.load(f)
+        except (OSError, ValueError):
+            estado = {}
+        estado.setdefault('archivos', {})
+        estado.setdefault('permisos', {})
+        estado.setdefault('cambios', [])
+        estado.setdefault('revisiones', {})
+        return estado
+
+    def _guardar_estado(self):
+        temporal = f'{self.ruta_estado}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self._estado, f, indent=2)
+        os.replace(temporal, self.ruta_estado)
+
+    def _registrar_cambio(self, file_id, eliminado=False):
+        self._estado['cambios'].append({'fileId': file_id, 'removed': eliminado, 'time': _ahora_iso()})
+
+    def _archivo(self, file_id):
+        archivo = self._estado['archivos'].get(file_id)
+        if archivo is None:
+            raise _Falla(404, 'notFound', f'File not found: {file_id}.')
+        return archivo
+
+    def _ruta_contenido(self, file_id):
+        return os.path.join(self.dir_contenido, file_id)
+
+    def _escribir_contenido(self, archivo, datos):
+        with open(self._ruta_contenido(archivo['id']), 'wb') as f:
+            f.write(datos)
+        archivo['size'] = str(len(datos))
+        archivo['md5Checksum'] = hashlib.md5(datos).hexdigest()
+
+        # Cada contenido nuevo es una revision (como los archivos binarios en Drive)
+        revisiones = self._estado['revisiones'].setdefault(archivo['id'], [])
+        revision = {
+            'kind': 'drive#revision',
+            'id': uuid.uuid4().hex[:20],
+            'md5Checksum': archivo['md5Checksum'],
+            'size': archivo['size'],
+            'modifiedTime': _ahora_iso(),
+        }
+        with open(f"{self._ruta_contenido(archivo['id'])}.{revision['id']}", 'wb') as f:
+            f.write(datos)
+        revisiones.append(revision)
+        archivo['headRevisionId'] = revision['id']
+
+    # Simulacion de red
+
+    def _simular_red(self, bytes_transferidos=0):
+        espera = self.latencia_ms / 1000
+        if self.jitter_ms:
+            espera += self._rng.uniform(0, self.jitter_ms / 1000)
+        if self.ancho_banda_kbps and bytes_transferidos:
+            espera += bytes_transferidos / (self.ancho_banda_kbps * 1024)
+        if espera:
+            time.sleep(espera)
+
+    def _sortear_falla(self):
+        for tipo, probabilidad in self.errores.items():
+            if probabilidad and self._rng.random() < probabilidad:
+                _contar(self.estadisticas, 'fallas')
+                if tipo == 'timeout':
+                    raise socket.timeout('timed out (simulado)')
+                razon = 'rateLimitExceeded' if tipo == '429' else 'backendError'
+                raise _Falla(int(tipo), razon, f'Error simulado {tipo}')
+
+    # Interfaz httplib2.Http
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if hasattr(body, 'read'):
+            # googleapiclient envia los trozos de subida como streams
+            body = body.read()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        body = body or b''
+
+        with self._lock:
+            _contar(self.estadisticas, 'peticiones')
+            _contar(self.estadisticas, 'bytes_subidos', len(body))
+        self._simular_red(len(body))
+
+        try:
+            with self._lock:
+                self._sortear_falla()
+                self._estado = self._cargar_estado()
+                estado, cabeceras, contenido = self._despachar(uri, method.upper(), body, headers)
+        except _Falla as falla:
+            estado, cabeceras = falla.estado, {'content-type': 'application/json; charset=UTF-8'}
+            contenido = json.dumps({'error': {
+                'code': falla.estado,
+                'message': falla.mensaje,
+                'errors': [{'reason': falla.razon, 'message': falla.mensaje}],
+            }}).encode('utf-8')
+
+        if estado in (200, 206) and cabeceras.get('content-type') == 'application/octet-stream':
+            with self._lock:
+                _contar(self.estadisticas, 'bytes_descargados', len(contenido))
+            self._simular_red(len(contenido))
+
+        respuesta = httplib2.Response(dict(cabeceras, status=str(estado)))
+        respuesta.status = estado
+        return respuesta, contenido
+
+    def close(self):
+        pass
+
+    # Enrutado
+
+    def _json(self, datos, estado=200):
+        return estado, {'content-type': 'application/json; charset=UTF-8'}, json.dumps(datos).encode('utf-8')
+
+    def _despachar(self, uri, method, body, headers):
+        partes = urlsplit(uri)
+        ruta = unquote(partes.path)
+        params = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+
+        if ruta == '/batch/drive/v3' and method == 'POST':
+            return self._lote(body, headers)
+
+        if ruta.startswith('/sesion/'):
+            return self._subida_reanudable(ruta.rsplit('/', 1)[1], body, headers)
+
+        match = re.match(r'^/upload/drive/v3/files(?:/(?P<id>[^/]+))?$', ruta)
+        if match:
+            return self._iniciar_subida(match.group('id'), method, params, body, headers)
+
+        if ruta == '/drive/v3/changes/startPageToken':
+            return self._json({'kind': 'drive#startPageToken', 'startPageToken': str(len(self._estado['cambios']))})
+        if ruta == '/drive/v3/changes':
+            return self._listar_cambios(params)
+
+        match = re.match(r'^/drive/v3/files/(?P<id>[^/]+)/revisions(?:/(?P<rid>[^/]+))?$', ruta)
+        if match:
+            return self._revisiones(match.group('id'), match.group('rid'), params, headers)
+
+        match = re.match(r'^/drive/v3/files/(?P<id>[^/]+)/permissions(?:/(?P<pid>[^/]+))?$', ruta)
+        if match:
+            return self._permisos(match.group('id'), match.group('pid'), method, body)
+
+        match = re.match(r'^/drive/v3/files(?:/(?P<id>[^/]+))?$', ruta)
+        if match:
+            file_id = match.group('id')
+            if not file_id:
+                if method == 'GET':
+                    return self._listar_archivos(params)
+                if method == 'POST':
+                    return self._json(self._crear_archivo(json.loads(body or b'{}')))
+            elif method == 'GET':
+                archivo = self._archivo(file_id)
+                if params.get('alt') == 'media':
+                    return self._descargar(self._ruta_contenido(file_id), headers)
+                return self._json(archivo)
+            elif method == 'PATCH':
+                return self._json(self._actualizar_metadatos(file_id, json.loads(body or b'{}')))
+            elif method == 'DELETE':
+                self._archivo(file_id)
+                del self._estado['archivos'][file_id]
+                self._estado['permisos'].pop(file_id, None)
+                self._registrar_cambio(file_id, eliminado=True)
+                self._guardar_estado()
+                return 204, {}, b''
+
+        raise _Falla(404, 'notFound', f'Ruta no soportada por el simulador: {method} {ruta}')
+
+    # batch
+
+    def _lote(self, body, headers):
+        """Peticion batch multipart/mixed: cada parte se atiende (y puede fallar) por separado."""
+        mensaje = BytesParser().parsebytes(
+            b'Content-Type: ' + headers.get('content-type', '').encode('ascii') + b'\r\n\r\n' + body
+        )
+        if not mensaje.is_multipart():
+            raise _Falla(400, 'badRequest', 'El batch debe ser multipart/mixed')
+
+        frontera = uuid.uuid4().hex
+        salida = []
+        for parte in mensaje.get_payload():
+            linea, resto = parte.get_payload().split('\n', 1)
+            metodo, destino, _protocolo = linea.strip().split(' ', 2)
+            interna = BytesParser().parsebytes(resto.encode('utf-8'))
+            cuerpo = interna.get_payload(decode=True) or b''
+            cabeceras_internas = {k.lower(): v for k, v in interna.items()}
+            try:
+                if 'alt=media' in destino:
+                    raise _Falla(400, 'badRequest', 'Las descargas de contenido no se admiten en batch')
+                self._sortear_falla()
+                estado, cabeceras, contenido = self._despachar(
+                    f"https://{interna.get('host', 'www.googleapis.com')}{destino}", metodo, cuerpo, cabeceras_internas
+                )
+            except _Falla as falla:
+                estado, cabeceras = falla.estado, {'content-type': 'application/json; charset=UTF-8'}
+                contenido = json.dumps({'error': {
+                    'code': falla.estado,
+                    'message': falla.mensaje,
+                    'errors': [{'reason': falla.razon, 'message': falla.mensaje}],
+                }}).encode('utf-8')
+
+            id_parte = parte['Content-ID'].strip()[1:-1]
+            lineas_cabecera = ''.join(f'{k}: {v}\r\n' for k, v in cabeceras.items())
+            salida.append(
+                f'--{frontera}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{id_parte}>\r\n\r\n'
+                f'HTTP/1.1 {estado} {"OK" if estado < 300 else "Error"}\r\n'
+                f'{lineas_cabecera}\r\n'
+                f'{contenido.decode("utf-8")}\r\n'
+            )
+        salida.append(f'--{frontera}--\r\n')
+        return 200, {'content-type': f'multipart/mixed; boundary={frontera}'}, ''.join(salida).encode('utf-8')
+
+    # files
+
+    def _crear_archivo(self, metadatos, contenido=None):
+        file_id = uuid.uuid4().hex[:28]
+        archivo = {
+            'kind': 'drive#file',
+            'id': file_id,
+            'name': metadatos.get('name', 'Sin titulo'),
+            'mimeType': metadatos.get('mimeType', 'application/octet-stream'),
+            'parents': metadatos.get('parents') or [],
+            'trashed': False,
+            'version': '1',
+            'createdTime': _ahora_iso(),
+            'modifiedTime': _ahora_iso(),
+        }
+        if archivo['parents'] and not all(p in self._estado['archivos'] for p in archivo['parents']):
+            raise _Falla(404, 'notFound', f'File not found: {archivo["parents"][0]}.')
+        if contenido is not None:
+            self._escribir_contenido(archivo, contenido)
+        self._estado['archivos'][file_id] = archivo
+        self._registrar_cambio(file_id)
+        self._guardar_estado()
+        return archivo
+
+    def _actualizar_metadatos(self, file_id, metadatos, contenido=None):
+        archivo = self._archivo(file_id)
+        for clave in ('name', 'mimeType', 'trashed'):
+            if clave in metadatos:
+                archivo[clave] = metadatos[clave]
+        if contenido is not None:
+            self._escribir_contenido(archivo, contenido)
+        archivo['version'] = str(int(archivo.get('version', '1')) + 1)
+        archivo['modifiedTime'] = _ahora_iso()
+        self._registrar_cambio(file_id)
+        self._guardar_estado()
+        return archivo
+
+    def _coincide(self, archivo, condicion):
+        condicion = condicion.strip()
+        match = re.match(r"^'([^']*)' in parents$", condicion)
+        if match:
+            return match.group(1) in archivo.get('parents', [])
+        match = re.match(r"^(\w+)\s*=\s*'((?:[^'\\]|\\.)*)'$", condicion)
+        if match:
+            return str(archivo.get(match.group(1), '')) == match.group(2).replace("\\'", "'")
+        match = re.match(r'^trashed\s*=\s*(true|false)$', condicion)
+        if match:
+            return bool(archivo.get('trashed')) == (match.group(1) == 'true')
+        raise _Falla(400, 'invalidQuery', f'Consulta no soportada por el simulador: {condicion}')
+
+    def _listar_archivos(self, params):
+        condiciones = [c for c in re.split(r'\s+and\s+', params.get('q', '')) if c.strip()]
+        archivos = [
+            a for a in self._estado['archivos'].values()
+            if all(self._coincide(a, c) for c in condiciones)
+        ]
+        if params.get('orderBy', '').startswith('modifiedTime'):
+            archivos.sort(key=lambda a: a['modifiedTime'], reverse=params['orderBy'].endswith('desc'))
+
+        inicio = int(params.get('pageToken') or 0)
+        tamanio = int(params.get('pageSize') or 100)
+        respuesta = {'kind': 'drive#fileList', 'files': archivos[inicio:inicio + tamanio]}
+        if inicio + tamanio < len(archivos):
+            respuesta['nextPageToken'] = str(inicio + tamanio)
+        return self._json(respuesta)
+
+    def _descargar(self, ruta, headers):
+        with open(ruta, 'rb') as f:
+            datos = f.read()
+        total = len(datos)
+        rango = re.match(r'bytes=(\d+)-(\d*)', headers.get('range', ''))
+        if not rango:
+            return 200, {'content-type': 'application/octet-stream', 'content-length': str(total)}, datos
+        inicio = int(rango.group(1))
+        fin = min(int(rango.group(2)) if rango.group(2) else total - 1, total - 1)
+        if inicio >= total:
+            return 416, {'content-range': f'bytes */{total}'}, b''
+        return 206, {
+            'content-type': 'application/octet-stream',
+            'content-range': f'bytes {inicio}-{fin}/{total}',
+        }, datos[inicio:fin + 1]
+
+    # Subidas
+
+    def _iniciar_subida(self, file_id, method, params, body, headers):
+        tipo = params.get('uploadType')
+        if file_id:
+            self._archivo(file_id)
+        if tipo == 'resumable':
+            sesion = uuid.uuid4().hex
+            self._sesiones[sesion] = {
+                'file_id': file_id,
+                'metadatos': json.loads(body or b'{}'),
+                'datos': bytearray(),
+            }
+            return 200, {'location': f'https://simulado.local/sesion/{sesion}'}, b''
+        if tipo == 'multipart':
+            metadatos, contenido = self._partes_multipart(body, headers)
+        elif tipo == 'media':
+            metadatos, contenido = {}, body
+        else:
+            raise _Falla(400, 'badRequest', f'uploadType no soportado: {tipo}')
+        if file_id:
+            return self._json(self._actualizar_metadatos(file_id, metadatos, contenido))
+        return self._json(self._crear_archivo(metadatos, contenido))
+
+    def _partes_multipart(self, body, headers):
+        mensaje = BytesParser().parsebytes(
+            b'Content-Type: ' + headers.get('content-type', '').encode('ascii') + b'\r\n\r\n' + body
+        )
+        partes = [p.get_payload(decode=True) for p in mensaje.get_payload()]
+        return json.loads(partes[0] or b'{}'), partes[1]
+
+    def _subida_reanudable(self, sesion_id, body, headers):
+        sesion = self._sesiones.get(sesion_id)
+        if sesion is None:
+            raise _Falla(404, 'notFound', 'Sesion de subida inexistente o expirada')
+
+        rango = headers.get('content-range', '')
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', rango)
+        consulta = re.match(r'bytes \*/(\d+|\*)', rango)
+        total = None
+        if match:
+            inicio, total = int(match.group(1)), match.group(3)
+            if inicio != len(sesion['datos']):
+                # Reenvio de un trozo ya recibido (o con hueco): se responde el progreso real
+                return self._progreso(sesion)
+            sesion['datos'].extend(body)
+        elif consulta:
+            total = consulta.group(1)
+        elif body:
+            sesion['datos'].extend(body)
+            total = str(len(sesion['datos']))
+
+        if total not in (None, '*') and len(sesion['datos']) == int(total):
+            del self._sesiones[sesion_id]
+            datos = bytes(sesion['datos'])
+            if sesion['file_id']:
+                archivo = self._actualizar_metadatos(sesion['file_id'], sesion['metadatos'], datos)
+            else:
+                archivo = self._crear_archivo(sesion['metadatos'], datos)
+            return self._json(archivo)
+        return self._progreso(sesion)
+
+    def _progreso(self, sesion):
+        cabeceras = {}
+        if sesion['datos']:
+            cabeceras['range'] = f'bytes=0-{len(sesion["datos"]) - 1}'
+        return 308, cabeceras, b''
+
+    # permissions
+
+    def _permisos(self, file_id, permiso_id, method, body):
+        self._archivo(file_id)
+        permisos = self._estado['permisos'].setdefault(file_id, [])
+        if method == 'GET' and not permiso_id:
+            return self._json({'kind': 'drive#permissionList', 'permissions': permisos})
+        if method == 'POST':
+            permiso = dict(json.loads(body or b'{}'), id=uuid.uuid4().hex[:20], kind='drive#permission')
+            if permiso.get('type') == 'anyone':
+                permiso['id'] = 'anyoneWithLink'
+            permisos[:] = [p for p in permisos if p['id'] != permiso['id']]
+            permisos.append(permiso)
+            self._guardar_estado()
+            return self._json(permiso)
+
+        for permiso in permisos:
+            if permiso['id'] == permiso_id:
+                if method == 'DELETE':
+                    permisos.remove(permiso)
+                    self._guardar_estado()
+                    return 204, {}, b''
+                return self._json(permiso)
+        raise _Falla(404, 'notFound', f'Permission not found: {permiso_id}.')
+
+    # revisions
+
+    def _revisiones(self, file_id, revision_id, params, headers):
+        self._archivo(file_id)
+        revisiones = self._estado['revisiones'].get(file_id, [])
+        if not revision_id:
+            return self._json({'kind': 'drive#revisionList', 'revisions': revisiones})
+        for revision in revisiones:
+            if revision['id'] == revision_id:
+                if params.get('alt') == 'media':
+                    return self._descargar(f'{self._ruta_contenido(file_id)}.{revision_id}', headers)
+                return self._json(revision)
+        raise _Falla(404, 'notFound', f'Revision not found: {revision_id}.')
+
+    # changes
+
+    def _listar_cambios(self, params):
+        inicio = int(params.get('pageToken') or 0)
+        tamanio = int(params.get('pageSize') or 100)
+        cambios = self._estado['cambios']
+        pagina = []
+        for indice in range(inicio, min(inicio + tamanio, len(cambios))):
+            cambio = dict(cambios[indice], kind='drive#change')
+            archivo = self._estado['archivos'].get(cambio['fileId'])
+            if archivo is not None and not cambio['removed']:
+                cambio['file'] = archivo
+            pagina.append(cambio)
+        respuesta = {'kind': 'drive#changeList', 'changes': pagina}
+        if inicio + tamanio < len(cambios):
+            respuesta['nextPageToken'] = str(inicio + tamanio)
+        else:
+            respuesta['newStartPageToken'] = str(len(cambios))
+        return self._json(respuesta)
+
+    # Utilidades para pruebas de carga
+
+    def simular_edicion_remota(self, file_id, datos):
+        """Reemplaza el contenido como si otro cliente (celular) hubiera editado el archivo."""
+        with self._lock:
+            self._estado = self._cargar_estado()
+            self._actualizar_metadatos(file_id, {}, datos)
+
+
+def construir_servicio_simulado(http):
+    from googleapiclient.discovery import build
+
+    return build('drive', 'v3', http=http, static_discovery=True, cache_discovery=False)
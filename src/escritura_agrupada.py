@@ -0,0 +1,59 @@
+import threading
+
+try:
+    import metricas
+except ModuleNotFoundError:
+    from src import metricas
+
+
+class EscrituraAgrupada:
+    """
+    Escrituras sobre un mismo recurso (el Excel de Drive) agrupadas:
+    - un solo escritor a la vez, pero quien toma el turno aplica tambien todo lo
+      que llego mientras esperaba: un descarga/parche/subida para varios pedidos
+    - los pedidos se aplican en orden de llegada (el de un remitente nunca se
+      adelanta a uno anterior suyo)
+    - todos los pedidos de un lote reciben el mismo resultado o excepcion
+    `aplicar(lotes)` recibe la lista de pedidos en orden y devuelve el resultado.
+    """
+
+    def __init__(self, aplicar, nombre):
+        self.aplicar = aplicar
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._turno = threading.Lock()
+        self._pendientes = []
+
+    def escribir(self, pedido):
+        entrada = {'pedido': pedido, 'listo': False, 'resultado': None, 'error': None}
+        with self._lock:
+            self._pendientes.append(entrada)
+
+        with metricas.lock_medido(self._turno, self.nombre):
+            if not entrada['listo']:
+                with self._lock:
+                    lote, self._pendientes = self._pendientes, []
+                metricas.LOTE_ESCRITURA.observar(len(lote), self.nombre)
+                try:
+                    resultado, error = self.aplicar([e['pedido'] for e in lote]), None
+                except Exception as e:
+                    resultado, error = None, e
+                for otra in lote:
+                    otra.update(listo=True, resultado=resultado, error=error)
+
+        if entrada['error'] is not None:
+            raise entrada['error']
+        return entrada['resultado']
+
+
+_LOCKS_LIBRO = {}
+_LOCKS_LIBRO_GUARDA = threading.Lock()
+
+
+def lock_libro(nombre):
+    """
+    Lock (reentrante) de un libro: todo el que lo descarga, modifica y sube (bot,
+    sincronizacion, regeneracion) lo toma, asi ninguno sube encima del de otro.
+    """
+    with _LOCKS_LIBRO_GUARDA:
+        return _LOCKS_LIBRO.setdefault(nombre, threading.RLock())
@@ -0,0 +1,134 @@
+import collections
+import contextlib
+import contextvars
+import itertools
+import json
+import threading
+import time
+import uuid
+
+# Operacion en curso (sync, bot...): viaja con el contexto, tambien a los hilos del grafo de tareas
+_OPERACION = contextvars.ContextVar('operacion', default=None)
+
+
+class BusEventos:
+    """
+    Eventos de progreso (etapas, bytes transferidos, fin de operacion) para
+    quien quiera escucharlos, p. ej. el canal SSE `/api/events`:
+    - publicar() nunca bloquea: los suscriptores son funciones rapidas
+      (encolar) y un suscriptor que falla no afecta a los demas
+    - los ultimos `historial` eventos se guardan para que un cliente que se
+      conecta tarde (o reconecta con Last-Event-ID) no pierda los anteriores
+    """
+
+    HISTORIAL = 500
+
+    def __init__(self, historial=None):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._historial = collections.deque(maxlen=historial or self.HISTORIAL)
+        self._suscriptores = {}
+
+    def publicar(self, tipo, **datos):
+        evento = {'tipo': tipo, 'ts': round(time.time(), 3), 'operacion': _OPERACION.get()}
+        evento.update(datos)
+        with self._lock:
+            evento['id'] = next(self._ids)
+            self._historial.append(evento)
+            suscriptores = list(self._suscriptores.items())
+        for funcion, operacion in suscriptores:
+            if operacion is not None and evento['operacion'] != operacion:
+                continue
+            try:
+                funcion(evento)
+            except Exception:
+                pass
+        return evento
+
+    def suscribir(self, funcion, desde_id=None, operacion=None):
+        """
+        Llama a funcion(evento) por cada evento nuevo (solo los de `operacion`
+        si se indica). Antes reenvia los del historial posteriores a `desde_id`,
+        o todos los de `operacion`. Devuelve la funcion para desuscribirse.
+        """
+        with self._lock:
+            for evento in self._historial:
+                if operacion is not None and evento['operacion'] != operacion:
+                    continue
+                if desde_id is not None and evento['id'] <= desde_id:
+                    continue
+                if desde_id is None and operacion is None:
+                    continue
+                funcion(evento)
+            self._suscriptores[funcion] = operacion
+
+        def _desuscribir():
+            with self._lock:
+                self._suscriptores.pop(funcion, None)
+
+        return _desuscribir
+
+    def suscriptores(self):
+        with self._lock:
+            return len(self._suscriptores)
+
+
+BUS = BusEventos()
+
+
+def operacion_actual():
+    return _OPERACION.get()
+
+
+def publicar(tipo, **datos):
+    return BUS.publicar(tipo, **datos)
+
+
+def suscribir(funcion, desde_id=None, operacion=None):
+    return BUS.suscribir(funcion, desde_id=desde_id, operacion=operacion)
+
+
+@contextlib.contextmanager
+def operacion(nombre, id_operacion=None, **datos):
+    """
+    Agrupa los eventos publicados dentro del bloque bajo un id de operacion
+    y publica `inicio` y `fin` (con ms). El dict que se entrega se agrega al
+    evento `fin` (p. ej. ok=False, mensaje=...).
+    """
+    id_operacion = id_operacion or f'{nombre}-{uuid.uuid4().hex[:8]}'
+    token = _OPERACION.set(id_operacion)
+    fin = {'ok': True}
+    inicio = time.perf_counter()
+    publicar('inicio', nombre=nombre, **datos)
+    try:
+        yield fin
+    except BaseException as e:
+        fin.update(ok=False, mensaje=str(e))
+        raise
+    finally:
+        publicar('fin', nombre=nombre, ms=round((time.perf_counter() - inicio) * 1000, 1), **fin)
+        _OPERACION.reset(token)
+
+
+@contextlib.contextmanager
+def etapa(nombre, **datos):
+    """Publica el inicio y el fin (o error) de una etapa con su duracion en ms."""
+    publicar('etapa', nombre=nombre, estado='inicio', **datos)
+    inicio = time.perf_counter()
+    estado = 'error'
+    try:
+        yield
+        estado = 'fin'
+    finally:
+        publicar('etapa', nombre=nombre, estado=estado, ms=round((time.perf_counter() - inicio) * 1000, 1), **datos)
+
+
+def bytes_transferidos(direccion, archivo, transferidos, total):
+    """Progreso de una descarga/subida (`direccion`: 'descarga' o 'subida')."""
+    publicar('bytes', direccion=direccion, archivo=archivo, bytes=transferidos, total=total)
+
+
+def formato_sse(evento):
+    """Evento como bloque text/event-stream (el id permite reconectar con Last-Event-ID)."""
+    datos = json.dumps(evento, ensure_ascii=False, default=str)
+    return f"id: {evento['id']}\ndata: {datos}\n\n".encode('utf-8')
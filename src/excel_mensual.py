@@ -1,12 +1,16 @@
 import json
 import os
 import tempfile
-import time
 from datetime import datetime
 
 import openpyxl
 from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 
+try:
+    import metricas
+except ModuleNotFoundError:
+    from src import metricas
+
 
 class GeneradorExcelMensual:
     """
@@ -589,17 +593,15 @@ class GeneradorExcelMensual:
         return wb
 
     def guardar_excel_temporal(self, wb, nombre="ControlDeGastos.xlsx"):
+        """Guarda en un temporal propio (mkstemp): dos operaciones a la vez no comparten archivo."""
         temp_dir = os.path.join(tempfile.gettempdir(), "control_gastos")
         os.makedirs(temp_dir, exist_ok=True)
-        ruta = os.path.join(temp_dir, nombre)
+        base, extension = os.path.splitext(nombre)
+        fd, ruta = tempfile.mkstemp(prefix=f"{base}_", suffix=extension, dir=temp_dir)
+        os.close(fd)
 
-        try:
+        with metricas.DURACION_LIBRO.medir('guardar'):
             wb.save(ruta)
-        except PermissionError:
-            ruta_alt = os.path.join(temp_dir, f"ControlDeGastos_{int(time.time())}.xlsx")
-            wb.save(ruta_alt)
-            return ruta_alt
-
         return ruta
 
 
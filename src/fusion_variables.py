@@ -0,0 +1,225 @@
+import re
+import zipfile
+from collections import Counter
+
+import openpyxl
+
+try:
+    from variables_xml import ParcheVariablesXml
+    from xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
+except ModuleNotFoundError:
+    from src.variables_xml import ParcheVariablesXml
+    from src.xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso
+
+
+class ConflictoNoResoluble(Exception):
+    """La fusion perderia filas (tabla de variables llena); no se sube nada."""
+
+
+class FusionVariables:
+    """
+    Fusion a tres vias de las hojas de meses:
+    - base: la revision descargada; mio: el libro local editado; remoto: la revision actual en Drive
+    - las filas H:K se comparan como tuplas (monto, concepto, categoria, fecha), no celda a celda
+    - el resultado parte del remoto y aplica solo lo que cambio localmente:
+      filas agregadas (mio - base) y filas eliminadas (base - mio)
+    - si la hoja es nueva en local o cambio fuera de H:K (fijos y resumen reconstruidos
+      por la sincronizacion o la regeneracion), se reconstruye con crear_o_actualizar_hoja_mes;
+      las hojas que local retiro (anios archivados) se retiran si el remoto no las toco
+    Solo se revisan las hojas cuyo XML difiere entre base y mio (CRC del zip).
+    """
+
+    PATRON_HOJA = re.compile(r'^(?P<mes>[A-Za-z]+) (?P<anio>\d{4})$')
+
+    def __init__(self, generador):
+        self.generador = generador
+        self.capacidad = generador.FILA_VARIABLES_DATA_FIN - generador.FILA_VARIABLES_DATA_INICIO + 1
+
+    def _es_hoja_mes(self, hoja):
+        match = self.PATRON_HOJA.match(hoja)
+        return bool(match) and match.group('mes') in self.generador.MESES
+
+    def _leer(self, libro, hoja):
+        """(filas H:K, {celda: valor} del resto de la hoja); ([], None) si la hoja no esta."""
+        if libro is None or hoja not in libro.nombres_hojas:
+            return [], None
+        ws = libro.cargar_hoja(hoja)
+        g = self.generador
+        resto = {}
+        for fila in ws.iter_rows():
+            for celda in fila:
+                if celda.value is None:
+                    continue
+                if 8 <= celda.column <= 11 and g.FILA_VARIABLES_DATA_INICIO <= celda.row <= g.FILA_VARIABLES_DATA_FIN:
+                    continue
+                resto[celda.coordinate] = celda.value
+        return g._extraer_registros_existentes(ws), resto
+
+    def hojas_modificadas(self, base, mio):
+        """Hojas de meses de `mio` que no existen en `base` o cuyo XML cambio."""
+        hojas = []
+        for hoja in mio.nombres_hojas:
+            if not self._es_hoja_mes(hoja):
+                continue
+            if base is None or hoja not in base.nombres_hojas:
+                hojas.append(hoja)
+                continue
+            crc_mio = mio._miembros[mio.ruta_parte(hoja)].CRC
+            crc_base = base._miembros[base.ruta_parte(hoja)].CRC
+            if crc_mio != crc_base:
+                hojas.append(hoja)
+        return hojas
+
+    def hojas_eliminadas(self, base, mio, remoto):
+        """Hojas de meses que local retiro y que el remoto conserva sin cambios desde la base."""
+        if base is None:
+            return []
+        hojas = []
+        for hoja in base.nombres_hojas:
+            if not self._es_hoja_mes(hoja) or hoja in mio.nombres_hojas or hoja not in remoto.nombres_hojas:
+                continue
+            # Por contenido: otro cliente pudo reescribir el XML (guardar con openpyxl) sin tocarla
+            if self._leer(remoto, hoja) == self._leer(base, hoja):
+                hojas.append(hoja)
+        return hojas
+
+    def _diferencias(self, hoja, base, mio, remoto):
+        filas_mias, resto_mio = self._leer(mio, hoja)
+        filas_remotas, resto_remoto = self._leer(remoto, hoja)
+        if base is None:
+            # Sin revision base no se puede distinguir un borrado: union de ambos lados
+            agregar = Counter(filas_mias) - Counter(filas_remotas)
+            quitar = Counter()
+            estructura = resto_mio != resto_remoto
+        else:
+            filas_base, resto_base = self._leer(base, hoja)
+            agregar = Counter(filas_mias) - Counter(filas_base)
+            quitar = (Counter(filas_base) - Counter(filas_mias)) & Counter(filas_remotas)
+            estructura = resto_base is None or resto_mio != resto_base
+
+        nuevas = []
+        pendientes = Counter(agregar)
+        for fila in filas_mias:
+            if pendientes[fila] > 0:
+                nuevas.append(fila)
+                pendientes[fila] -= 1
+
+        finales = []
+        por_quitar = Counter(quitar)
+        for fila in filas_remotas:
+            if por_quitar[fila] > 0:
+                por_quitar[fila] -= 1
+                continue
+            finales.append(fila)
+        finales.extend(nuevas)
+
+        if len(finales) > self.capacidad:
+            raise ConflictoNoResoluble(
+                f'La fusion de {hoja} necesita {len(finales)} filas y la tabla admite {self.capacidad}'
+            )
+        return {
+            'agregadas': nuevas,
+            'quitadas': sum(quitar.values()),
+            'finales': finales,
+            'hoja_remota': resto_remoto is not None,
+            # La hoja se reconstruye si falta en el remoto o local cambio algo fuera de H:K
+            'estructura': estructura or resto_remoto is None,
+        }
+
+    @staticmethod
+    def _gasto(fila):
+        monto, concepto, categoria, fecha = fila
+        return {'monto': monto, 'concepto': concepto, 'categoria': categoria, 'fecha': fecha}
+
+    def _reconstruir(self, wb, hoja, filas):
+        """Fijos y resumen con la configuracion actual (como la sincronizacion) y `filas` en H:K."""
+        match = self.PATRON_HOJA.match(hoja)
+        ws = self.generador.crear_o_actualizar_hoja_mes(wb, match.group('mes'), int(match.group('anio')))
+        self.generador._insertar_registros_preservados(ws, filas)
+        return ws
+
+    def _reescribir(self, ws, filas):
+        g = self.generador
+        for fila in range(g.FILA_VARIABLES_DATA_INICIO, g.FILA_VARIABLES_DATA_FIN + 1):
+            for columna in 'HIJK':
+                ws[f'{columna}{fila}'].value = None
+        for fila in filas:
+            g.agregar_gasto_a_hoja(ws, self._gasto(fila))
+
+    def fusionar(self, ruta_base, ruta_mia, ruta_remota, ruta_salida):
+        """
+        Escribe en `ruta_salida` el remoto con los cambios locales de las hojas de meses.
+        Devuelve {hoja: {'agregadas': n, 'quitadas': n, 'regenerada': bool}} con las hojas
+        tocadas y {hoja: {'eliminada': True}} con las retiradas.
+        """
+        base = LibroXlsxPerezoso(ruta_base) if ruta_base else None
+        mio = LibroXlsxPerezoso(ruta_mia)
+        remoto = LibroXlsxPerezoso(ruta_remota)
+        try:
+            cambios = {}
+            for hoja in self.hojas_modificadas(base, mio):
+                diferencia = self._diferencias(hoja, base, mio, remoto)
+                if diferencia['agregadas'] or diferencia['quitadas'] or diferencia['estructura']:
+                    cambios[hoja] = diferencia
+            eliminadas = self.hojas_eliminadas(base, mio, remoto)
+        finally:
+            mio.cerrar()
+            if base is not None:
+                base.cerrar()
+
+        resumen = {
+            h: {'agregadas': len(d['agregadas']), 'quitadas': d['quitadas'], 'regenerada': d['estructura']}
+            for h, d in cambios.items()
+        }
+        resumen.update({hoja: {'eliminada': True} for hoja in eliminadas})
+        try:
+            if not eliminadas and self._aplicar_perezoso(remoto, cambios, ruta_salida):
+                return resumen
+        except (HojaNoSoportada, zipfile.BadZipFile) as e:
+            print(f'Fusion XML no disponible ({e}), usando openpyxl')
+        finally:
+            remoto.cerrar()
+
+        self._aplicar_completo(ruta_remota, cambios, eliminadas, ruta_salida)
+        return resumen
+
+    def _aplicar_perezoso(self, remoto, cambios, ruta_salida):
+        """Aplica sobre el zip remoto sin cargar el libro entero; False si hay hojas nuevas."""
+        if any(not d['hoja_remota'] for d in cambios.values()):
+            return False
+
+        wb = None
+        for hoja, diferencia in cambios.items():
+            if diferencia['estructura']:
+                if wb is None:
+                    wb = remoto.libro_con_estilos()
+                remoto.cargar_hoja(hoja, wb)
+                remoto.actualizar_hoja(self._reconstruir(wb, hoja, diferencia['finales']))
+                continue
+            if not diferencia['quitadas']:
+                # Solo altas: parche directo del XML en las filas libres
+                ParcheVariablesXml(remoto, hoja, self.generador).agregar(
+                    [self._gasto(fila) for fila in diferencia['agregadas']]
+                )
+                continue
+            if wb is None:
+                wb = remoto.libro_con_estilos()
+            ws = remoto.cargar_hoja(hoja, wb)
+            self._reescribir(ws, diferencia['finales'])
+            remoto.actualizar_hoja(ws)
+
+        remoto.guardar(ruta_salida)
+        return True
+
+    def _aplicar_completo(self, ruta_remota, cambios, eliminadas, ruta_salida):
+        wb = openpyxl.load_workbook(ruta_remota)
+        for hoja in eliminadas:
+            wb.remove(wb[hoja])
+        for hoja, diferencia in cambios.items():
+            if diferencia['estructura']:
+                self._reconstruir(wb, hoja, diferencia['finales'])
+            else:
+                self._reescribir(wb[hoja], diferencia['finales'])
+        if wb.sheetnames:
+            wb.active = 0
+        wb.save(ruta_salida)
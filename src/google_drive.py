@@ -1,12 +1,15 @@
 import os
 import json
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-import pickle
-from datetime import datetime
+
+try:
+    import config_archivo
+    import metricas
+except ModuleNotFoundError:
+    from src import config_archivo
+    from src import metricas
 
 class GoogleDriveManager:
     
@@ -36,32 +39,53 @@ class GoogleDriveManager:
         self.config['google_drive']['archivo_excel_id'] = self.archivo_excel_id
         self.config['google_drive']['carpeta_backup_id'] = self.carpeta_backup_id
         
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
+        config_archivo.aplicar_parche(self.config_path, {'google_drive': {
+            'archivo_excel_id': self.archivo_excel_id,
+            'carpeta_backup_id': self.carpeta_backup_id,
+        }})
+    
+    def _construir_servicio(self):
+        """Servicio de Drive real o, si esta configurado, el simulado en disco."""
+        try:
+            from drive_simulado import HttpDriveSimulado, construir_servicio_simulado
+        except ModuleNotFoundError:
+            from src.drive_simulado import HttpDriveSimulado, construir_servicio_simulado
+        http = HttpDriveSimulado.desde_config(self.config)
+        if http is not None:
+            return construir_servicio_simulado(metricas.HttpMedido(http))
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.http import build_http
+        # Transporte medido: peticiones, duracion y bytes de Drive en /api/metrics
+        return build('drive', 'v3', http=metricas.HttpMedido(AuthorizedHttp(self.creds, http=build_http())))
+    
+    def transferencias(self, **opciones):
+        """Gestor de subidas/descargas en paralelo (google_drive.transferencias)."""
+        try:
+            from transferencias_drive import GestorTransferencias
+        except ModuleNotFoundError:
+            from src.transferencias_drive import GestorTransferencias
+        return GestorTransferencias(self, **opciones)
     
     def autenticar(self):
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                self.creds = pickle.load(token)
+        try:
+            from drive_simulado import HttpDriveSimulado
+        except ModuleNotFoundError:
+            from src.drive_simulado import HttpDriveSimulado
+        simulado = HttpDriveSimulado.desde_config(self.config)
+        if simulado is not None:
+            self.service = self._construir_servicio()
+            print(f'Usando Drive simulado en {simulado.directorio}')
+            return True
         
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                if not os.path.exists(self.credentials_path):
-                    print('ERROR: No se encontró el archivo credentials.json')
-                    print('Por favor descarga tus credenciales de Google Cloud Console')
-                    print('y guárdalas en config/credentials.json')
-                    return False
-                
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_path, self.SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(self.creds, token)
+        try:
+            from credenciales_drive import gestor_credenciales
+        except ModuleNotFoundError:
+            from src.credenciales_drive import gestor_credenciales
+        self.creds = gestor_credenciales(self.token_path, self.credentials_path, self.SCOPES).obtener()
+        if not self.creds:
+            return False
         
-        self.service = build('drive', 'v3', credentials=self.creds)
+        self.service = self._construir_servicio()
         print('Autenticación exitosa con Google Drive')
         return True
     
@@ -182,18 +206,71 @@ class GoogleDriveManager:
             if carpeta_id:
                 query += f" and '{carpeta_id}' in parents"
             
-            results = self.service.files().list(
-                q=query,
-                pageSize=100,
-                fields='files(id, name, modifiedTime, size)'
-            ).execute()
-            
-            archivos = results.get('files', [])
-            return archivos
+            archivos = []
+            token = None
+            while True:
+                results = self.service.files().list(
+                    q=query,
+                    pageSize=1000,
+                    pageToken=token,
+                    fields='nextPageToken, files(id, name, modifiedTime, size)'
+                ).execute()
+                archivos.extend(results.get('files', []))
+                token = results.get('nextPageToken')
+                if not token:
+                    return archivos
         except Exception as e:
             print(f'Error al listar archivos: {e}')
             return []
     
+    def subir_varios(self, rutas, carpeta_id=None, workers=None):
+        """Sube varios archivos en paralelo; devuelve {ruta: file_id o None}."""
+        if not self.service:
+            print('Error: No has iniciado sesión.')
+            return {}
+        
+        gestor = self.transferencias(workers=workers)
+        trabajos = [{
+            'ruta': ruta,
+            'nombre': os.path.basename(ruta),
+            'carpeta_id': carpeta_id,
+            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        } for ruta in rutas]
+        if not carpeta_id:
+            for trabajo in trabajos:
+                trabajo.pop('carpeta_id')
+        
+        transferencias = gestor.subir(trabajos)
+        self._imprimir_resumen('Subida', gestor, transferencias)
+        return {t['ruta']: tr.resultado if tr.ok else None for t, tr in zip(trabajos, transferencias)}
+    
+    def descargar_varios(self, archivos, carpeta_destino, workers=None):
+        """Descarga en paralelo una lista de archivos ({'id', 'name'}) a `carpeta_destino`."""
+        if not self.service:
+            print('Error: No has iniciado sesión.')
+            return {}
+        
+        os.makedirs(carpeta_destino, exist_ok=True)
+        gestor = self.transferencias(workers=workers)
+        trabajos = [{
+            'file_id': archivo['id'],
+            'ruta': os.path.join(carpeta_destino, archivo['name']),
+            'bytes': int(archivo.get('size') or 0),
+        } for archivo in archivos]
+        
+        transferencias = gestor.descargar(trabajos)
+        self._imprimir_resumen('Descarga', gestor, transferencias)
+        return {t['file_id']: tr.resultado if tr.ok else None for t, tr in zip(trabajos, transferencias)}
+    
+    def _imprimir_resumen(self, operacion, gestor, transferencias):
+        for transferencia in transferencias:
+            estado = 'OK' if transferencia.ok else f'ERROR ({transferencia.error})'
+            print(f'  {transferencia.etiqueta}: {transferencia.bytes_hechos / 1024:.0f} KB '
+                  f'en {transferencia.segundos:.2f}s ({transferencia.kbps:.0f} KB/s) {estado}')
+        resumen = gestor.resumen(transferencias)
+        print(f"{operacion}: {resumen['archivos'] - resumen['fallidos']}/{resumen['archivos']} archivo(s), "
+              f"{resumen['bytes'] / 1024:.0f} KB en {resumen['segundos']:.2f}s ({resumen['kbps']:.0f} KB/s)")
+    
     def sincronizar_archivo_mes(self, nombre_archivo=None):
         if nombre_archivo is None:
             nombre_archivo = 'ControlDeGastos.xlsx'
@@ -221,42 +298,72 @@ class GoogleDriveManager:
         
         return False
     
-    def crear_backup_mensual(self):
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        nombre_backup = f'backup_control_gastos_{timestamp}.zip'
+    def _almacen_backups(self):
+        try:
+            from backups_incrementales import AlmacenBackups
+        except ModuleNotFoundError:
+            from src.backups_incrementales import AlmacenBackups
         
-        import zipfile
-        ruta_backup = f'logs/{nombre_backup}'
+        if not self.carpeta_backup_id:
+            print('Creando carpeta de backups en Drive...')
+            self.carpeta_backup_id = self.crear_carpeta('Backups Control Gastos')
+            if not self.carpeta_backup_id:
+                return None
+            self._guardar_configuracion()
         
-        os.makedirs('logs', exist_ok=True)
+        return AlmacenBackups(self, self.carpeta_excel)
+    
+    def crear_backup_mensual(self):
+        """Snapshot incremental: solo se suben los fragmentos que cambiaron desde el ultimo backup."""
+        if not self.service:
+            print('Error: No has iniciado sesión.')
+            return False
         
-        with zipfile.ZipFile(ruta_backup, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(self.carpeta_excel):
-                for file in files:
-                    if file.endswith('.xlsx'):
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, self.carpeta_excel)
-                        zipf.write(file_path, arcname)
+        try:
+            almacen = self._almacen_backups()
+            if not almacen:
+                return False
+            resumen = almacen.crear_snapshot(self.carpeta_backup_id)
+        except Exception as e:
+            print(f'Error al crear backup: {e}')
+            return False
         
-        print(f'Backup creado: {ruta_backup}')
+        print(f"Backup {resumen['snapshot']}: {resumen['archivos']} archivo(s), "
+              f"{resumen['fragmentos_nuevos']} fragmento(s) nuevo(s), "
+              f"{resumen['fragmentos_reutilizados']} reutilizado(s)")
+        print(f"Subidos {resumen['bytes_subidos'] / 1024:.1f} KB de {resumen['bytes_total'] / 1024:.1f} KB")
+        return True
+    
+    def listar_backups(self):
+        if not self.service:
+            print('Error: No has iniciado sesión.')
+            return []
         
-        if not self.carpeta_backup_id:
-            print('Creando carpeta de backups en Drive...')
-            self.carpeta_backup_id = self.crear_carpeta('Backups Control Gastos')
-            if self.carpeta_backup_id:
-                self._guardar_configuracion()
+        try:
+            almacen = self._almacen_backups()
+            return almacen.listar_snapshots(self.carpeta_backup_id) if almacen else []
+        except Exception as e:
+            print(f'Error al listar backups: {e}')
+            return []
+    
+    def restaurar_backup(self, snapshot=None, destino=None):
+        """Restaura un snapshot (el mas reciente si no se indica) en `destino` (por defecto carpeta_excel)."""
+        if not self.service:
+            print('Error: No has iniciado sesión.')
+            return False
         
-        if self.carpeta_backup_id:
-            file_id = self.subir_archivo(
-                ruta_backup,
-                nombre_backup,
-                self.carpeta_backup_id
-            )
-            if file_id:
-                print(f'Backup subido a Drive exitosamente')
-                return True
+        try:
+            almacen = self._almacen_backups()
+            if not almacen:
+                return False
+            restaurados = almacen.restaurar(self.carpeta_backup_id, destino or self.carpeta_excel, snapshot)
+        except Exception as e:
+            print(f'Error al restaurar backup: {e}')
+            return False
         
-        return False
+        for ruta in restaurados:
+            print(f'Restaurado: {ruta}')
+        return True
     
     def obtener_enlace_compartido(self, file_id):
         if not self.service:
@@ -300,6 +407,7 @@ def main():
     print('3. Crear backup y subir a Drive')
     print('4. Listar archivos en Drive')
     print('5. Verificar conexión')
+    print('6. Restaurar backup desde Drive')
     print('0. Salir\n')
     
     opcion = input('Selecciona una opción: ')
@@ -323,6 +431,18 @@ def main():
                 print('\nNo se encontraron archivos.')
     elif opcion == '5':
         drive.verificar_conexion()
+    elif opcion == '6':
+        if drive.autenticar():
+            backups = drive.listar_backups()
+            if not backups:
+                print('\nNo hay backups en Drive.')
+            else:
+                print('\nBackups disponibles:')
+                for i, backup in enumerate(backups, 1):
+                    print(f"  {i}. {backup['name']}")
+                eleccion = input('Número de backup (Enter = el más reciente): ').strip()
+                snapshot = backups[int(eleccion) - 1]['name'] if eleccion.isdigit() else None
+                drive.restaurar_backup(snapshot)
     elif opcion == '0':
         print('Saliendo...')
     else:
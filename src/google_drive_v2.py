@@ -3,15 +3,67 @@ import json
 import time
 import io
 import re
+import hashlib
+import shutil
+import tempfile
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-import pickle
+from googleapiclient.errors import HttpError
+import threading
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import config_archivo
+    import metricas
+    import reintentos_drive
+    from escritura_agrupada import lock_libro
+except ModuleNotFoundError:
+    from src import config_archivo
+    from src import metricas
+    from src import reintentos_drive
+    from src.escritura_agrupada import lock_libro
+
+NOMBRE_EXCEL = 'ControlDeGastos.xlsx'
+
+
+
+def escritura_excel():
+    """Turno de escritura del Excel de Drive, compartido por bot, sincronizacion y regeneracion."""
+    return metricas.lock_medido(lock_libro(NOMBRE_EXCEL), 'libro_excel')
+
+
+def _borrar_temporales(*rutas):
+    for ruta in rutas:
+        if ruta:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+# Archivos con una reverificacion del enlace compartido en curso (bajo config_archivo.LOCK):
+# syncs superpuestos con el enlace vencido no lanzan una comprobacion cada uno
+_REVERIFICANDO = set()
+
+
+def _eventos():
+    try:
+        import eventos
+    except ModuleNotFoundError:
+        from src import eventos
+    return eventos
+
+
+def _md5_archivo(ruta):
+    h = hashlib.md5()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
 class GoogleDriveManager:
     """
     Gestor de Google Drive para Control de Gastos
@@ -22,6 +74,8 @@ class GoogleDriveManager:
         'https://www.googleapis.com/auth/drive.file',
         'https://www.googleapis.com/auth/drive.metadata.readonly'
     ]
+
+    MAX_FUSIONES = 3
     
     def __init__(self, config_path='config/configuracion.json'):
         self.config_path = config_path
@@ -29,10 +83,14 @@ class GoogleDriveManager:
         self.service = None
         self.token_path = 'config/token.pickle'
         self.credentials_path = 'config/credentials.json'
-        self.nombre_archivo = 'ControlDeGastos.xlsx'
+        self.nombre_archivo = NOMBRE_EXCEL
         self.nombre_carpeta = 'ControlDeGastos'
         
         self._cargar_configuracion()
+        self._configurar_subida()
+        self._cambios = None
+        # md5 de la revision descargada: las subidas son condicionales a ella
+        self.revision_base = None
     
     def _cargar_configuracion(self):
         with open(self.config_path, 'r', encoding='utf-8') as f:
@@ -40,38 +98,116 @@ class GoogleDriveManager:
         
         self.archivo_excel_id = self.config['google_drive'].get('archivo_excel_id', '')
         self.carpeta_id = self.config['google_drive'].get('carpeta_backup_id', '')
+        self._ids_guardados = (self.archivo_excel_id, self.carpeta_id)
     
-    def _guardar_configuracion(self):
+    def _configurar_subida(self):
+        """Parametros de subida reanudable (google_drive.subida en config)."""
+        subida = self.config['google_drive'].get('subida') or {}
+        chunk_mb = float(subida.get('chunk_mb', 5) or 5)
+        # Drive exige trozos multiplos de 256 KiB
+        bloque = 256 * 1024
+        self.chunk_bytes = max(1, round(chunk_mb * 1024 * 1024 / bloque)) * bloque
+        self.reintentos = reintentos_drive.Reintentos(
+            int(subida.get('max_reintentos', 8)),
+            float(subida.get('espera_base_s', 1.0)),
+            float(subida.get('espera_max_s', 32.0)),
+        )
+
+    def rastreador_cambios(self):
+        """Cache local del Excel validada con la Changes API de Drive."""
+        if self._cambios is None:
+            try:
+                from drive_cambios import RastreadorCambiosDrive
+            except ModuleNotFoundError:
+                from src.drive_cambios import RastreadorCambiosDrive
+            self._cambios = RastreadorCambiosDrive(self)
+        return self._cambios
+
+    def _guardar_configuracion(self, parche=None):
+        """
+        Guarda los IDs de Drive (y `parche`, p. ej. el manifiesto de particiones)
+        sobre la configuracion actual en disco, sin pisar el resto.
+        """
         self.config['google_drive']['archivo_excel_id'] = self.archivo_excel_id
         self.config['google_drive']['carpeta_backup_id'] = self.carpeta_id
         
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
+        ids = {'google_drive': {'archivo_excel_id': self.archivo_excel_id, 'carpeta_backup_id': self.carpeta_id}}
+        config_archivo.aplicar_parche(self.config_path, config_archivo.fusionar_parche(ids, parche or {}))
+        self._ids_guardados = (self.archivo_excel_id, self.carpeta_id)
+
+    def _guardar_ids(self):
+        """Persiste los IDs resueltos solo si cambiaron respecto a configuracion.json."""
+        if (self.archivo_excel_id, self.carpeta_id) != self._ids_guardados:
+            self._guardar_configuracion()
+
+    def _es_no_encontrado(self, error):
+        return isinstance(error, HttpError) and error.resp.status == 404
+
+    def _resolver_archivo_excel(self):
+        """Tras un 404, busca el Excel por nombre en la carpeta; actualiza el ID si aparece."""
+        anterior = self.archivo_excel_id
+        self.archivo_excel_id = ''
+        try:
+            query = f"name='{self.nombre_archivo}' and trashed=false"
+            if self.carpeta_id:
+                query += f" and '{self.carpeta_id}' in parents"
+            results = self.service.files().list(
+                q=query, spaces='drive', fields='files(id, name)', orderBy='modifiedTime desc'
+            ).execute()
+            items = results.get('files', [])
+            if items:
+                self.archivo_excel_id = items[0]['id']
+                print(f'Excel resuelto de nuevo: {self.nombre_archivo} (ID: {self.archivo_excel_id})')
+        except Exception as e:
+            print(f'Error buscando el Excel en Drive: {e}')
+        if not self.archivo_excel_id:
+            print(f'El Excel {anterior} ya no existe en Drive')
+        self._guardar_ids()
+        return self.archivo_excel_id
     
+    def _construir_servicio(self):
+        """Servicio de Drive real o, si esta configurado, el simulado en disco."""
+        try:
+            from drive_simulado import HttpDriveSimulado, construir_servicio_simulado
+        except ModuleNotFoundError:
+            from src.drive_simulado import HttpDriveSimulado, construir_servicio_simulado
+        http = HttpDriveSimulado.desde_config(self.config)
+        if http is not None:
+            return construir_servicio_simulado(metricas.HttpMedido(http))
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.http import build_http
+        # Transporte medido: peticiones, duracion y bytes de Drive en /api/metrics
+        return build('drive', 'v3', http=metricas.HttpMedido(AuthorizedHttp(self.creds, http=build_http())))
+
+    def transferencias(self, **opciones):
+        """Gestor de subidas/descargas en paralelo (google_drive.transferencias)."""
+        try:
+            from transferencias_drive import GestorTransferencias
+        except ModuleNotFoundError:
+            from src.transferencias_drive import GestorTransferencias
+        return GestorTransferencias(self, **opciones)
+
     def autenticar(self):
         """Autentica con Google Drive"""
-        if os.path.exists(self.token_path):
-            with open(self.token_path, 'rb') as token:
-                self.creds = pickle.load(token)
+        try:
+            from drive_simulado import HttpDriveSimulado
+        except ModuleNotFoundError:
+            from src.drive_simulado import HttpDriveSimulado
+        simulado = HttpDriveSimulado.desde_config(self.config)
+        if simulado is not None:
+            self.service = self._construir_servicio()
+            print(f'Usando Drive simulado en {simulado.directorio}')
+            return True
         
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                if not os.path.exists(self.credentials_path):
-                    print('ERROR: No se encontrÃ³ el archivo credentials.json')
-                    print('Por favor descarga tus credenciales de Google Cloud Console')
-                    print('y guÃ¡rdalas en config/credentials.json')
-                    return False
-                
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    self.credentials_path, self.SCOPES)
-                self.creds = flow.run_local_server(port=0)
-            
-            with open(self.token_path, 'wb') as token:
-                pickle.dump(self.creds, token)
+        try:
+            from credenciales_drive import gestor_credenciales
+        except ModuleNotFoundError:
+            from src.credenciales_drive import gestor_credenciales
+        self.creds = gestor_credenciales(self.token_path, self.credentials_path, self.SCOPES).obtener()
+        if not self.creds:
+            return False
         
-        self.service = build('drive', 'v3', credentials=self.creds)
+        self.service = self._construir_servicio()
         print('AutenticaciÃ³n exitosa con Google Drive')
         return True
     
@@ -84,6 +220,10 @@ class GoogleDriveManager:
             print('Error: No has iniciado sesiÃ³n.')
             return None
         
+        # Se confia en el ID conocido; solo se vuelve a resolver tras un 404
+        if nombre == self.nombre_carpeta and self.carpeta_id:
+            return self.carpeta_id
+        
         # Buscar si la carpeta ya existe
         try:
             query = f"mimeType='application/vnd.google-apps.folder' and name='{nombre}' and trashed=false"
@@ -93,30 +233,149 @@ class GoogleDriveManager:
             if items:
                 print(f'Carpeta encontrada: {nombre} (ID: {items[0]["id"]})')
                 self.carpeta_id = items[0]['id']
-                self._guardar_configuracion()
+                self._guardar_ids()
                 return items[0]['id']
         except Exception as e:
             print(f'Error buscando carpeta: {e}')
         
         # Crear la carpeta si no existe
+        return self._crear_carpeta(nombre)
+    
+    def _crear_carpeta(self, nombre):
         try:
             metadata = {
                 'name': nombre,
                 'mimeType': 'application/vnd.google-apps.folder'
             }
             
-            carpeta = self.service.files().create(body=metadata, fields='id').execute()
+            carpeta = self._con_reintentos(self.service.files().create(body=metadata, fields='id'))
             self.carpeta_id = carpeta['id']
-            self._guardar_configuracion()
+            self._guardar_ids()
             print(f'Carpeta creada: {nombre} (ID: {carpeta["id"]})')
             return carpeta['id']
         except Exception as e:
             print(f'Error al crear carpeta: {e}')
             return None
+
+    def _lote(self, peticiones):
+        """
+        Ejecuta varias peticiones de metadatos en un solo batch HTTP.
+        Devuelve {nombre: respuesta o excepcion}; los errores transitorios,
+        del batch entero o de una parte, se reintentan con backoff.
+        """
+        resultados = {}
+        pendientes = dict(peticiones)
+        if len(pendientes) == 1:
+            # Un batch de una sola peticion no ahorra nada
+            nombre, peticion = next(iter(pendientes.items()))
+            try:
+                resultados[nombre] = self._con_reintentos(peticion)
+            except Exception as e:
+                resultados[nombre] = e
+            return resultados
+
+        for intento in range(self.reintentos.max_reintentos + 1):
+            respuestas = {}
+
+            def _al_responder(nombre, respuesta, error):
+                respuestas[nombre] = respuesta if error is None else error
+
+            lote = self.service.new_batch_http_request(callback=_al_responder)
+            for nombre, peticion in pendientes.items():
+                lote.add(peticion, request_id=nombre)
+            try:
+                lote.execute()
+            except Exception as e:
+                if not reintentos_drive.es_transitorio(e) or intento == self.reintentos.max_reintentos:
+                    raise
+                self.reintentos.esperar(intento)
+                continue
+
+            resultados.update(respuestas)
+            pendientes = {
+                nombre: peticion for nombre, peticion in pendientes.items()
+                if isinstance(respuestas.get(nombre), Exception) and reintentos_drive.es_transitorio(respuestas[nombre])
+            }
+            if not pendientes or intento == self.reintentos.max_reintentos:
+                break
+            self.reintentos.esperar(intento)
+        return resultados
+
+    def metadatos_sincronizacion(self):
+        """
+        Un solo viaje a Drive con todo lo que la sincronizacion necesita saber antes
+        de descargar: md5/version del Excel (vale como validacion de la cache y
+        como verificacion previa de la subida condicional), la carpeta si no se
+        conoce, los permisos si no hay enlace guardado y un startPageToken si el
+        rastreador de cambios aun no tiene uno.
+        """
+        rastreador = self.rastreador_cambios()
+        cache_enlace = self.config['google_drive'].get('enlace_compartido') or {}
+        peticiones = {}
+        if not self.carpeta_id:
+            peticiones['carpeta'] = self.service.files().list(
+                q=f"mimeType='application/vnd.google-apps.folder' and name='{self.nombre_carpeta}' and trashed=false",
+                spaces='drive',
+                fields='files(id, name)'
+            )
+        if self.archivo_excel_id:
+            peticiones['excel'] = self.service.files().get(
+                fileId=self.archivo_excel_id,
+                fields='id, md5Checksum, version, headRevisionId'
+            )
+            if cache_enlace.get('file_id') != self.archivo_excel_id or not cache_enlace.get('enlace'):
+                peticiones['permisos'] = self.service.permissions().list(
+                    fileId=self.archivo_excel_id,
+                    fields='permissions(id, type, role)'
+                )
+            if rastreador.necesita_token():
+                peticiones['token'] = self.service.changes().getStartPageToken()
+
+        respuestas = self._lote(peticiones) if peticiones else {}
+
+        if 'carpeta' in respuestas:
+            carpeta = respuestas['carpeta']
+            if isinstance(carpeta, Exception):
+                print(f'Error buscando carpeta: {carpeta}')
+                carpeta = {}
+            items = carpeta.get('files', [])
+            if items:
+                print(f'Carpeta encontrada: {self.nombre_carpeta} (ID: {items[0]["id"]})')
+                self.carpeta_id = items[0]['id']
+                self._guardar_ids()
+            elif not self._crear_carpeta(self.nombre_carpeta):
+                return None
+
+        excel = respuestas.get('excel')
+        if isinstance(excel, Exception):
+            if not self._es_no_encontrado(excel):
+                raise excel
+            print(f'Archivo no encontrado en Drive: {excel}')
+            excel = None
+            if self._resolver_archivo_excel():
+                excel = self._con_reintentos(self.service.files().get(
+                    fileId=self.archivo_excel_id,
+                    fields='id, md5Checksum, version, headRevisionId'
+                ))
+
+        permisos = respuestas.get('permisos')
+        if isinstance(permisos, Exception) or (excel and excel['id'] != self.archivo_excel_id):
+            permisos = None
+
+        token = respuestas.get('token')
+        if token and not isinstance(token, Exception):
+            rastreador.inicializar(token['startPageToken'])
+
+        return {
+            'carpeta_id': self.carpeta_id,
+            'excel': excel,
+            'permisos': permisos.get('permissions', []) if permisos else None,
+        }
     
-    def subir_excel_drive(self, ruta_local, actualizar=False):
+    def subir_excel_drive(self, ruta_local, actualizar=False, base_md5=None, remoto=None):
         """
-        Sube o actualiza el Excel en Drive
+        Sube o actualiza el Excel en Drive. `remoto` son los metadatos del Excel
+        (md5Checksum, version) si ya se pidieron; evita repetir la verificacion previa.
         """
         if not self.service:
             print('Error: No has iniciado sesiÃ³n.')
@@ -148,55 +407,42 @@ class GoogleDriveManager:
                 print('Esperando 2 segundos...')
                 time.sleep(2)
             
-            # Subir archivo usando mÃ©todo simple (no resumable para archivos pequeÃ±os)
-            file_metadata = {
-                'name': self.nombre_archivo,
-                'parents': [self.carpeta_id] if self.carpeta_id else []
-            }
-            
-            # Usar media body simple para evitar problemas de corrupciÃ³n
-            media = MediaFileUpload(
-                ruta_local,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                resumable=False  # No usar resumable para archivos pequeÃ±os
-            )
-            
             if actualizar and self.archivo_excel_id:
-                # Actualizar archivo existente
-                # Primero eliminar el anterior para evitar conflictos de versiÃ³n
+                # Si la actualizacion falla no se crea otro archivo: eso bifurcaria el ID del libro
+                base_md5 = base_md5 or self.revision_base
                 try:
-                    file = self.service.files().update(
-                        fileId=self.archivo_excel_id,
-                        body={'name': self.nombre_archivo},
-                        media_body=media,
-                        fields='id, name, mimeType, size'
-                    ).execute()
-                    
+                    file = self._actualizar_excel_condicional(ruta_local, base_md5, remoto)
+                except HttpError as e:
+                    if not self._es_no_encontrado(e):
+                        raise
+                    file = self._actualizar_excel_condicional(ruta_local, base_md5) if self._resolver_archivo_excel() else None
+                if file:
+                    self.rastreador_cambios().registrar(ruta_local, file['id'], file.get('md5Checksum'))
+                    self.revision_base = file.get('md5Checksum')
                     print(f'Archivo actualizado exitosamente: {file["name"]}')
                     print(f'ID: {file["id"]}')
                     print(f'Size: {file.get("size", "unknown")} bytes')
                     return file['id']
-                    
-                except Exception as e:
-                    print(f'Error actualizando archivo: {e}')
-                    print('Intentando crear nuevo archivo...')
-                    actualizar = False
             
-            if not actualizar or not self.archivo_excel_id:
-                # Crear nuevo archivo
-                file = self.service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id, name, mimeType, size'
-                ).execute()
-                
-                self.archivo_excel_id = file['id']
-                self._guardar_configuracion()
-                
-                print(f'Archivo creado exitosamente: {file["name"]}')
-                print(f'ID: {file["id"]}')
-                print(f'Size: {file.get("size", "unknown")} bytes')
-                return file['id']
+            try:
+                file = self._crear_excel(ruta_local)
+            except HttpError as e:
+                if not self._es_no_encontrado(e) or not self.carpeta_id:
+                    raise
+                # La carpeta conocida ya no existe: resolverla de nuevo y reintentar
+                self.carpeta_id = ''
+                self.crear_o_obtener_carpeta()
+                file = self._crear_excel(ruta_local)
+            
+            self.archivo_excel_id = file['id']
+            self._guardar_ids()
+            self.rastreador_cambios().registrar(ruta_local, file['id'], file.get('md5Checksum'))
+            self.revision_base = file.get('md5Checksum')
+            
+            print(f'Archivo creado exitosamente: {file["name"]}')
+            print(f'ID: {file["id"]}')
+            print(f'Size: {file.get("size", "unknown")} bytes')
+            return file['id']
                 
         except Exception as e:
             print(f'Error al subir archivo: {e}')
@@ -204,8 +450,185 @@ class GoogleDriveManager:
             traceback.print_exc()
             return None
     
-    def descargar_excel_drive(self, ruta_destino=None):
-        """Descarga el Excel desde Drive"""
+    def _media_excel(self, ruta_local):
+        return MediaFileUpload(
+            ruta_local,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            chunksize=self.chunk_bytes,
+            resumable=True
+        )
+
+    def _actualizar_excel(self, ruta_local):
+        request = self.service.files().update(
+            fileId=self.archivo_excel_id,
+            body={'name': self.nombre_archivo},
+            media_body=self._media_excel(ruta_local),
+            fields='id, name, mimeType, size, md5Checksum, version, headRevisionId'
+        )
+        return self._subir_reanudable(request, ruta_local, self.nombre_archivo)
+
+    def _actualizar_excel_condicional(self, ruta_local, base_md5, remoto=None):
+        """
+        Sube el Excel solo si Drive sigue en la revision descargada (`base_md5`).
+        Drive v3 no respeta If-Match en files.update, asi que se compara md5/version
+        antes de subir y, si la version salto mas de uno, se revisa en revisions()
+        que nadie haya escrito en medio. Ante un conflicto se fusionan las filas H:K
+        (base = revision descargada) y se reintenta; nunca se pisan filas ajenas.
+        `remoto` puede traer la verificacion previa ya hecha (p. ej. en un batch):
+        si alguien escribio despues, la comprobacion de version posterior lo detecta.
+        """
+        try:
+            from fusion_variables import ConflictoNoResoluble
+        except ModuleNotFoundError:
+            from src.fusion_variables import ConflictoNoResoluble
+
+        # Sin revision base (no se descargo antes) nunca se sube a ciegas: se une con lo remoto.
+        # Un directorio de fusion por llamada: varios remitentes pueden subir a la vez
+        dir_control = os.path.join(tempfile.gettempdir(), 'control_gastos')
+        os.makedirs(dir_control, exist_ok=True)
+        dir_fusion = tempfile.mkdtemp(prefix='fusion_', dir=dir_control)
+        try:
+            ruta_base = self.rastreador_cambios().ruta_base(base_md5)
+            ruta_mia = ruta_local
+            esperado = base_md5
+
+            for intento in range(self.MAX_FUSIONES + 1):
+                if intento > 0 or not remoto or remoto.get('id', self.archivo_excel_id) != self.archivo_excel_id:
+                    remoto = self._con_reintentos(self.service.files().get(
+                        fileId=self.archivo_excel_id,
+                        fields='md5Checksum, version, headRevisionId'
+                    ))
+
+                if remoto.get('md5Checksum') != esperado:
+                    if intento == self.MAX_FUSIONES:
+                        break
+                    print('El Excel cambio en Drive desde la descarga; fusionando gastos variables...')
+                    ruta_remota = os.path.join(dir_fusion, f'remoto_{intento}.xlsx')
+                    self._descargar_media(self.archivo_excel_id, ruta_remota)
+                    ruta_mia = self._fusionar(ruta_base, ruta_mia, ruta_remota, os.path.join(dir_fusion, f'fusion_{intento}.xlsx'))
+                    ruta_base = ruta_remota
+                    esperado = _md5_archivo(ruta_remota)
+                    continue
+
+                file = self._actualizar_excel(ruta_mia)
+                interpuesta = None
+                if int(file.get('version', 0)) != int(remoto.get('version', 0)) + 1:
+                    interpuesta = self._revision_interpuesta(file, esperado)
+
+                if interpuesta is None:
+                    if ruta_mia != ruta_local:
+                        shutil.copyfile(ruta_mia, ruta_local)
+                    return file
+
+                # Otro cliente subio entre la verificacion y nuestra subida: se recuperan sus filas
+                if intento == self.MAX_FUSIONES:
+                    break
+                print('Otra edicion llego a Drive durante la subida; fusionando de nuevo...')
+                ruta_remota = os.path.join(dir_fusion, f'interpuesta_{intento}.xlsx')
+                self._descargar_media(self.archivo_excel_id, ruta_remota, interpuesta['id'])
+                ruta_subida = os.path.join(dir_fusion, f'subida_{intento}.xlsx')
+                shutil.copyfile(ruta_mia, ruta_subida)
+                ruta_mia = self._fusionar(ruta_base, ruta_subida, ruta_remota, os.path.join(dir_fusion, f'fusion_{intento}.xlsx'))
+                ruta_base = ruta_subida
+                esperado = file.get('md5Checksum')
+
+            raise ConflictoNoResoluble(f'El Excel siguio cambiando en Drive tras {self.MAX_FUSIONES} fusiones')
+        finally:
+            shutil.rmtree(dir_fusion, ignore_errors=True)
+
+    def _revision_interpuesta(self, file, esperado):
+        """Revision anterior a la nuestra si no es la que esperabamos pisar (None si todo bien)."""
+        revisiones = []
+        token = None
+        while True:
+            respuesta = self._con_reintentos(self.service.revisions().list(
+                fileId=file['id'],
+                pageToken=token,
+                fields='nextPageToken, revisions(id, md5Checksum)'
+            ))
+            revisiones.extend(respuesta.get('revisions', []))
+            token = respuesta.get('nextPageToken')
+            if not token:
+                break
+
+        ids = [revision['id'] for revision in revisiones]
+        if file.get('headRevisionId') not in ids:
+            return None
+        indice = ids.index(file['headRevisionId'])
+        if indice == 0 or revisiones[indice - 1].get('md5Checksum') == esperado:
+            return None
+        return revisiones[indice - 1]
+
+    def _fusionar(self, ruta_base, ruta_mia, ruta_remota, ruta_salida):
+        try:
+            from excel_mensual import GeneradorExcelMensual
+            from fusion_variables import FusionVariables
+        except ModuleNotFoundError:
+            from src.excel_mensual import GeneradorExcelMensual
+            from src.fusion_variables import FusionVariables
+
+        if not ruta_base:
+            print('Advertencia: no se conserva la revision base; se unen las filas de ambos lados')
+        resumen = FusionVariables(GeneradorExcelMensual(self.config_path)).fusionar(
+            ruta_base, ruta_mia, ruta_remota, ruta_salida
+        )
+        for hoja, cambios in resumen.items():
+            if cambios.get('eliminada'):
+                print(f'  {hoja}: retirada (tambien en local)')
+                continue
+            regenerada = ', fijos y resumen reconstruidos' if cambios['regenerada'] else ''
+            print(f"  {hoja}: {cambios['agregadas']} fila(s) locales agregadas, {cambios['quitadas']} quitada(s){regenerada}")
+        return ruta_salida
+
+    def _crear_excel(self, ruta_local):
+        request = self.service.files().create(
+            body={
+                'name': self.nombre_archivo,
+                'parents': [self.carpeta_id] if self.carpeta_id else []
+            },
+            media_body=self._media_excel(ruta_local),
+            fields='id, name, mimeType, size, md5Checksum'
+        )
+        return self._subir_reanudable(request, ruta_local, self.nombre_archivo)
+
+    def _con_reintentos(self, request):
+        """Ejecuta una peticion de metadatos reintentando errores transitorios."""
+        return self.reintentos.ejecutar(request.execute)
+
+    def _subir_reanudable(self, request, ruta_local, etiqueta):
+        """Subida reanudable trozo a trozo (ver Reintentos.subir_reanudable) con progreso y log."""
+        total = os.path.getsize(ruta_local)
+        inicio = time.perf_counter()
+        reintentos = 0
+
+        def al_avanzar(_previo, status, _respuesta):
+            if status:
+                _eventos().bytes_transferidos('subida', etiqueta, status.resumable_progress, total)
+            if status and total > self.chunk_bytes:
+                print(f'Subiendo {etiqueta}... {int(status.progress() * 100)}%')
+
+        def al_reintentar(error, consecutivos, espera, reiniciada):
+            nonlocal reintentos
+            reintentos += 1
+            if reiniciada:
+                print(f'Sesion de subida expirada para {etiqueta}; reiniciando')
+            print(f'Error transitorio subiendo {etiqueta} ({error}); '
+                  f'reintento {consecutivos}/{self.reintentos.max_reintentos} desde el byte '
+                  f'{request.resumable_progress} en {espera:.1f}s')
+
+        response = self.reintentos.subir_reanudable(request, al_avanzar=al_avanzar, al_reintentar=al_reintentar)
+
+        _eventos().bytes_transferidos('subida', etiqueta, total, total)
+        segundos = max(time.perf_counter() - inicio, 1e-6)
+        print(f'Subida de {etiqueta}: {total / 1024:.0f} KB en {segundos:.2f}s '
+              f'({total / 1024 / 1024 / segundos:.2f} MB/s, {reintentos} reintento(s))')
+        return response
+
+    def descargar_excel_drive(self, ruta_destino=None, remoto=None):
+        """
+        Descarga el Excel desde Drive. Con `remoto` (metadatos recien pedidos) la
+        cache se valida por md5 en lugar de consultar la Changes API.
+        """
         if not self.service:
             print('Error: No has iniciado sesiÃ³n.')
             return False
@@ -214,67 +637,252 @@ class GoogleDriveManager:
             print('Error: No hay archivo configurado.')
             return False
         
-        if ruta_destino is None:
-            import tempfile
-            ruta_destino = os.path.join(tempfile.gettempdir(), self.nombre_archivo)
+        temporal = ruta_destino is None
+        if temporal:
+            # Un archivo por descarga: operaciones simultaneas no se pisan la copia
+            dir_control = os.path.join(tempfile.gettempdir(), 'control_gastos')
+            os.makedirs(dir_control, exist_ok=True)
+            fd, ruta_destino = tempfile.mkstemp(prefix='descarga_', suffix='.xlsx', dir=dir_control)
+            os.close(fd)
         
         try:
-            request = self.service.files().get_media(fileId=self.archivo_excel_id)
+            rastreador = self.rastreador_cambios()
+            vigente = rastreador.confirmar(remoto.get('md5Checksum')) if remoto else rastreador.revisar()
+            if vigente:
+                print('Excel sin cambios en Drive; se usa la copia en cache')
+                ruta, self.revision_base = rastreador.copiar_cache(ruta_destino)
+                return ruta
+            # El token se toma antes de descargar para no perder cambios intermedios
+            rastreador.inicializar()
             
-            with io.FileIO(ruta_destino, 'wb') as f:
-                downloader = MediaIoBaseDownload(f, request)
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-                    if status:
-                        print(f'Descargando... {int(status.progress() * 100)}%')
+            try:
+                self._descargar_media(self.archivo_excel_id, ruta_destino)
+            except HttpError as e:
+                if not self._es_no_encontrado(e) or not self._resolver_archivo_excel():
+                    raise
+                self._descargar_media(self.archivo_excel_id, ruta_destino)
             
             print(f'Archivo descargado: {ruta_destino}')
+            self.revision_base = rastreador.registrar(ruta_destino, self.archivo_excel_id)
             return ruta_destino
         except Exception as e:
             print(f'Error al descargar archivo: {e}')
+            if temporal:
+                _borrar_temporales(ruta_destino)
             return None
     
-    def verificar_excel_drive(self):
-        """Verifica si el archivo existe en Drive"""
+    def _descargar_media(self, file_id, ruta_destino, revision_id=None):
+        if revision_id:
+            request = self.service.revisions().get_media(fileId=file_id, revisionId=revision_id)
+        else:
+            request = self.service.files().get_media(fileId=file_id)
+        with io.FileIO(ruta_destino, 'wb') as f:
+            downloader = MediaIoBaseDownload(f, request)
+            done = False
+            while done is False:
+                status, done = downloader.next_chunk()
+                if status:
+                    _eventos().bytes_transferidos(
+                        'descarga', os.path.basename(ruta_destino), status.resumable_progress, status.total_size
+                    )
+                    print(f'Descargando... {int(status.progress() * 100)}%')
+
+    def verificar_excel_drive(self, forzar=False):
+        """
+        Verifica si el archivo existe en Drive. Sin `forzar` se confia en el ID
+        conocido: un 404 al descargar o subir lo vuelve a resolver.
+        """
         if not self.service or not self.archivo_excel_id:
             return False
         
+        if not forzar:
+            return True
+        
         try:
             file = self.service.files().get(fileId=self.archivo_excel_id, fields='id, name, mimeType').execute()
             print(f'Archivo verificado en Drive: {file["name"]}')
             return True
         except Exception as e:
             print(f'Archivo no encontrado en Drive: {e}')
-            self.archivo_excel_id = ''
-            self._guardar_configuracion()
+            if self._es_no_encontrado(e):
+                return bool(self._resolver_archivo_excel())
             return False
     
-    def obtener_enlace_compartido(self):
-        """Obtiene el enlace para compartir el archivo"""
-        if not self.service or not self.archivo_excel_id:
+    def subir_archivo(self, ruta_local, nombre, file_id=None, mimetype=None):
+        """Sube un archivo auxiliar a la carpeta (crea o actualiza por ID)"""
+        if not self.service:
+            print('Error: No has iniciado sesion.')
+            return None
+
+        if not os.path.exists(ruta_local):
+            print(f'Error: El archivo {ruta_local} no existe.')
+            return None
+
+        if mimetype is None:
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        try:
+            media = MediaFileUpload(ruta_local, mimetype=mimetype, chunksize=self.chunk_bytes, resumable=True)
+            if file_id:
+                request = self.service.files().update(
+                    fileId=file_id,
+                    body={'name': nombre},
+                    media_body=media,
+                    fields='id, name, size'
+                )
+            else:
+                if not self.carpeta_id:
+                    self.crear_o_obtener_carpeta()
+                request = self.service.files().create(
+                    body={'name': nombre, 'parents': [self.carpeta_id] if self.carpeta_id else []},
+                    media_body=media,
+                    fields='id, name, size'
+                )
+            file = self._subir_reanudable(request, ruta_local, nombre)
+            print(f'Archivo subido: {file["name"]} (ID: {file["id"]})')
+            return file['id']
+        except Exception as e:
+            print(f'Error al subir {nombre}: {e}')
+            return None
+
+    def descargar_archivo(self, file_id, ruta_destino):
+        """Descarga un archivo auxiliar de Drive por ID"""
+        if not self.service:
+            print('Error: No has iniciado sesion.')
+            return None
+
+        try:
+            request = self.service.files().get_media(fileId=file_id)
+            with io.FileIO(ruta_destino, 'wb') as f:
+                downloader = MediaIoBaseDownload(f, request)
+                done = False
+                while done is False:
+                    _status, done = downloader.next_chunk()
+            return ruta_destino
+        except Exception as e:
+            print(f'Error al descargar archivo {file_id}: {e}')
+            return None
+
+    def obtener_enlace_compartido(self, verificar=False, service=None, permisos=None):
+        """
+        Enlace para compartir el archivo. El permiso se crea una sola vez y queda
+        en config (google_drive.enlace_compartido); se vuelve a comprobar con
+        `verificar=True` o en segundo plano cada `reverificar_h` horas.
+        `service` permite llamarlo desde otro hilo y `permisos` reutiliza un listado previo.
+        """
+        service = service or self.service
+        if not service or not self.archivo_excel_id:
             print('Error: No hay archivo para compartir.')
             return None
         
+        cache = self.config['google_drive'].get('enlace_compartido') or {}
+        if cache.get('file_id') == self.archivo_excel_id and cache.get('enlace'):
+            if verificar:
+                return self._verificar_enlace(service, cache)
+            if self._enlace_vencido(cache):
+                with config_archivo.LOCK:
+                    lanzar = cache['file_id'] not in _REVERIFICANDO
+                    _REVERIFICANDO.add(cache['file_id'])
+                if lanzar:
+                    threading.Thread(target=self._reverificar_en_segundo_plano, args=(dict(cache),), daemon=True).start()
+            return cache['enlace']
+        
         try:
-            # Hacer el archivo compartible
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            
-            self.service.permissions().create(
-                fileId=self.archivo_excel_id,
-                body=permission
-            ).execute()
-            
-            enlace = f'https://drive.google.com/file/d/{self.archivo_excel_id}/view?usp=sharing'
-            print(f'Enlace de acceso: {enlace}')
-            return enlace
+            return self._provisionar_enlace(service, permisos)
         except Exception as e:
             print(f'Error al crear enlace: {e}')
             return None
 
+    def _enlace_vencido(self, cache):
+        horas = float(cache.get('reverificar_h', 24) or 0)
+        if horas <= 0:
+            return False
+        try:
+            verificado = datetime.fromisoformat(cache.get('verificado_en') or '')
+        except ValueError:
+            return True
+        return (datetime.now() - verificado).total_seconds() > horas * 3600
+
+    def _provisionar_enlace(self, service, permisos=None):
+        """Reutiliza un permiso anyone/reader existente o crea uno; guarda el resultado."""
+        permiso_id = None
+        if permisos is None:
+            permisos = self._con_reintentos(service.permissions().list(
+                fileId=self.archivo_excel_id,
+                fields='permissions(id, type, role)'
+            )).get('permissions', [])
+        for permiso in permisos:
+            if permiso.get('type') == 'anyone' and permiso.get('role') == 'reader':
+                permiso_id = permiso['id']
+                break
+        
+        if not permiso_id:
+            permiso_id = self._con_reintentos(service.permissions().create(
+                fileId=self.archivo_excel_id,
+                body={'type': 'anyone', 'role': 'reader'},
+                fields='id'
+            ))['id']
+        
+        enlace = f'https://drive.google.com/file/d/{self.archivo_excel_id}/view?usp=sharing'
+        self._guardar_enlace({
+            'file_id': self.archivo_excel_id,
+            'permission_id': permiso_id,
+            'enlace': enlace,
+            'verificado_en': datetime.now().isoformat(timespec='seconds'),
+        })
+        print(f'Enlace de acceso: {enlace}')
+        return enlace
+
+    def _verificar_enlace(self, service, cache):
+        """Comprueba que el permiso guardado siga existiendo; si no, lo vuelve a crear."""
+        try:
+            service.permissions().get(
+                fileId=cache['file_id'],
+                permissionId=cache.get('permission_id') or 'anyoneWithLink',
+                fields='id'
+            ).execute()
+        except HttpError as e:
+            if not self._es_no_encontrado(e):
+                print(f'No se pudo verificar el enlace compartido: {e}')
+                return cache['enlace']
+            print('El permiso del enlace compartido ya no existe; se vuelve a crear')
+            return self._provisionar_enlace(service)
+        
+        self._guardar_enlace(dict(cache, verificado_en=datetime.now().isoformat(timespec='seconds')))
+        return cache['enlace']
+
+    def _reverificar_en_segundo_plano(self, cache):
+        try:
+            # Otra instancia pudo reverificarlo mientras esta tenia la config en memoria
+            try:
+                actual = config_archivo.leer_config(self.config_path).get('google_drive', {}).get('enlace_compartido') or {}
+            except (OSError, ValueError):
+                actual = cache
+            if actual.get('file_id') == cache['file_id'] and not self._enlace_vencido(actual):
+                return
+            # httplib2 no es seguro entre hilos: servicio propio para este hilo
+            service = self._construir_servicio()
+            self._verificar_enlace(service, cache)
+        except Exception as e:
+            print(f'Error reverificando enlace compartido: {e}')
+        finally:
+            with config_archivo.LOCK:
+                _REVERIFICANDO.discard(cache['file_id'])
+
+    def _guardar_enlace(self, estado):
+        """Actualiza solo google_drive.enlace_compartido sobre la config actual en disco."""
+        with metricas.lock_medido(config_archivo.LOCK, 'config'):
+            try:
+                config = config_archivo.leer_config(self.config_path)
+            except (OSError, ValueError):
+                config = self.config
+            anterior = config.setdefault('google_drive', {}).get('enlace_compartido') or {}
+            if 'reverificar_h' in anterior:
+                estado.setdefault('reverificar_h', anterior['reverificar_h'])
+            config['google_drive']['enlace_compartido'] = estado
+            config_archivo.escribir_config(self.config_path, config)
+            self.config['google_drive']['enlace_compartido'] = estado
+
 def _resolver_mes_objetivo(month_mode='actual'):
     """Resolver el mes objetivo: actual, siguiente o YYYY-MM."""
     modo = str(month_mode or 'actual').strip().lower()
@@ -345,12 +953,27 @@ def _calcular_ingresos_extra_mes(config, clave_mes):
     return total, count
 
 
+class FalloSincronizacion(Exception):
+    """Etapa de la sincronizacion que no pudo completarse; el mensaje va al resultado."""
+
+
 def sincronizar_con_drive(config_path='config/configuracion.json', month_mode='actual'):
-    """Sincronizar Excel con Drive creando/actualizando la hoja del mes objetivo."""
+    """
+    Sincronizar Excel con Drive creando/actualizando la hoja del mes objetivo.
+    Las etapas corren como un grafo de dependencias (src/grafo_tareas.py):
+    - los metadatos (Excel, carpeta, permisos, token de cambios) van en un solo batch
+    - mientras tanto se reconstruye la hoja sobre la copia en cache; si Drive
+      confirma que la cache sigue vigente no hace falta descargar ni reconstruir
+    - el enlace compartido se resuelve en paralelo con la subida
+    El resultado incluye `etapas` con inicio y duracion (ms) de cada una; las
+    etapas y los bytes descargados/subidos tambien se publican en src/eventos.py.
+    """
     try:
-        from excel_mensual import GeneradorExcelMensual
+        from grafo_tareas import GrafoTareas
+        from particiones_excel import GestorParticionesExcel
     except ModuleNotFoundError:
-        from src.excel_mensual import GeneradorExcelMensual
+        from src.grafo_tareas import GrafoTareas
+        from src.particiones_excel import GestorParticionesExcel
     import openpyxl
 
     print('=' * 60)
@@ -363,53 +986,152 @@ def sincronizar_con_drive(config_path='config/configuracion.json', month_mode='a
     hoja_objetivo = target['hoja_objetivo']
     clave_mes = target['clave_mes']
     month_mode = target['month_mode']
+    anio_caliente = min(datetime.now().year, anio_objetivo)
 
     drive = GoogleDriveManager(config_path)
-    excel_gen = GeneradorExcelMensual(config_path)
+    excel_existia = bool(drive.archivo_excel_id)
 
-    if not drive.autenticar():
-        msg = 'No se pudo autenticar con Drive'
-        print(f'Error: {msg}')
-        return {'success': False, 'message': msg}
+    def _autenticar(r):
+        if not drive.autenticar():
+            raise FalloSincronizacion('No se pudo autenticar con Drive')
 
-    carpeta_id = drive.crear_o_obtener_carpeta()
-    if not carpeta_id:
-        msg = 'No se pudo crear/obtener carpeta en Drive'
-        print(f'Error: {msg}')
-        return {'success': False, 'message': msg}
+    def _preparar(r):
+        particiones = GestorParticionesExcel(drive, config_path)
+        if particiones.esta_archivado(anio_objetivo):
+            raise FalloSincronizacion(
+                f'El anio {anio_objetivo} esta archivado en {particiones._nombre_archivado(anio_objetivo)} y es de solo lectura'
+            )
+        return particiones
 
-    wb = None
-    archivo_existente = False
-    hoja_ya_existia = False
+    def _metadatos(r):
+        metadatos = drive.metadatos_sincronizacion()
+        if not metadatos:
+            raise FalloSincronizacion('No se pudo crear/obtener carpeta en Drive')
+        return metadatos
 
-    if drive.archivo_excel_id and drive.verificar_excel_drive():
+    def _especular(r):
+        """Reconstruye sobre la copia en cache antes de saber si sigue vigente."""
+        particiones = r['preparar']
+        rastreador = drive.rastreador_cambios()
+        md5 = rastreador.copia_vigente()
+        if not md5:
+            return None
+        try:
+            with open(rastreador.ruta_cache, 'rb') as f:
+                datos = f.read()
+            if hashlib.md5(datos).hexdigest() != md5:
+                return None
+            with metricas.DURACION_LIBRO.medir('cargar'):
+                wb = openpyxl.load_workbook(io.BytesIO(datos))
+            if any(anio < anio_caliente for anio in particiones.hojas_por_anio(wb.sheetnames)):
+                # Archivar anios cerrados sube libros a Drive: no se hace a ciegas
+                return None
+            hoja_ya_existia = hoja_objetivo in wb.sheetnames or mes_nombre in wb.sheetnames
+            particiones.generador.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio_objetivo)
+            ruta = particiones.generador.guardar_excel_temporal(wb, 'ControlDeGastos_cache.xlsx')
+        except Exception as e:
+            print(f'Reconstruccion anticipada descartada: {e}')
+            return None
+        return {'md5': md5, 'ruta': ruta, 'hoja_ya_existia': hoja_ya_existia}
+
+    def _descargar(r):
+        remoto = r['metadatos']['excel']
+        if not remoto:
+            return None
         print('')
         print('Archivo existente encontrado en Drive')
-        print('Descargando para actualizar...')
-        ruta_temp = drive.descargar_excel_drive()
+        return drive.descargar_excel_drive(remoto=remoto)
+
+    def _libro(r):
+        particiones = r['preparar']
+        excel_gen = particiones.generador
+        ruta_temp = r['descargar']
+        especulado = r['especular']
+        if ruta_temp and especulado and especulado['md5'] == drive.revision_base:
+            print(f'Hoja objetivo preparada: {hoja_objetivo} (sobre la copia en cache)')
+            return {
+                'ruta': especulado['ruta'],
+                'archivo_existente': True,
+                'hoja_ya_existia': especulado['hoja_ya_existia'],
+                'anios_archivados': [],
+            }
+
+        wb = None
+        archivo_existente = False
+        anios_archivados = []
         if ruta_temp:
-            wb = openpyxl.load_workbook(ruta_temp)
+            print('Actualizando el archivo descargado...')
+            with metricas.DURACION_LIBRO.medir('cargar'):
+                wb = openpyxl.load_workbook(ruta_temp)
             archivo_existente = True
             hoja_ya_existia = hoja_objetivo in wb.sheetnames or mes_nombre in wb.sheetnames
+            anios_archivados = particiones.archivar_anios_cerrados(wb, ruta_temp, anio_caliente)
+        else:
+            print('')
+            print('Creando nuevo archivo Excel base...')
+            wb = excel_gen.crear_excel_nuevo()
+            hoja_ya_existia = hoja_objetivo in wb.sheetnames or mes_nombre in wb.sheetnames
 
-    if wb is None:
-        print('')
-        print('Creando nuevo archivo Excel base...')
-        wb = excel_gen.crear_excel_nuevo()
-        hoja_ya_existia = hoja_objetivo in wb.sheetnames or mes_nombre in wb.sheetnames
+        excel_gen.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio_objetivo)
+        print(f'Hoja objetivo preparada: {hoja_objetivo}')
+        return {
+            'ruta': excel_gen.guardar_excel_temporal(wb),
+            'archivo_existente': archivo_existente,
+            'hoja_ya_existia': hoja_ya_existia,
+            'anios_archivados': anios_archivados,
+        }
 
-    excel_gen.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio_objetivo)
-    print(f'Hoja objetivo preparada: {hoja_objetivo}')
-    ruta_nueva = excel_gen.guardar_excel_temporal(wb)
+    def _subir(r):
+        libro = r['libro']
+        remoto = r['metadatos']['excel']
+        # La verificacion del batch solo sirve si describe la revision que se uso de base
+        if not remoto or remoto.get('md5Checksum') != drive.revision_base:
+            remoto = None
+        file_id = drive.subir_excel_drive(libro['ruta'], actualizar=libro['archivo_existente'], remoto=remoto)
+        if not file_id:
+            raise FalloSincronizacion('No se pudo subir el archivo a Drive')
+        return file_id
 
-    file_id = drive.subir_excel_drive(ruta_nueva, actualizar=archivo_existente)
-    if not file_id:
-        msg = 'No se pudo subir el archivo a Drive'
-        print(f'Error: {msg}')
-        return {'success': False, 'message': msg}
+    def _enlace(r):
+        metadatos = r['metadatos']
+        if 'subir' not in r and not metadatos['excel']:
+            return None
+        # httplib2 no es seguro entre hilos: servicio propio mientras corre la subida
+        return drive.obtener_enlace_compartido(service=drive._construir_servicio(), permisos=metadatos['permisos'])
 
-    enlace = drive.obtener_enlace_compartido()
-    ingresos_extra_total, ingresos_extra_count = _calcular_ingresos_extra_mes(excel_gen.config, clave_mes)
+    grafo = GrafoTareas(contexto_tarea=_eventos().etapa)
+    grafo.agregar('autenticar', _autenticar)
+    grafo.agregar('preparar', _preparar)
+    grafo.agregar('metadatos', _metadatos, depende=('autenticar',))
+    grafo.agregar('especular', _especular, depende=('preparar',))
+    grafo.agregar('descargar', _descargar, depende=('metadatos',))
+    grafo.agregar('libro', _libro, depende=('preparar', 'especular', 'descargar'))
+    grafo.agregar('subir', _subir, depende=('libro', 'metadatos'))
+    # Con el Excel ya en Drive el enlace no espera a la subida
+    grafo.agregar('enlace', _enlace, depende=('metadatos',) if excel_existia else ('subir',))
+
+    try:
+        with escritura_excel():
+            r = grafo.ejecutar()
+    except FalloSincronizacion as e:
+        print(f'Error: {e}')
+        return {'success': False, 'message': str(e), 'etapas': grafo.tiempos}
+    finally:
+        resultados = grafo.resultados
+        _borrar_temporales(
+            resultados.get('descargar'),
+            (resultados.get('especular') or {}).get('ruta'),
+            (resultados.get('libro') or {}).get('ruta'),
+        )
+
+    libro = r['libro']
+    file_id = r['subir']
+    enlace = r['enlace']
+    cache_enlace = drive.config['google_drive'].get('enlace_compartido') or {}
+    if not enlace or cache_enlace.get('file_id') != file_id:
+        # El Excel se creo o se resolvio de nuevo durante la subida
+        enlace = drive.obtener_enlace_compartido()
+    ingresos_extra_total, ingresos_extra_count = _calcular_ingresos_extra_mes(r['preparar'].generador.config, clave_mes)
 
     print('')
     print('=' * 60)
@@ -421,6 +1143,7 @@ def sincronizar_con_drive(config_path='config/configuracion.json', month_mode='a
     print('')
     print('El archivo se guardo en la carpeta: ControlDeGastos')
     print(f'Con la hoja: {hoja_objetivo}')
+    print('Etapas: ' + ', '.join(f"{nombre} {t['ms']:.0f} ms" for nombre, t in grafo.tiempos.items()))
 
     return {
         'success': True,
@@ -428,15 +1151,101 @@ def sincronizar_con_drive(config_path='config/configuracion.json', month_mode='a
         'month_mode': month_mode,
         'hoja_objetivo': hoja_objetivo,
         'mes_clave': clave_mes,
-        'hoja_creada': not hoja_ya_existia,
-        'archivo_existente': archivo_existente,
+        'hoja_creada': not libro['hoja_ya_existia'],
+        'archivo_existente': libro['archivo_existente'],
         'file_id': file_id,
         'enlace': enlace,
         'ingresos_extra_total': ingresos_extra_total,
         'ingresos_extra_count': ingresos_extra_count,
+        'anios_archivados': libro['anios_archivados'],
+        'etapas': grafo.tiempos,
     }
 
 
+
+def regenerar_rango_con_drive(config_path='config/configuracion.json', desde=None, hasta=None, workers=None):
+    """Regenerar en paralelo las hojas de un rango de meses (YYYY-MM) y subir el Excel una sola vez."""
+    try:
+        from particiones_excel import GestorParticionesExcel
+        from regeneracion_meses import RegeneradorMeses
+    except ModuleNotFoundError:
+        from src.particiones_excel import GestorParticionesExcel
+        from src.regeneracion_meses import RegeneradorMeses
+
+    try:
+        inicio = datetime.strptime(desde, '%Y-%m')
+        fin = datetime.strptime(hasta or desde, '%Y-%m')
+    except (TypeError, ValueError):
+        msg = 'Rango invalido: use desde/hasta con formato YYYY-MM'
+        print(f'Error: {msg}')
+        return {'success': False, 'message': msg}
+    if inicio > fin:
+        inicio, fin = fin, inicio
+    desde, hasta = inicio.strftime('%Y-%m'), fin.strftime('%Y-%m')
+
+    print('=' * 60)
+    print(f'REGENERACION DE HOJAS {desde} a {hasta}')
+    print('=' * 60)
+
+    drive = GoogleDriveManager(config_path)
+    if not drive.autenticar():
+        msg = 'No se pudo autenticar con Drive'
+        print(f'Error: {msg}')
+        return {'success': False, 'message': msg}
+
+    if not drive.crear_o_obtener_carpeta():
+        msg = 'No se pudo crear/obtener carpeta en Drive'
+        print(f'Error: {msg}')
+        return {'success': False, 'message': msg}
+
+    if not (drive.archivo_excel_id and drive.verificar_excel_drive()):
+        msg = 'No hay Excel en Drive para regenerar; sincronice primero un mes'
+        print(f'Error: {msg}')
+        return {'success': False, 'message': msg}
+
+    particiones = GestorParticionesExcel(drive, config_path)
+    anios_omitidos = [a for a in range(inicio.year, fin.year + 1) if particiones.esta_archivado(a)]
+    if anios_omitidos:
+        print(f'Anios archivados (solo lectura) fuera de la regeneracion: {anios_omitidos}')
+
+    with escritura_excel():
+        ruta_temp = drive.descargar_excel_drive()
+        try:
+            if not ruta_temp:
+                msg = 'No se pudo descargar el Excel de Drive'
+                print(f'Error: {msg}')
+                return {'success': False, 'message': msg}
+
+            resultado = RegeneradorMeses(config_path, workers).regenerar(ruta_temp, desde, hasta)
+            if not resultado['hojas']:
+                msg = 'No hay hojas del rango en el libro caliente'
+                print(msg)
+                return {'success': True, 'message': msg, 'hojas': [], 'anios_omitidos': anios_omitidos}
+
+            print(f"{len(resultado['hojas'])} hoja(s) regeneradas ({resultado['modo']}, "
+                  f"{resultado['workers']} worker(s)) en {resultado['segundos']}s")
+
+            file_id = drive.subir_excel_drive(ruta_temp, actualizar=True)
+            if not file_id:
+                msg = 'No se pudo subir el archivo a Drive'
+                print(f'Error: {msg}')
+                return {'success': False, 'message': msg}
+        finally:
+            _borrar_temporales(ruta_temp)
+
+    return {
+        'success': True,
+        'message': 'Regeneracion completada',
+        'desde': desde,
+        'hasta': hasta,
+        'hojas': resultado['hojas'],
+        'modo': resultado['modo'],
+        'workers': resultado['workers'],
+        'segundos': resultado['segundos'],
+        'anios_omitidos': anios_omitidos,
+        'file_id': file_id,
+    }
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Sincronizar Excel con Google Drive')
@@ -445,7 +1254,26 @@ if __name__ == '__main__':
         default='actual',
         help='Mes objetivo: actual, siguiente o YYYY-MM',
     )
+    parser.add_argument(
+        '--regenerar',
+        nargs=2,
+        metavar=('DESDE', 'HASTA'),
+        help='Regenerar en paralelo las hojas de un rango YYYY-MM YYYY-MM',
+    )
+    parser.add_argument('--workers', type=int, default=None, help='Procesos para --regenerar')
+    parser.add_argument(
+        '--verificar-enlace',
+        action='store_true',
+        help='Comprobar en Drive el permiso del enlace compartido guardado',
+    )
     args = parser.parse_args()
-    result = sincronizar_con_drive(month_mode=args.month_mode)
+    if args.verificar_enlace:
+        drive = GoogleDriveManager()
+        enlace = drive.obtener_enlace_compartido(verificar=True) if drive.autenticar() else None
+        result = {'success': bool(enlace), 'enlace': enlace}
+    elif args.regenerar:
+        result = regenerar_rango_con_drive(desde=args.regenerar[0], hasta=args.regenerar[1], workers=args.workers)
+    else:
+        result = sincronizar_con_drive(month_mode=args.month_mode)
     if not result.get('success'):
         raise SystemExit(1)
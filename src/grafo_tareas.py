@@ -0,0 +1,81 @@
+import contextlib
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class GrafoTareas:
+    """
+    Ejecuta un grafo pequeno de tareas con dependencias en un pool de hilos:
+    - cada tarea arranca en cuanto terminan sus dependencias
+    - la funcion de una tarea recibe el dict de resultados ya disponibles
+    - si una tarea falla no se arranca ninguna otra; se espera a las que corren
+      y se relanza el primer error
+    Registra inicio y duracion de cada tarea (ms desde ejecutar()).
+    `contexto_tarea(nombre)`, si se indica, envuelve cada tarea (p. ej.
+    eventos.etapa); las tareas corren con una copia del contexto de ejecutar().
+    """
+
+    def __init__(self, workers=4, contexto_tarea=None):
+        self.workers = workers
+        self.contexto_tarea = contexto_tarea
+        self._tareas = {}
+        self.resultados = {}
+        self.tiempos = {}
+        self._lock = threading.Lock()
+
+    def agregar(self, nombre, funcion, depende=()):
+        # Las dependencias deben existir antes: asi el grafo nunca tiene ciclos
+        for dependencia in depende:
+            if dependencia not in self._tareas:
+                raise ValueError(f'La tarea {nombre} depende de {dependencia}, que no existe')
+        self._tareas[nombre] = (funcion, tuple(depende))
+        return self
+
+    def _correr(self, nombre, funcion, inicio_grafo):
+        inicio = time.perf_counter()
+        contexto = self.contexto_tarea(nombre) if self.contexto_tarea else contextlib.nullcontext()
+        try:
+            with contexto:
+                return funcion(self.resultados)
+        finally:
+            fin = time.perf_counter()
+            with self._lock:
+                self.tiempos[nombre] = {
+                    'inicio_ms': round((inicio - inicio_grafo) * 1000, 1),
+                    'ms': round((fin - inicio) * 1000, 1),
+                }
+
+    def ejecutar(self):
+        """Corre todas las tareas; devuelve {nombre: resultado}."""
+        inicio_grafo = time.perf_counter()
+        pendientes = dict(self._tareas)
+        en_curso = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='grafo') as pool:
+            while pendientes or en_curso:
+                if error is None:
+                    for nombre, (funcion, depende) in list(pendientes.items()):
+                        if all(d in self.resultados for d in depende):
+                            del pendientes[nombre]
+                            contexto = contextvars.copy_context()
+                            futuro = pool.submit(contexto.run, self._correr, nombre, funcion, inicio_grafo)
+                            en_curso[futuro] = nombre
+                if not en_curso:
+                    break
+
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    nombre = en_curso.pop(futuro)
+                    try:
+                        self.resultados[nombre] = futuro.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+
+        self.tiempos['total'] = {'inicio_ms': 0.0, 'ms': round((time.perf_counter() - inicio_grafo) * 1000, 1)}
+        if error is not None:
+            raise error
+        return self.resultados
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+
+
+class RegistroIdempotencia:
+    """
+    Claves de idempotencia ya aplicadas, con el resultado que se respondio:
+    reenviar un lote (el celular reintenta tras perder la conexion) no duplica gastos.
+    - reservar() marca la clave en curso: dos lotes con la misma clave a la vez
+      no la aplican dos veces; la segunda recibe estado 'en_proceso' y debe
+      reintentar, porque la primera aun puede fallar y soltar la clave
+    - confirmar() la guarda en disco (escritura atomica); liberar() la suelta
+      si el mensaje fallo, para que el reintento si se aplique
+    - las claves vencen a los `vigencia_dias` y se guardan como mucho MAX_CLAVES
+    - se guardan en logs/ junto al resto del estado persistente: sobreviven a un
+      reinicio del servidor (el directorio temporal no)
+    """
+
+    MAX_CLAVES = 5000
+
+    def __init__(self, ruta=None, vigencia_dias=7):
+        if ruta is None:
+            ruta = os.path.join('logs', 'idempotencia_bot.json')
+        self.ruta = ruta
+        self.vigencia_s = vigencia_dias * 86400
+        self._lock = threading.Lock()
+        self._claves = None
+        self._en_curso = set()
+
+    def _cargar(self):
+        if self._claves is not None:
+            return
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                self._claves = json.load(f)
+        except (OSError, ValueError):
+            self._claves = {}
+
+    def _guardar(self):
+        limite = time.time() - self.vigencia_s
+        vigentes = sorted(
+            ((clave, dato) for clave, dato in self._claves.items() if dato.get('ts', 0) >= limite),
+            key=lambda par: par[1]['ts'],
+        )
+        self._claves = dict(vigentes[-self.MAX_CLAVES:])
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = f'{self.ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self._claves, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+    def reservar(self, clave):
+        """
+        None si la clave es nueva (queda en curso); si ya se aplico, lo registrado
+        para ella; si otra peticion la esta aplicando, {'estado': 'en_proceso', ...}.
+        """
+        with self._lock:
+            self._cargar()
+            dato = self._claves.get(clave)
+            if dato is not None and dato.get('ts', 0) >= time.time() - self.vigencia_s:
+                return dato
+            if clave in self._en_curso:
+                return {'estado': 'en_proceso', 'respuesta': 'Mensaje en proceso en otra peticion, reintenta mas tarde'}
+            self._en_curso.add(clave)
+            return None
+
+    def confirmar(self, resultados):
+        """Guarda {clave: resultado} de una vez y las saca de en curso."""
+        if not resultados:
+            return
+        with self._lock:
+            self._cargar()
+            ahora = time.time()
+            for clave, resultado in resultados.items():
+                self._claves[clave] = dict(resultado, ts=ahora)
+                self._en_curso.discard(clave)
+            self._guardar()
+
+    def liberar(self, claves):
+        with self._lock:
+            self._en_curso.difference_update(claves)
@@ -0,0 +1,264 @@
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+# Segundos: de 1 ms (parche XML, config en cache) a 1 min (sync completa con red lenta)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# El parser de mensajes tarda cientos de microsegundos
+BUCKETS_PARSER = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def _numero(valor):
+    if valor == math.inf:
+        return '+Inf'
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor)
+
+
+class Metrica:
+    TIPO = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, valores):
+        if len(valores) != len(self.etiquetas):
+            raise ValueError(f'{self.nombre} espera las etiquetas {self.etiquetas}')
+        return tuple(str(v) for v in valores)
+
+    def _lineas(self):
+        raise NotImplementedError
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.TIPO}']
+        lineas.extend(self._lineas())
+        return '\n'.join(lineas)
+
+
+class Contador(Metrica):
+    TIPO = 'counter'
+
+    def inc(self, *etiquetas, valor=1):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def valor(self, *etiquetas):
+        with self._lock:
+            return self._valores.get(self._clave(etiquetas), 0)
+
+    def _lineas(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        return [f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}' for clave, v in valores]
+
+
+class Histograma(Metrica):
+    TIPO = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(sorted(buckets))
+
+    def observar(self, valor, *etiquetas):
+        clave = self._clave(etiquetas)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # [conteo por bucket (sin acumular) ..., +Inf, suma]
+                serie = self._valores[clave] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += valor
+
+    @contextlib.contextmanager
+    def medir(self, *etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *etiquetas)
+
+    def _lineas(self):
+        with self._lock:
+            valores = sorted((clave, list(serie)) for clave, serie in self._valores.items())
+        lineas = []
+        for clave, serie in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (math.inf,), serie[:-1]):
+                acumulado += conteo
+                le = _etiquetas(self.etiquetas, clave, [('le', _numero(limite))])
+                lineas.append(f'{self.nombre}_bucket{le} {acumulado}')
+            base = _etiquetas(self.etiquetas, clave)
+            lineas.append(f'{self.nombre}_sum{base} {_numero(serie[-1])}')
+            lineas.append(f'{self.nombre}_count{base} {acumulado}')
+        return lineas
+
+
+class Medidor(Metrica):
+    """Valor que se lee al exponer: `funcion()` devuelve un numero o {tupla de etiquetas: numero}."""
+
+    TIPO = 'gauge'
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def _lineas(self):
+        try:
+            valores = self.funcion()
+        except Exception:
+            return []
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        return [f'{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(v)}' for clave, v in sorted(valores.items())]
+
+
+class RegistroMetricas:
+    """
+    Metricas del proceso en memoria, expuestas en formato de texto de Prometheus.
+    Registrar una metrica con un nombre ya usado devuelve la existente.
+    """
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, *args, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, *args, **kwargs)
+            return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, buckets=buckets)
+
+    def medidor(self, nombre, ayuda, funcion, etiquetas=()):
+        medidor = self._registrar(Medidor, nombre, ayuda, funcion, etiquetas)
+        medidor.funcion = funcion
+        return medidor
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return '\n'.join(metrica.exponer() for metrica in metricas) + '\n'
+
+
+REGISTRO = RegistroMetricas()
+
+PETICIONES_HTTP = REGISTRO.contador(
+    'control_gastos_http_peticiones_total', 'Peticiones HTTP atendidas', ('metodo', 'ruta', 'estado'))
+DURACION_HTTP = REGISTRO.histograma(
+    'control_gastos_http_peticion_segundos', 'Duracion de las peticiones HTTP', ('metodo', 'ruta', 'estado'))
+RECHAZOS_POOL = REGISTRO.contador(
+    'control_gastos_pool_rechazos_total', 'Peticiones rechazadas con 503 por pool saturado', ('pool',))
+RECHAZOS_CONEXION = REGISTRO.contador(
+    'control_gastos_http_conexiones_rechazadas_total', 'Conexiones rechazadas con 503 por limite de conexiones', ('modo',))
+ESPERA_LOCK = REGISTRO.histograma(
+    'control_gastos_lock_espera_segundos', 'Espera hasta tomar un lock', ('lock',))
+CONTENCION_LOCK = REGISTRO.contador(
+    'control_gastos_lock_contencion_total', 'Veces que un lock ya estaba tomado al pedirlo', ('lock',))
+PETICIONES_DRIVE = REGISTRO.contador(
+    'control_gastos_drive_peticiones_total', 'Peticiones HTTP a la API de Drive', ('tipo', 'estado'))
+DURACION_DRIVE = REGISTRO.histograma(
+    'control_gastos_drive_peticion_segundos', 'Duracion de las peticiones a la API de Drive', ('tipo',))
+BYTES_DRIVE = REGISTRO.contador(
+    'control_gastos_drive_bytes_total', 'Bytes enviados a / recibidos de Drive', ('direccion',))
+LOTE_ESCRITURA = REGISTRO.histograma(
+    'control_gastos_escritura_lote_pedidos', 'Pedidos aplicados juntos en una escritura agrupada', ('recurso',),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+DURACION_LIBRO = REGISTRO.histograma(
+    'control_gastos_libro_segundos', 'Carga y guardado de libros Excel', ('operacion',))
+MENSAJES_PARSER = REGISTRO.contador(
+    'control_gastos_parser_mensajes_total', 'Mensajes procesados por el parser del bot')
+GASTOS_PARSER = REGISTRO.contador(
+    'control_gastos_parser_gastos_total', 'Gastos extraidos por el parser del bot')
+CARACTERES_PARSER = REGISTRO.contador(
+    'control_gastos_parser_caracteres_total', 'Caracteres de mensaje procesados por el parser del bot')
+DURACION_PARSER = REGISTRO.histograma(
+    'control_gastos_parser_segundos', 'Duracion del parseo de un mensaje', buckets=BUCKETS_PARSER)
+
+
+@contextlib.contextmanager
+def lock_medido(lock, nombre):
+    """Toma `lock` registrando la espera (y si estaba ocupado) bajo la etiqueta `nombre`."""
+    if lock.acquire(blocking=False):
+        ESPERA_LOCK.observar(0.0, nombre)
+    else:
+        CONTENCION_LOCK.inc(nombre)
+        inicio = time.perf_counter()
+        lock.acquire()
+        ESPERA_LOCK.observar(time.perf_counter() - inicio, nombre)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def _tipo_peticion_drive(uri, method):
+    if '/batch/' in uri:
+        return 'batch'
+    if '/upload/' in uri:
+        return 'subida'
+    if 'alt=media' in uri:
+        return 'descarga'
+    return 'metadatos' if method == 'GET' else 'api'
+
+
+class HttpMedido:
+    """
+    Envuelve el transporte HTTP de googleapiclient (httplib2 / AuthorizedHttp o el
+    Drive simulado) y cuenta peticiones, duracion y bytes por tipo.
+    """
+
+    def __init__(self, http):
+        self._http = http
+
+    def __getattr__(self, nombre):
+        return getattr(self._http, nombre)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        tipo = _tipo_peticion_drive(uri, method)
+        inicio = time.perf_counter()
+        try:
+            resp, content = self._http.request(uri, method=method, body=body, headers=headers, **kwargs)
+        except Exception:
+            PETICIONES_DRIVE.inc(tipo, 'error')
+            raise
+        finally:
+            DURACION_DRIVE.observar(time.perf_counter() - inicio, tipo)
+        PETICIONES_DRIVE.inc(tipo, str(getattr(resp, 'status', '')))
+        if isinstance(body, (bytes, str)):
+            BYTES_DRIVE.inc('enviados', valor=len(body))
+        elif body is not None:
+            # Trozos de subida como stream: el largo viene en la cabecera
+            largo = {k.lower(): v for k, v in (headers or {}).items()}.get('content-length')
+            if largo and str(largo).isdigit():
+                BYTES_DRIVE.inc('enviados', valor=int(largo))
+        if content:
+            BYTES_DRIVE.inc('recibidos', valor=len(content))
+        return resp, content
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from datetime import datetime
+
+import openpyxl
+
+try:
+    from excel_mensual import GeneradorExcelMensual
+except ModuleNotFoundError:
+    from src.excel_mensual import GeneradorExcelMensual
+
+
+class GestorParticionesExcel:
+    """
+    Particion del Excel de Drive por anio:
+    - libro caliente: ControlDeGastos.xlsx (anio en curso y posteriores), el unico que se escribe
+    - libros archivados: ControlDeGastos_YYYY.xlsx, inmutables una vez subidos
+    El manifiesto vive en config (google_drive.particiones) y se replica en Drive.
+    """
+
+    NOMBRE_MANIFIESTO = 'manifiesto_particiones.json'
+    PATRON_HOJA = re.compile(r'^(?P<mes>[A-Za-z]+) (?P<anio>\d{4})$')
+
+    def __init__(self, drive, config_path='config/configuracion.json'):
+        self.drive = drive
+        self.config_path = config_path
+        self.generador = GeneradorExcelMensual(config_path)
+        self.cache_dir = os.path.join(tempfile.gettempdir(), 'control_gastos', 'particiones')
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        gd = self.drive.config.setdefault('google_drive', {})
+        manifiesto = gd.get('particiones')
+        if not isinstance(manifiesto, dict):
+            manifiesto = {}
+        manifiesto.setdefault('version', 1)
+        manifiesto.setdefault('manifiesto_id', '')
+        if not isinstance(manifiesto.get('archivados'), dict):
+            manifiesto['archivados'] = {}
+        gd['particiones'] = manifiesto
+        self.manifiesto = manifiesto
+
+    def _nombre_archivado(self, anio):
+        base, ext = os.path.splitext(self.drive.nombre_archivo)
+        return f'{base}_{anio}{ext}'
+
+    def anio_de_hoja(self, nombre_hoja):
+        """Anio de una hoja "Mes YYYY"; None para hojas legacy o ajenas al layout."""
+        match = self.PATRON_HOJA.match(str(nombre_hoja or '').strip())
+        if not match or match.group('mes') not in self.generador.MESES:
+            return None
+        return int(match.group('anio'))
+
+    def hojas_por_anio(self, nombres_hojas):
+        por_anio = {}
+        for nombre in nombres_hojas:
+            anio = self.anio_de_hoja(nombre)
+            if anio is not None:
+                por_anio.setdefault(anio, []).append(nombre)
+        return por_anio
+
+    def esta_archivado(self, anio):
+        return str(anio) in self.manifiesto['archivados']
+
+    def _sha256(self, ruta):
+        h = hashlib.sha256()
+        with open(ruta, 'rb') as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloque)
+        return h.hexdigest()
+
+    def _guardar_manifiesto(self):
+        self.manifiesto['actualizado_en'] = datetime.now().isoformat(timespec='seconds')
+        self.drive._guardar_configuracion({'google_drive': {'particiones': self.manifiesto}})
+
+        ruta = os.path.join(self.cache_dir, self.NOMBRE_MANIFIESTO)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.manifiesto, f, indent=2, ensure_ascii=False)
+
+        manifiesto_id = self.drive.subir_archivo(
+            ruta,
+            self.NOMBRE_MANIFIESTO,
+            file_id=self.manifiesto.get('manifiesto_id') or None,
+            mimetype='application/json',
+        )
+        if manifiesto_id and manifiesto_id != self.manifiesto.get('manifiesto_id'):
+            self.manifiesto['manifiesto_id'] = manifiesto_id
+            self.drive._guardar_configuracion({'google_drive': {'particiones': self.manifiesto}})
+
+    def archivar_anios_cerrados(self, wb, ruta_origen, anio_caliente=None):
+        """
+        Mueve las hojas de anios anteriores al caliente a su libro archivado.
+        `ruta_origen` es el archivo descargado (sin modificar) del que sale la copia.
+        Devuelve la lista de anios archivados en esta llamada.
+        """
+        if anio_caliente is None:
+            anio_caliente = datetime.now().year
+
+        por_anio = self.hojas_por_anio(wb.sheetnames)
+        cerrados = sorted(anio for anio in por_anio if anio < anio_caliente)
+        if not cerrados:
+            return []
+
+        nuevos = [anio for anio in cerrados if not self.esta_archivado(anio)]
+        entradas = self._crear_archivos_anios({anio: por_anio[anio] for anio in nuevos}, ruta_origen)
+        self.precargar_archivados([anio for anio in cerrados if anio not in nuevos])
+
+        archivados = []
+        for anio in cerrados:
+            hojas = por_anio[anio]
+            if self.esta_archivado(anio):
+                # Solo se retira lo que el archivo ya tiene igual: una hoja editada o
+                # agregada despues de archivar se perderia
+                distintas = self._hojas_distintas_del_archivado(wb, anio, hojas)
+                if distintas:
+                    print(f'Hojas de {anio} distintas del libro archivado, se mantienen en el libro caliente: {distintas}')
+                hojas = [nombre for nombre in hojas if nombre not in distintas]
+                if hojas:
+                    print(f'Hojas de {anio} ya archivadas, se retiran del libro caliente: {hojas}')
+            else:
+                entrada = entradas.get(anio)
+                if not entrada:
+                    print(f'No se pudo archivar {anio}; sus hojas se mantienen en el libro caliente')
+                    continue
+                self.manifiesto['archivados'][str(anio)] = entrada
+                archivados.append(anio)
+
+            for nombre in hojas:
+                wb.remove(wb[nombre])
+
+        if wb.sheetnames:
+            wb.active = 0
+        if archivados:
+            self._guardar_manifiesto()
+        return archivados
+
+    @staticmethod
+    def _valores_hoja(ws):
+        """Valores de la hoja sin las celdas vacias del final (filas y columnas); '' cuenta como vacia."""
+        filas = []
+        for fila in ws.iter_rows(values_only=True):
+            fila = [None if valor == '' else valor for valor in fila]
+            while fila and fila[-1] is None:
+                fila.pop()
+            filas.append(fila)
+        while filas and not filas[-1]:
+            filas.pop()
+        return filas
+
+    def _hojas_distintas_del_archivado(self, wb, anio, hojas):
+        """Hojas de `hojas` que no estan, o no estan iguales, en el libro archivado de `anio`."""
+        ruta = self.ruta_archivado_local(anio)
+        if not ruta:
+            print(f'No se pudo leer el libro archivado de {anio} para compararlo')
+            return list(hojas)
+        wb_archivo = openpyxl.load_workbook(ruta, read_only=True)
+        try:
+            return [
+                nombre for nombre in hojas
+                if nombre not in wb_archivo.sheetnames
+                or self._valores_hoja(wb[nombre]) != self._valores_hoja(wb_archivo[nombre])
+            ]
+        finally:
+            wb_archivo.close()
+
+    def _crear_archivos_anios(self, hojas_por_anio, ruta_origen):
+        """Genera los libros archivados y los sube en paralelo; devuelve {anio: entrada}."""
+        if not hojas_por_anio:
+            return {}
+        if not self.drive.carpeta_id:
+            self.drive.crear_o_obtener_carpeta()
+
+        trabajos = []
+        for anio, hojas in hojas_por_anio.items():
+            nombre = self._nombre_archivado(anio)
+            ruta = os.path.join(self.cache_dir, nombre)
+
+            wb_archivo = openpyxl.load_workbook(ruta_origen)
+            for nombre_hoja in list(wb_archivo.sheetnames):
+                if nombre_hoja not in hojas:
+                    wb_archivo.remove(wb_archivo[nombre_hoja])
+            wb_archivo.active = 0
+            wb_archivo.save(ruta)
+            print(f'Archivando {len(hojas)} hoja(s) de {anio} en {nombre}...')
+            trabajos.append({
+                'anio': anio,
+                'ruta': ruta,
+                'nombre': nombre,
+                'carpeta_id': self.drive.carpeta_id,
+                'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            })
+
+        entradas = {}
+        for trabajo, transferencia in zip(trabajos, self.drive.transferencias().subir(trabajos)):
+            if not transferencia.ok:
+                continue
+            entradas[trabajo['anio']] = {
+                'file_id': transferencia.resultado,
+                'nombre': trabajo['nombre'],
+                'hojas': hojas_por_anio[trabajo['anio']],
+                'bytes': os.path.getsize(trabajo['ruta']),
+                'sha256': self._sha256(trabajo['ruta']),
+                'archivado_en': datetime.now().isoformat(timespec='seconds'),
+            }
+        return entradas
+
+    def _copia_local_valida(self, entrada):
+        ruta = os.path.join(self.cache_dir, entrada['nombre'])
+        return os.path.exists(ruta) and self._sha256(ruta) == entrada.get('sha256')
+
+    def precargar_archivados(self, anios):
+        """Descarga en paralelo los libros archivados de `anios` que falten en la cache local."""
+        entradas = [self.manifiesto['archivados'][str(anio)] for anio in anios if self.esta_archivado(anio)]
+        faltantes = [entrada for entrada in entradas if not self._copia_local_valida(entrada)]
+        if not faltantes:
+            return
+        print(f'Descargando {len(faltantes)} libro(s) archivado(s)...')
+        self.drive.transferencias().descargar([{
+            'file_id': entrada['file_id'],
+            'ruta': os.path.join(self.cache_dir, entrada['nombre']),
+            'bytes': entrada.get('bytes', 0),
+        } for entrada in faltantes])
+
+    def ruta_archivado_local(self, anio):
+        """Ruta local del libro archivado; se descarga solo si falta o no coincide el hash."""
+        entrada = self.manifiesto['archivados'].get(str(anio))
+        if not entrada:
+            return None
+
+        ruta = os.path.join(self.cache_dir, entrada['nombre'])
+        if self._copia_local_valida(entrada):
+            return ruta
+
+        print(f'Descargando libro archivado {entrada["nombre"]}...')
+        return self.drive.descargar_archivo(entrada['file_id'], ruta)
+
+    def consultar_variables(self, desde, hasta, wb_caliente=None):
+        """
+        Gastos variables entre dos meses YYYY-MM (inclusive), recorriendo
+        el libro caliente y los libros archivados que cubren el rango.
+        """
+        inicio = datetime.strptime(desde, '%Y-%m')
+        fin = datetime.strptime(hasta, '%Y-%m')
+        if inicio > fin:
+            inicio, fin = fin, inicio
+        desde, hasta = inicio.strftime('%Y-%m'), fin.strftime('%Y-%m')
+
+        resultados = []
+        self.precargar_archivados(range(inicio.year, fin.year + 1))
+        for anio in range(inicio.year, fin.year + 1):
+            if self.esta_archivado(anio):
+                ruta = self.ruta_archivado_local(anio)
+                if not ruta:
+                    print(f'Advertencia: libro archivado de {anio} no disponible')
+                    continue
+                wb = openpyxl.load_workbook(ruta)
+            else:
+                wb = wb_caliente
+                if wb is None:
+                    continue
+
+            for idx, mes_nombre in enumerate(self.generador.MESES, start=1):
+                clave = f'{anio:04d}-{idx:02d}'
+                if not desde <= clave <= hasta:
+                    continue
+                hoja = self.generador._nombre_hoja_mes(mes_nombre, anio)
+                if hoja not in wb.sheetnames:
+                    continue
+                for monto, concepto, categoria, fecha in self.generador._extraer_registros_existentes(wb[hoja]):
+                    resultados.append({
+                        'mes': clave,
+                        'hoja': hoja,
+                        'monto': monto,
+                        'concepto': concepto,
+                        'categoria': categoria,
+                        'fecha': fecha,
+                    })
+
+        return resultados
+
+
+if __name__ == '__main__':
+    import argparse
+
+    try:
+        from google_drive_v2 import GoogleDriveManager
+    except ModuleNotFoundError:
+        from src.google_drive_v2 import GoogleDriveManager
+
+    parser = argparse.ArgumentParser(description='Consultar gastos variables a traves de las particiones anuales')
+    parser.add_argument('desde', help='Mes inicial YYYY-MM')
+    parser.add_argument('hasta', help='Mes final YYYY-MM')
+    args = parser.parse_args()
+
+    drive = GoogleDriveManager()
+    if not drive.autenticar():
+        raise SystemExit(1)
+
+    particiones = GestorParticionesExcel(drive)
+    wb_caliente = None
+    ruta_caliente = drive.descargar_excel_drive() if drive.archivo_excel_id else None
+    if ruta_caliente:
+        wb_caliente = openpyxl.load_workbook(ruta_caliente)
+
+    gastos = particiones.consultar_variables(args.desde, args.hasta, wb_caliente)
+    total = sum(g['monto'] for g in gastos)
+    for g in gastos:
+        print(f"{g['mes']}  ${g['monto']:>12,.0f}  {g['concepto']} ({g['categoria']})")
+    print(f'Total: ${total:,.0f} COP en {len(gastos)} gasto(s)')
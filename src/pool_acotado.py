@@ -0,0 +1,87 @@
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import metricas
+except ModuleNotFoundError:
+    from src import metricas
+
+_POOLS = weakref.WeakSet()
+
+
+class PoolSaturado(Exception):
+    """El pool no admite mas trabajo: se responde 503 con Retry-After."""
+
+    def __init__(self, pool):
+        super().__init__(f'Pool {pool.nombre} saturado ({pool.workers} en curso, {pool.cola} en cola)')
+        self.pool = pool.nombre
+        self.reintentar_s = pool.reintentar_s
+
+
+class PoolAcotado:
+    """
+    Pool de hilos de tamanio fijo con cola acotada:
+    - como mucho `workers` tareas corriendo y `cola` esperando turno
+    - pasado ese limite enviar() falla enseguida con PoolSaturado en lugar de
+      acumular trabajo (hilos, memoria) sin limite durante una rafaga
+    `reintentar_s` es lo que se sugiere al cliente en Retry-After.
+    """
+
+    def __init__(self, nombre, workers, cola, reintentar_s=1):
+        self.nombre = nombre
+        self.workers = workers
+        self.cola = cola
+        self.reintentar_s = reintentar_s
+        self._cupos = threading.BoundedSemaphore(workers + cola)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'pool-{nombre}')
+        self._lock = threading.Lock()
+        self.pendientes = 0
+        self.en_curso = 0
+        _POOLS.add(self)
+
+    def enviar(self, funcion, *args):
+        """Future con el resultado de funcion(*args); PoolSaturado si no hay cupo."""
+        if not self._cupos.acquire(blocking=False):
+            metricas.RECHAZOS_POOL.inc(self.nombre)
+            raise PoolSaturado(self)
+        with self._lock:
+            self.pendientes += 1
+        try:
+            futuro = self._executor.submit(self._correr, funcion, args)
+        except BaseException:
+            self._liberar()
+            raise
+        futuro.add_done_callback(self._liberar)
+        return futuro
+
+    def _correr(self, funcion, args):
+        with self._lock:
+            self.en_curso += 1
+        try:
+            return funcion(*args)
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+
+    def _liberar(self, _futuro=None):
+        with self._lock:
+            self.pendientes -= 1
+        self._cupos.release()
+
+    def cerrar(self, esperar=False):
+        self._executor.shutdown(wait=esperar)
+
+
+def _por_pool(campo):
+    return {(pool.nombre,): campo(pool) for pool in list(_POOLS)}
+
+
+metricas.REGISTRO.medidor(
+    'control_gastos_pool_en_curso', 'Tareas corriendo por pool de la API',
+    lambda: _por_pool(lambda pool: pool.en_curso), ('pool',)
+)
+metricas.REGISTRO.medidor(
+    'control_gastos_pool_en_cola', 'Tareas esperando turno por pool de la API',
+    lambda: _por_pool(lambda pool: pool.pendientes - pool.en_curso), ('pool',)
+)
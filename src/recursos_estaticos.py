@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TIPOS_COMPRIMIBLES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRIMIR = 1024
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+
+# src="app.js?v=..." / href="styles.css": solo rutas locales (sin esquema ni ancla)
+PATRON_REFERENCIA = re.compile(r'(?P<atributo>\b(?:src|href)=")(?P<ruta>[^"?#:]+)(?:\?[^"]*)?(?=")')
+
+
+def elegir_codificacion(accept_encoding, disponibles):
+    """Mejor codificacion de `disponibles` segun Accept-Encoding (br antes que gzip)."""
+    preferencias = {}
+    for parte in (accept_encoding or '').split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        match = re.search(r'q\s*=\s*([0-9.]+)', parametros)
+        try:
+            preferencias[nombre.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    for codificacion in ('br', 'gzip'):
+        if codificacion in disponibles and preferencias.get(codificacion, preferencias.get('*', 0)) > 0:
+            return codificacion
+    return 'identity'
+
+
+class Recurso:
+    """Un archivo de web/ con su huella de contenido y sus variantes comprimidas."""
+
+    def __init__(self, ruta_url, datos, firma):
+        self.ruta_url = ruta_url
+        self.firma = firma
+        self.tipo = mimetypes.guess_type(ruta_url)[0] or 'application/octet-stream'
+        if self.tipo.startswith('text/') or self.tipo in ('application/javascript', 'application/json'):
+            self.tipo += '; charset=utf-8'
+        self.huella = hashlib.sha256(datos).hexdigest()[:12]
+        base, extension = posixpath.splitext(ruta_url)
+        self.ruta_huella = f'{base}.{self.huella}{extension}'
+
+        self.variantes = {'identity': datos}
+        if len(datos) >= MIN_COMPRIMIR and self.tipo.startswith(TIPOS_COMPRIMIBLES):
+            comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+            if len(comprimido) < len(datos):
+                self.variantes['gzip'] = comprimido
+            if brotli is not None:
+                comprimido = brotli.compress(datos, quality=11)
+                if len(comprimido) < len(datos):
+                    self.variantes['br'] = comprimido
+
+    def etag(self, codificacion):
+        return f'"{self.huella}"' if codificacion == 'identity' else f'"{self.huella}-{codificacion}"'
+
+
+class RecursosEstaticos:
+    """
+    Archivos de web/ listos para servir:
+    - cada archivo tiene una huella (sha256 del contenido) y una URL con ella
+      (`app.3f2a9c1b7d04.js`) que se sirve con cache inmutable de un anio
+    - las paginas de entrada (index.html) se reescriben para apuntar a esas URLs
+      y se revalidan con ETag en cada carga
+    - variantes gzip (y brotli si esta instalado) precalculadas, segun Accept-Encoding
+    Los archivos se vuelven a revisar (os.stat) como maximo una vez por `revisar_s`.
+    """
+
+    ENTRADAS = ('index.html',)
+
+    def __init__(self, directorio, revisar_s=1.0):
+        self.directorio = os.path.abspath(directorio)
+        self.revisar_s = revisar_s
+        self._lock = threading.Lock()
+        self._revisado_en = 0.0
+        self._por_ruta = {}
+        # Las huellas anteriores se conservan: una pagina vieja aun abierta sigue cargando
+        self._por_huella = {}
+
+    def _firmas(self):
+        firmas = {}
+        for raiz, _dirs, archivos in os.walk(self.directorio):
+            for archivo in archivos:
+                ruta = os.path.join(raiz, archivo)
+                estado = os.stat(ruta)
+                ruta_url = '/' + os.path.relpath(ruta, self.directorio).replace(os.sep, '/')
+                firmas[ruta_url] = (estado.st_mtime_ns, estado.st_size)
+        return firmas
+
+    def _leer(self, ruta_url):
+        with open(os.path.join(self.directorio, *ruta_url.strip('/').split('/')), 'rb') as f:
+            return f.read()
+
+    def _reescribir_entrada(self, ruta_url, datos, recursos):
+        carpeta = posixpath.dirname(ruta_url)
+
+        def _reemplazar(match):
+            destino = posixpath.normpath(posixpath.join(carpeta, match.group('ruta')))
+            recurso = recursos.get(destino)
+            if recurso is None:
+                return match.group(0)
+            relativa = posixpath.relpath(recurso.ruta_huella, carpeta)
+            return f"{match.group('atributo')}{relativa}"
+
+        return PATRON_REFERENCIA.sub(_reemplazar, datos.decode('utf-8')).encode('utf-8')
+
+    def _actualizar(self):
+        firmas = self._firmas()
+        recursos = {}
+        cambio = set(firmas) != set(self._por_ruta)
+        for ruta_url, firma in firmas.items():
+            if posixpath.basename(ruta_url) in self.ENTRADAS:
+                continue
+            actual = self._por_ruta.get(ruta_url)
+            if actual is not None and actual.firma == firma:
+                recursos[ruta_url] = actual
+                continue
+            recursos[ruta_url] = Recurso(ruta_url, self._leer(ruta_url), firma)
+            cambio = True
+
+        for ruta_url, firma in firmas.items():
+            if posixpath.basename(ruta_url) not in self.ENTRADAS:
+                continue
+            actual = self._por_ruta.get(ruta_url)
+            if actual is not None and actual.firma == firma and not cambio:
+                recursos[ruta_url] = actual
+                continue
+            datos = self._reescribir_entrada(ruta_url, self._leer(ruta_url), recursos)
+            recursos[ruta_url] = Recurso(ruta_url, datos, firma)
+
+        self._por_ruta = recursos
+        for recurso in recursos.values():
+            self._por_huella[recurso.ruta_huella] = recurso
+
+    def _revisar(self):
+        if time.monotonic() - self._revisado_en < self.revisar_s:
+            return
+        with self._lock:
+            if time.monotonic() - self._revisado_en < self.revisar_s:
+                return
+            self._actualizar()
+            self._revisado_en = time.monotonic()
+
+    def precargar(self):
+        """Calcula huellas y variantes comprimidas antes de la primera peticion."""
+        self._revisar()
+        return len(self._por_ruta)
+
+    def responder(self, ruta_url, cabeceras):
+        """
+        (estado, cuerpo, cabeceras) para `ruta_url`; None si no existe.
+        `cabeceras` son las de la peticion (claves en minusculas).
+        """
+        self._revisar()
+        if ruta_url.endswith('/'):
+            ruta_url += 'index.html'
+        recurso = self._por_huella.get(ruta_url)
+        inmutable = recurso is not None
+        if recurso is None:
+            recurso = self._por_ruta.get(ruta_url)
+        if recurso is None:
+            return None
+
+        codificacion = elegir_codificacion(cabeceras.get('accept-encoding'), recurso.variantes)
+        respuesta = {
+            'ETag': recurso.etag(codificacion),
+            'Cache-Control': CACHE_INMUTABLE if inmutable else CACHE_REVALIDAR,
+            'Vary': 'Accept-Encoding',
+        }
+        if codificacion != 'identity':
+            respuesta['Content-Encoding'] = codificacion
+
+        if_none_match = cabeceras.get('if-none-match') or ''
+        candidatos = [c.strip()[2:] if c.strip().startswith('W/') else c.strip() for c in if_none_match.split(',')]
+        if respuesta['ETag'] in candidatos or '*' in candidatos:
+            return 304, b'', respuesta
+
+        respuesta['Content-type'] = recurso.tipo
+        return 200, recurso.variantes[codificacion], respuesta
@@ -0,0 +1,200 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import openpyxl
+
+try:
+    from excel_mensual import GeneradorExcelMensual
+    from xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso, serializar_hoja
+except ModuleNotFoundError:
+    from src.excel_mensual import GeneradorExcelMensual
+    from src.xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso, serializar_hoja
+
+
+PATRON_HOJA = re.compile(r'^(?P<mes>[A-Za-z]+) (?P<anio>\d{4})$')
+
+# Estado por proceso trabajador (se inicializa una vez por proceso).
+_GENERADOR = None
+
+
+def _firma_estilos(wb):
+    """Tamanio de cada tabla de estilos; si coincide, los indices son los mismos."""
+    return (
+        len(wb._cell_styles),
+        len(wb._fonts),
+        len(wb._fills),
+        len(wb._borders),
+        len(wb._alignments),
+        len(wb._protections),
+        len(wb._number_formats),
+    )
+
+
+def preparar_estilos(libro, generador):
+    """
+    Workbook con la tabla de estilos del paquete mas todos los estilos que usa
+    el generador, registrados siempre en el mismo orden. Asi cada proceso
+    obtiene los mismos indices y las hojas serializadas se pueden mezclar.
+    """
+    wb = libro.libro_con_estilos()
+    ws = generador.crear_o_actualizar_hoja_mes(wb, generador.MESES[0], 2000)
+    generador._insertar_registros_preservados(ws, [(1, 'x', 'x', 'x')])
+    # Al leer una hoja, openpyxl copia los bordes de cada rango combinado a sus
+    # celdas del borde: se registran aca para que cargar_hoja() no agregue estilos.
+    for rango in ws.merged_cells.ranges:
+        rango.format()
+    for fila in ws.iter_rows():
+        for celda in fila:
+            celda.style_id
+    wb.remove(ws)
+    return wb
+
+
+def _iniciar_trabajador(config_path):
+    global _GENERADOR
+    _GENERADOR = GeneradorExcelMensual(config_path)
+
+
+def _regenerar_lote(ruta_excel, hojas):
+    """Trabajador: reconstruye un lote de hojas y devuelve el XML de cada parte."""
+    partes = []
+    with LibroXlsxPerezoso(ruta_excel) as libro:
+        wb = preparar_estilos(libro, _GENERADOR)
+        firma = _firma_estilos(wb)
+        for nombre_hoja, mes_nombre, anio in hojas:
+            libro.cargar_hoja(nombre_hoja, wb)
+            ws = _GENERADOR.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio)
+            partes.append((nombre_hoja, serializar_hoja(ws)))
+            wb.remove(ws)
+    if _firma_estilos(wb) != firma:
+        raise HojaNoSoportada('Las hojas generaron estilos fuera de la tabla preparada')
+    return partes
+
+
+class RegeneradorMeses:
+    """
+    Regenera en paralelo las hojas "Mes YYYY" de un rango (fijos y resumen
+    con la configuracion actual, preservando los gastos variables) y las
+    mezcla en el libro reescribiendo solo esas partes del paquete.
+    """
+
+    def __init__(self, config_path='config/configuracion.json', workers=None):
+        self.config_path = config_path
+        self.generador = GeneradorExcelMensual(config_path)
+        self.workers = workers or os.cpu_count() or 1
+
+    def hojas_en_rango(self, nombres_hojas, desde, hasta):
+        """Hojas del libro cuyo mes YYYY-MM cae en [desde, hasta], en orden del libro."""
+        if desde > hasta:
+            desde, hasta = hasta, desde
+        seleccion = []
+        for nombre in nombres_hojas:
+            match = PATRON_HOJA.match(nombre)
+            if not match or match.group('mes') not in self.generador.MESES:
+                continue
+            mes = self.generador.MESES.index(match.group('mes')) + 1
+            anio = int(match.group('anio'))
+            if desde <= f'{anio:04d}-{mes:02d}' <= hasta:
+                seleccion.append((nombre, match.group('mes'), anio))
+        return seleccion
+
+    def regenerar(self, ruta_excel, desde, hasta):
+        """
+        Regenera las hojas del rango sobre `ruta_excel` (in situ).
+        Devuelve un resumen con hojas regeneradas, modo usado y tiempos.
+        """
+        for valor in (desde, hasta):
+            datetime.strptime(valor, '%Y-%m')
+
+        inicio = time.perf_counter()
+        try:
+            resultado = self._regenerar_parcial(ruta_excel, desde, hasta)
+        except HojaNoSoportada as e:
+            print(f'Edicion parcial no disponible ({e}); regenerando con el libro completo')
+            resultado = self._regenerar_completo(ruta_excel, desde, hasta)
+        resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+        return resultado
+
+    def _regenerar_parcial(self, ruta_excel, desde, hasta):
+        libro = LibroXlsxPerezoso(ruta_excel)
+        try:
+            hojas = self.hojas_en_rango(libro.nombres_hojas, desde, hasta)
+            if not hojas:
+                return {'hojas': [], 'modo': 'sin_cambios', 'workers': 0}
+
+            wb = preparar_estilos(libro, self.generador)
+            workers = min(self.workers, len(hojas))
+            partes, modo = None, 'secuencial'
+            if workers > 1:
+                partes = self._en_paralelo(ruta_excel, hojas, workers)
+                modo = 'paralelo'
+            if partes is None:
+                workers = 1
+                modo = 'secuencial'
+                partes = self._en_proceso(libro, wb, hojas)
+
+            for nombre_hoja, datos in partes:
+                libro.reemplazar_parte(libro.ruta_parte(nombre_hoja), datos)
+            libro.actualizar_estilos(wb)
+            libro.descartar_calc_chain()
+            libro.guardar()
+        finally:
+            libro.cerrar()
+
+        return {'hojas': [h[0] for h in hojas], 'modo': modo, 'workers': workers}
+
+    def _en_paralelo(self, ruta_excel, hojas, workers):
+        print(f'Regenerando {len(hojas)} hoja(s) con {workers} proceso(s)...')
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_iniciar_trabajador,
+                initargs=(self.config_path,),
+            ) as pool:
+                # Un lote por proceso: el paquete y la tabla de estilos se preparan una sola vez.
+                lotes = [hojas[i::workers] for i in range(workers)]
+                futuros = [pool.submit(_regenerar_lote, ruta_excel, lote) for lote in lotes]
+                return [parte for f in futuros for parte in f.result()]
+        except HojaNoSoportada:
+            raise
+        except (BrokenProcessPool, OSError) as e:
+            print(f'Pool de procesos no disponible ({e}); regenerando en este proceso')
+            return None
+
+    def _en_proceso(self, libro, wb, hojas):
+        partes = []
+        for nombre_hoja, mes_nombre, anio in hojas:
+            libro.cargar_hoja(nombre_hoja, wb)
+            ws = self.generador.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio)
+            partes.append((nombre_hoja, serializar_hoja(ws)))
+            wb.remove(ws)
+        return partes
+
+    def _regenerar_completo(self, ruta_excel, desde, hasta):
+        wb = openpyxl.load_workbook(ruta_excel)
+        hojas = self.hojas_en_rango(wb.sheetnames, desde, hasta)
+        for _nombre, mes_nombre, anio in hojas:
+            self.generador.crear_o_actualizar_hoja_mes(wb, mes_nombre, anio)
+        if hojas:
+            wb.save(ruta_excel)
+        return {'hojas': [h[0] for h in hojas], 'modo': 'completo', 'workers': 1}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Regenerar en paralelo las hojas de un rango de meses')
+    parser.add_argument('excel', help='Ruta del .xlsx a regenerar (se modifica in situ)')
+    parser.add_argument('desde', help='Mes inicial YYYY-MM')
+    parser.add_argument('hasta', help='Mes final YYYY-MM')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--config', default='config/configuracion.json')
+    args = parser.parse_args()
+
+    resultado = RegeneradorMeses(args.config, args.workers).regenerar(args.excel, args.desde, args.hasta)
+    print(f"{len(resultado['hojas'])} hoja(s) regeneradas ({resultado['modo']}, "
+          f"{resultado['workers']} worker(s)) en {resultado['segundos']}s")
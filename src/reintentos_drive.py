@@ -0,0 +1,96 @@
+import random
+import socket
+import ssl
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+# Errores de Drive que justifican reintentar
+ESTADOS_TRANSITORIOS = (429, 500, 502, 503, 504)
+RAZONES_CUOTA = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def es_transitorio(error):
+    """5xx, 429, cuota excedida (403 con rateLimitExceeded) o caida de red."""
+    if isinstance(error, HttpError):
+        estado = error.resp.status
+        if estado in ESTADOS_TRANSITORIOS:
+            return True
+        detalle = f'{error} {error.content!r}'
+        return estado == 403 and any(razon in detalle for razon in RAZONES_CUOTA)
+    return isinstance(error, (socket.timeout, ConnectionError, ssl.SSLError, httplib2.HttpLib2Error))
+
+
+class Reintentos:
+    """
+    Politica de reintentos de las llamadas a Drive (GoogleDriveManager y GestorTransferencias):
+    backoff exponencial con jitter completo, hasta `max_reintentos` intentos extra.
+    """
+
+    def __init__(self, max_reintentos, espera_base, espera_max):
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+
+    def espera(self, intento):
+        return random.uniform(0, min(self.espera_max, self.espera_base * (2 ** intento)))
+
+    def esperar(self, intento):
+        espera = self.espera(intento)
+        time.sleep(espera)
+        return espera
+
+    def ejecutar(self, funcion, al_reintentar=None):
+        """
+        Devuelve funcion() reintentando los errores transitorios.
+        `al_reintentar(error, intento)` se llama antes de cada espera.
+        """
+        for intento in range(self.max_reintentos + 1):
+            try:
+                return funcion()
+            except Exception as e:
+                if not es_transitorio(e) or intento == self.max_reintentos:
+                    raise
+                if al_reintentar:
+                    al_reintentar(e, intento)
+                self.esperar(intento)
+
+    def subir_reanudable(self, request, antes_del_trozo=None, al_avanzar=None, al_reintentar=None):
+        """
+        Ejecuta una subida reanudable trozo a trozo y devuelve la respuesta final.
+        Ante errores transitorios espera y continua desde el ultimo byte confirmado
+        por Drive; si la sesion expiro (404/410) la reinicia desde el byte 0.
+        - antes_del_trozo(request): antes de enviar cada trozo
+        - al_avanzar(previo, status, respuesta): tras cada trozo aceptado
+        - al_reintentar(error, consecutivos, espera, reiniciada): antes de esperar
+        """
+        consecutivos = 0
+        respuesta = None
+        while respuesta is None:
+            if antes_del_trozo:
+                antes_del_trozo(request)
+            previo = request.resumable_progress
+            try:
+                status, respuesta = request.next_chunk()
+            except Exception as e:
+                reiniciada = isinstance(e, HttpError) and e.resp.status in (404, 410) and bool(request.resumable_uri)
+                if not reiniciada and not es_transitorio(e):
+                    raise
+                if consecutivos >= self.max_reintentos:
+                    raise
+                if reiniciada:
+                    request.resumable_uri = None
+                    request.resumable_progress = 0
+                # Con sesion abierta, next_chunk consulta primero el offset confirmado
+                request._in_error_state = bool(request.resumable_uri)
+                consecutivos += 1
+                espera = self.espera(consecutivos - 1)
+                if al_reintentar:
+                    al_reintentar(e, consecutivos, espera, reiniciada)
+                time.sleep(espera)
+                continue
+            consecutivos = 0
+            if al_avanzar:
+                al_avanzar(previo, status, respuesta)
+        return respuesta
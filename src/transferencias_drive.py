@@ -0,0 +1,283 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaIoBaseUpload
+
+try:
+    import reintentos_drive
+except ModuleNotFoundError:
+    from src import reintentos_drive
+
+
+class LimitadorAnchoBanda:
+    """Cubeta de tokens compartida por todos los hilos; `kbps` <= 0 desactiva el limite."""
+
+    def __init__(self, kbps=0):
+        self.bytes_por_s = float(kbps or 0) * 1024
+        self._lock = threading.Lock()
+        self._disponible_en = time.monotonic()
+
+    def consumir(self, cantidad):
+        if self.bytes_por_s <= 0 or cantidad <= 0:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            # Reserva el turno: cada hilo espera hasta que sus bytes "caben" en la tasa global
+            inicio = max(ahora, self._disponible_en)
+            self._disponible_en = inicio + cantidad / self.bytes_por_s
+            espera = self._disponible_en - ahora
+        if espera > 0:
+            time.sleep(espera)
+
+
+class Transferencia:
+    """Estado y contabilidad de una subida o descarga."""
+
+    def __init__(self, etiqueta, bytes_total=0):
+        self.etiqueta = etiqueta
+        self.bytes_total = bytes_total
+        self.bytes_hechos = 0
+        self.reintentos = 0
+        self.inicio = None
+        self.fin = None
+        self.resultado = None
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and self.fin is not None
+
+    @property
+    def segundos(self):
+        if self.inicio is None:
+            return 0.0
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    @property
+    def kbps(self):
+        return self.bytes_hechos / 1024 / self.segundos if self.segundos > 0 else 0.0
+
+    @property
+    def progreso(self):
+        return self.bytes_hechos / self.bytes_total if self.bytes_total else (1.0 if self.fin else 0.0)
+
+    def como_dict(self):
+        return {
+            'archivo': self.etiqueta,
+            'bytes': self.bytes_hechos,
+            'segundos': round(self.segundos, 3),
+            'kbps': round(self.kbps, 1),
+            'reintentos': self.reintentos,
+            'error': str(self.error) if self.error else None,
+        }
+
+
+class GestorTransferencias:
+    """
+    Subidas y descargas de muchos archivos en paralelo:
+    - pool acotado de hilos, cada uno con su propio servicio de Drive (httplib2 no es thread-safe)
+    - limite global de ancho de banda compartido por todos los hilos
+    - progreso y throughput por archivo (`al_progreso(transferencia)` tras cada trozo)
+    Ajustes en google_drive.transferencias: workers, limite_kbps, chunk_mb, max_reintentos.
+    """
+
+    def __init__(self, drive, workers=None, limite_kbps=None, al_progreso=None):
+        self.drive = drive
+        ajustes = drive.config.get('google_drive', {}).get('transferencias') or {}
+        self.workers = max(1, int(workers or ajustes.get('workers', 4)))
+        if limite_kbps is None:
+            limite_kbps = ajustes.get('limite_kbps', 0)
+        self.limitador = LimitadorAnchoBanda(limite_kbps)
+        # Drive exige trozos multiplos de 256 KiB
+        bloque = 256 * 1024
+        self.chunk_bytes = max(1, round(float(ajustes.get('chunk_mb', 1) or 1) * 1024 * 1024 / bloque)) * bloque
+        self.reintentos = reintentos_drive.Reintentos(
+            int(ajustes.get('max_reintentos', 5)),
+            float(ajustes.get('espera_base_s', 0.5)),
+            float(ajustes.get('espera_max_s', 16.0)),
+        )
+        self.al_progreso = al_progreso
+        self._local = threading.local()
+
+    def _servicio(self):
+        servicio = getattr(self._local, 'servicio', None)
+        if servicio is None:
+            servicio = self.drive._construir_servicio()
+            self._local.servicio = servicio
+        return servicio
+
+    def reintentar(self, funcion):
+        """Ejecuta `funcion(servicio)` con el servicio del hilo, reintentando errores transitorios."""
+        return self.reintentos.ejecutar(lambda: funcion(self._servicio()))
+
+    def _avanzar(self, transferencia, bytes_nuevos):
+        transferencia.bytes_hechos += bytes_nuevos
+        if self.al_progreso:
+            self.al_progreso(transferencia)
+
+    # Listado
+
+    def listar(self, carpeta_id=None, query=None, campos='id, name, size, modifiedTime, md5Checksum'):
+        """Todos los archivos que cumplen la consulta, recorriendo todas las paginas."""
+        condiciones = [c for c in (query, f"'{carpeta_id}' in parents" if carpeta_id else None) if c]
+        condiciones.append('trashed=false')
+        archivos = []
+        token = None
+        while True:
+            respuesta = self.reintentar(lambda servicio: servicio.files().list(
+                q=' and '.join(condiciones),
+                spaces='drive',
+                pageSize=1000,
+                pageToken=token,
+                fields=f'nextPageToken, files({campos})'
+            ).execute())
+            archivos.extend(respuesta.get('files', []))
+            token = respuesta.get('nextPageToken')
+            if not token:
+                return archivos
+
+    # Ejecucion en paralelo
+
+    def _ejecutar(self, funcion, trabajos, transferencias):
+        def _correr(par):
+            trabajo, transferencia = par
+            transferencia.inicio = time.perf_counter()
+            try:
+                transferencia.resultado = funcion(trabajo, transferencia)
+            except Exception as e:
+                transferencia.error = e
+                print(f'Error transfiriendo {transferencia.etiqueta}: {e}')
+            transferencia.fin = time.perf_counter()
+            return transferencia
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(len(trabajos), 1))) as pool:
+            list(pool.map(_correr, zip(trabajos, transferencias)))
+        return transferencias
+
+    def subir(self, trabajos):
+        """
+        `trabajos`: dicts con `ruta` o `datos`, `nombre`, y `carpeta_id` (crear) o `file_id` (actualizar);
+        `mimetype` opcional. Devuelve una Transferencia por trabajo, en el mismo orden, con el id en `resultado`.
+        """
+        transferencias = []
+        for trabajo in trabajos:
+            total = len(trabajo['datos']) if 'datos' in trabajo else os.path.getsize(trabajo['ruta'])
+            transferencias.append(Transferencia(trabajo['nombre'], total))
+        return self._ejecutar(self._subir_uno, trabajos, transferencias)
+
+    def descargar(self, trabajos):
+        """
+        `trabajos`: dicts con `file_id` y `ruta` (o sin `ruta` para recibir los bytes en `resultado`);
+        `bytes` opcional para el progreso. Devuelve una Transferencia por trabajo, en el mismo orden.
+        """
+        transferencias = [
+            Transferencia(trabajo.get('etiqueta') or trabajo.get('ruta') or trabajo['file_id'], trabajo.get('bytes', 0))
+            for trabajo in trabajos
+        ]
+        return self._ejecutar(self._descargar_uno, trabajos, transferencias)
+
+    def _media(self, trabajo, resumable):
+        mimetype = trabajo.get('mimetype') or 'application/octet-stream'
+        if 'datos' in trabajo:
+            return MediaIoBaseUpload(io.BytesIO(trabajo['datos']), mimetype=mimetype,
+                                     chunksize=self.chunk_bytes, resumable=resumable)
+        return MediaFileUpload(trabajo['ruta'], mimetype=mimetype, chunksize=self.chunk_bytes, resumable=resumable)
+
+    def _peticion_subida(self, trabajo, resumable):
+        archivos = self._servicio().files()
+        media = self._media(trabajo, resumable)
+        if trabajo.get('file_id'):
+            return archivos.update(fileId=trabajo['file_id'], body={'name': trabajo['nombre']},
+                                   media_body=media, fields='id')
+        carpeta_id = trabajo.get('carpeta_id')
+        return archivos.create(body={'name': trabajo['nombre'], 'parents': [carpeta_id] if carpeta_id else []},
+                               media_body=media, fields='id')
+
+    def _subir_uno(self, trabajo, transferencia):
+        def contar_reintento(*_):
+            transferencia.reintentos += 1
+
+        # Archivos que caben en un trozo: una sola peticion multipart
+        if transferencia.bytes_total <= self.chunk_bytes:
+            def subir_entero():
+                self.limitador.consumir(transferencia.bytes_total)
+                respuesta = self._peticion_subida(trabajo, resumable=False).execute()
+                self._avanzar(transferencia, transferencia.bytes_total)
+                return respuesta
+
+            return self.reintentos.ejecutar(subir_entero, al_reintentar=contar_reintento)['id']
+
+        request = self._peticion_subida(trabajo, resumable=True)
+
+        def antes_del_trozo(request):
+            self.limitador.consumir(min(self.chunk_bytes, transferencia.bytes_total - request.resumable_progress))
+
+        def al_avanzar(previo, _status, respuesta):
+            hecho = transferencia.bytes_total if respuesta is not None else request.resumable_progress
+            self._avanzar(transferencia, hecho - previo)
+
+        def al_reintentar(_error, _consecutivos, _espera, reiniciada):
+            contar_reintento()
+            if reiniciada:
+                transferencia.bytes_hechos = 0
+
+        respuesta = self.reintentos.subir_reanudable(
+            request, antes_del_trozo=antes_del_trozo, al_avanzar=al_avanzar, al_reintentar=al_reintentar
+        )
+        return respuesta['id']
+
+    def _bajar(self, destino, file_id, transferencia):
+        request = self._servicio().files().get_media(fileId=file_id)
+        downloader = MediaIoBaseDownload(destino, request, chunksize=self.chunk_bytes)
+        done = False
+        while not done:
+            previo = transferencia.bytes_hechos
+            status, done = downloader.next_chunk()
+            if status.total_size:
+                transferencia.bytes_total = status.total_size
+            bytes_nuevos = status.resumable_progress - previo
+            self.limitador.consumir(bytes_nuevos)
+            self._avanzar(transferencia, bytes_nuevos)
+
+    def _descargar_uno(self, trabajo, transferencia):
+        ruta = trabajo.get('ruta')
+        parcial = f'{ruta}.parcial' if ruta else None
+
+        def bajar_entero():
+            transferencia.bytes_hechos = 0
+            if not ruta:
+                destino = io.BytesIO()
+                self._bajar(destino, trabajo['file_id'], transferencia)
+                return destino.getvalue()
+            with io.FileIO(parcial, 'wb') as destino:
+                self._bajar(destino, trabajo['file_id'], transferencia)
+            os.replace(parcial, ruta)
+            return ruta
+
+        def contar_reintento(*_):
+            transferencia.reintentos += 1
+
+        return self.reintentos.ejecutar(bajar_entero, al_reintentar=contar_reintento)
+
+    @staticmethod
+    def resumen(transferencias):
+        """Totales de una tanda: archivos, fallidos, bytes, segundos (pared) y KB/s agregados."""
+        hechas = [t for t in transferencias if t.inicio is not None]
+        if not hechas:
+            return {'archivos': 0, 'fallidos': 0, 'bytes': 0, 'segundos': 0.0, 'kbps': 0.0, 'reintentos': 0}
+        inicio = min(t.inicio for t in hechas)
+        fin = max(t.fin or time.perf_counter() for t in hechas)
+        total = sum(t.bytes_hechos for t in hechas)
+        segundos = max(fin - inicio, 1e-6)
+        return {
+            'archivos': len(transferencias),
+            'fallidos': sum(1 for t in transferencias if not t.ok),
+            'bytes': total,
+            'segundos': round(segundos, 3),
+            'kbps': round(total / 1024 / segundos, 1),
+            'reintentos': sum(t.reintentos for t in transferencias),
+        }
+
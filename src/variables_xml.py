@@ -0,0 +1,306 @@
+import re
+from xml.sax.saxutils import escape, unescape
+
+try:
+    from excel_mensual import GeneradorExcelMensual
+    from xlsx_perezoso import HojaNoSoportada
+except ModuleNotFoundError:
+    from src.excel_mensual import GeneradorExcelMensual
+    from src.xlsx_perezoso import HojaNoSoportada
+
+
+class LayoutNoReconocido(HojaNoSoportada):
+    """La hoja no tiene el layout H:K esperado; usar la ruta openpyxl."""
+
+
+RE_ROW = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+RE_CELDA = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+RE_ATRIBUTO = re.compile(r'([\w:]+)="([^"]*)"')
+RE_V = re.compile(r'<v>(.*?)</v>', re.S)
+RE_T = re.compile(r'<t\b[^>]*?(?:/>|>(.*?)</t>)', re.S)
+RE_SI = re.compile(r'<si\b[^>]*?(?:/>|>(.*?)</si>)', re.S)
+RE_FORMULA_CACHE = re.compile(r'(<f\b[^>]*?(?:/>|>[^<]*</f>))<v>[^<]*</v>')
+RE_REF = re.compile(r'^([A-Z]+)(\d+)$')
+
+ENTIDADES = {'&quot;': '"', '&apos;': "'"}
+COLUMNAS = ('H', 'I', 'J', 'K')
+ENCABEZADOS = ('Monto', 'Concepto', 'Categoria', 'Fecha')
+
+
+def _atributos(etiqueta):
+    apertura = etiqueta[:etiqueta.index('>') + 1]
+    return dict(RE_ATRIBUTO.findall(apertura))
+
+
+def _indice_columna(letras):
+    indice = 0
+    for ch in letras:
+        indice = indice * 26 + (ord(ch) - 64)
+    return indice
+
+
+def _texto_xml(fragmento):
+    return ''.join(unescape(m.group(1) or '', ENTIDADES) for m in RE_T.finditer(fragmento))
+
+
+class ParcheVariablesXml:
+    """
+    Ruta rapida para registrar gastos en H:K sin openpyxl:
+    inserta las celdas <c> directamente en las filas de la hoja del mes,
+    reutilizando los estilos ya presentes y manteniendo sharedStrings consistente.
+    Lanza LayoutNoReconocido si la hoja no coincide con el layout mensual.
+    """
+
+    FILA_ENCABEZADO = GeneradorExcelMensual.FILA_VARIABLES_DATA_INICIO - 1
+    FILA_INICIO = GeneradorExcelMensual.FILA_VARIABLES_DATA_INICIO
+    FILA_FIN = GeneradorExcelMensual.FILA_VARIABLES_DATA_FIN
+    FILA_TOTAL = GeneradorExcelMensual.FILA_VARIABLES_TOTAL
+    FILA_FIJOS_FIN = GeneradorExcelMensual.FILA_FIJOS_DATA_FIN
+
+    def __init__(self, libro, nombre_hoja, generador):
+        self.libro = libro
+        self.generador = generador
+        self.parte = libro.ruta_parte(nombre_hoja)
+        self.xml = libro.leer_parte(self.parte).decode('utf-8')
+
+        inicio = self.xml.find('<sheetData')
+        fin = self.xml.find('</sheetData>')
+        if inicio < 0 or fin < 0:
+            raise LayoutNoReconocido('La hoja no tiene sheetData')
+        self._inicio_datos = self.xml.index('>', inicio) + 1
+        self._fin_datos = fin
+
+        self._strings = None
+        self._indice_strings = None
+        self._strings_nuevos = []
+        self._referencias_nuevas = 0
+        self._referencias_quitadas = 0
+        self._filas = self._indexar_filas()
+        self._validar_layout()
+
+    # Lectura
+
+    def _indexar_filas(self):
+        filas = {}
+        datos = self.xml[self._inicio_datos:self._fin_datos]
+        for match in RE_ROW.finditer(datos):
+            attrs = _atributos(match.group(0))
+            try:
+                numero = int(attrs.get('r', ''))
+            except ValueError:
+                raise LayoutNoReconocido('Fila sin atributo r')
+            if numero <= self.FILA_TOTAL:
+                filas[numero] = self._indexar_celdas(match.group(0))
+        return filas
+
+    def _indexar_celdas(self, fila_xml):
+        celdas = {}
+        for match in RE_CELDA.finditer(fila_xml):
+            attrs = _atributos(match.group(0))
+            ref = RE_REF.match(attrs.get('r', ''))
+            if not ref:
+                raise LayoutNoReconocido('Celda sin referencia explicita')
+            celdas[ref.group(1)] = (match.group(0), attrs)
+        return celdas
+
+    def _cargar_strings(self):
+        if self._strings is not None:
+            return self._strings
+        self._strings = []
+        if self.libro.parte_strings:
+            sst = self.libro.leer_parte(self.libro.parte_strings).decode('utf-8')
+            self._strings = [_texto_xml(m.group(1) or '') for m in RE_SI.finditer(sst)]
+        self._indice_strings = {}
+        for indice, texto in enumerate(self._strings):
+            self._indice_strings.setdefault(texto, indice)
+        return self._strings
+
+    def _valor(self, fila, columna):
+        celda = self._filas.get(fila, {}).get(columna)
+        if not celda:
+            return None
+        xml, attrs = celda
+        tipo = attrs.get('t', 'n')
+        if tipo == 'inlineStr':
+            return _texto_xml(xml)
+        v = RE_V.search(xml)
+        if not v or v.group(1) == '':
+            return None
+        texto = unescape(v.group(1), ENTIDADES)
+        if tipo == 's':
+            strings = self._cargar_strings()
+            try:
+                return strings[int(texto)]
+            except (ValueError, IndexError):
+                raise LayoutNoReconocido('Indice de sharedStrings fuera de rango')
+        if tipo in ('str', 'e'):
+            return texto
+        try:
+            return float(texto)
+        except ValueError:
+            return texto
+
+    def _validar_layout(self):
+        encabezados = tuple(self._valor(self.FILA_ENCABEZADO, col) for col in COLUMNAS)
+        if encabezados != ENCABEZADOS:
+            raise LayoutNoReconocido(f'Encabezados H:K inesperados: {encabezados}')
+
+        total = self._filas.get(self.FILA_TOTAL, {}).get('H')
+        formula = f'SUM(H{self.FILA_INICIO}:H{self.FILA_FIN})'
+        if not total or f'<f>{formula}</f>' not in total[0]:
+            raise LayoutNoReconocido(f'H{self.FILA_TOTAL} no contiene ={formula}')
+
+    def filas_libres(self):
+        libres = []
+        for fila in range(self.FILA_INICIO, self.FILA_FIN + 1):
+            valor = self._valor(fila, 'H')
+            if valor in (None, ''):
+                libres.append(fila)
+            elif isinstance(valor, str) and 'EJEMPLO' in valor.upper():
+                libres.append(fila)
+        return libres
+
+    # Estilos
+
+    def _estilo_monto(self):
+        for columna, inicio, fin in (('H', self.FILA_INICIO, self.FILA_FIN),
+                                     ('D', self.FILA_INICIO, self.FILA_FIJOS_FIN)):
+            for fila in range(inicio, fin + 1):
+                celda = self._filas.get(fila, {}).get(columna)
+                if celda and 's' in celda[1] and isinstance(self._valor(fila, columna), float):
+                    return celda[1]['s']
+        raise LayoutNoReconocido('No hay un estilo de monto reutilizable')
+
+    def _estilo_texto(self, fila, columna):
+        celda = self._filas.get(fila, {}).get(columna)
+        if celda and 's' in celda[1]:
+            return celda[1]['s']
+        for otra in range(self.FILA_INICIO, self.FILA_FIN + 1):
+            celda = self._filas.get(otra, {}).get(columna)
+            if celda and 's' in celda[1]:
+                return celda[1]['s']
+        return None
+
+    # Escritura
+
+    def _celda_texto(self, ref, estilo, texto):
+        s = f' s="{estilo}"' if estilo is not None else ''
+        if not self.libro.parte_strings:
+            return (
+                f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">'
+                f'{escape(texto)}</t></is></c>'
+            )
+
+        strings = self._cargar_strings()
+        indice = self._indice_strings.get(texto)
+        if indice is None:
+            indice = len(strings)
+            strings.append(texto)
+            self._indice_strings[texto] = indice
+            self._strings_nuevos.append(texto)
+        self._referencias_nuevas += 1
+        return f'<c r="{ref}"{s} t="s"><v>{indice}</v></c>'
+
+    def _celda_numero(self, ref, estilo, valor):
+        numero = int(valor) if float(valor).is_integer() else valor
+        return f'<c r="{ref}" s="{estilo}"><v>{numero}</v></c>'
+
+    def _reconstruir_fila(self, fila, nuevas):
+        celdas = dict(self._filas.get(fila, {}))
+        for columna, xml in nuevas.items():
+            previa = celdas.get(columna)
+            if previa and previa[1].get('t') == 's':
+                # La celda reemplazada deja de referenciar su string compartido
+                self._referencias_quitadas += 1
+            celdas[columna] = (xml, _atributos(xml))
+        self._filas[fila] = celdas
+        ordenadas = sorted(celdas.items(), key=lambda item: _indice_columna(item[0]))
+        return ''.join(xml for _col, (xml, _attrs) in ordenadas)
+
+    def agregar(self, gastos):
+        """Escribe los gastos en las primeras filas libres; devuelve las filas usadas."""
+        libres = self.filas_libres()
+        estilo_monto = self._estilo_monto()
+
+        cambios = {}
+        for gasto in gastos:
+            if not libres:
+                print('Advertencia: tabla de variables llena, gasto no registrado')
+                break
+            fila = libres.pop(0)
+            categoria = gasto.get('categoria', 'Otros')
+            fecha = gasto.get('fecha', '')
+            valores = {
+                'I': str(gasto.get('concepto', 'Gasto general')),
+                'J': '' if categoria is None else str(categoria),
+                'K': '' if fecha is None else str(fecha),
+            }
+            nuevas = {'H': self._celda_numero(f'H{fila}', estilo_monto,
+                                              self.generador._normalizar_numero(gasto.get('monto', 0)))}
+            for columna, texto in valores.items():
+                nuevas[columna] = self._celda_texto(f'{columna}{fila}', self._estilo_texto(fila, columna), texto)
+            cambios[fila] = self._reconstruir_fila(fila, nuevas)
+
+        if cambios:
+            self._aplicar(cambios)
+        return sorted(cambios)
+
+    def _aplicar(self, cambios):
+        datos = self.xml[self._inicio_datos:self._fin_datos]
+        partes = []
+        cursor = 0
+        pendientes = sorted(cambios)
+        for match in RE_ROW.finditer(datos):
+            numero = int(_atributos(match.group(0))['r'])
+            while pendientes and pendientes[0] < numero:
+                fila = pendientes.pop(0)
+                partes.append(datos[cursor:match.start()])
+                partes.append(f'<row r="{fila}">{cambios[fila]}</row>')
+                cursor = match.start()
+            if pendientes and pendientes[0] == numero:
+                pendientes.pop(0)
+                apertura = match.group(0)
+                apertura = apertura[:apertura.index('>') + 1]
+                if apertura.endswith('/>'):
+                    apertura = apertura[:-2].rstrip() + '>'
+                partes.append(datos[cursor:match.start()])
+                partes.append(f'{apertura}{cambios[numero]}</row>')
+                cursor = match.end()
+        partes.append(datos[cursor:])
+        for fila in pendientes:
+            partes.append(f'<row r="{fila}">{cambios[fila]}</row>')
+
+        # Los totales dependen de H:K; se descarta el valor cacheado para forzar el recalculo.
+        nuevo_datos = RE_FORMULA_CACHE.sub(r'\1', ''.join(partes))
+        xml = self.xml[:self._inicio_datos] + nuevo_datos + self.xml[self._fin_datos:]
+        self.libro.reemplazar_parte(self.parte, xml.encode('utf-8'))
+
+        if self.libro.parte_strings and (self._referencias_nuevas or self._referencias_quitadas):
+            self._actualizar_shared_strings()
+
+    def _actualizar_shared_strings(self):
+        sst = self.libro.leer_parte(self.libro.parte_strings).decode('utf-8')
+        nuevos = ''.join(
+            f'<si><t xml:space="preserve">{escape(texto)}</t></si>' for texto in self._strings_nuevos
+        )
+        if '</sst>' not in sst:
+            vacio = re.search(r'<sst\b[^>]*?/>', sst)
+            if not vacio:
+                raise LayoutNoReconocido('sharedStrings sin elemento sst')
+            apertura = vacio.group(0)[:-2].rstrip() + '>'
+            sst = sst[:vacio.start()] + apertura + '</sst>' + sst[vacio.end():]
+        sst = sst.replace('</sst>', nuevos + '</sst>', 1)
+
+        def _sumar(match, nombre, delta):
+            return f'{nombre}="{int(match.group(1)) + delta}"'
+
+        apertura = re.search(r'<sst\b[^>]*>', sst).group(0)
+        referencias = self._referencias_nuevas - self._referencias_quitadas
+        nueva_apertura = re.sub(r'\bcount="(\d+)"', lambda m: _sumar(m, 'count', referencias), apertura)
+        nueva_apertura = re.sub(
+            r'\buniqueCount="(\d+)"',
+            lambda m: _sumar(m, 'uniqueCount', len(self._strings_nuevos)),
+            nueva_apertura,
+        )
+        sst = sst.replace(apertura, nueva_apertura, 1)
+        self.libro.reemplazar_parte(self.libro.parte_strings, sst.encode('utf-8'))
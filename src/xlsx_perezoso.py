@@ -0,0 +1,366 @@
+import os
+import posixpath
+import re
+import struct
+import time
+import zipfile
+import zlib
+from io import BytesIO
+from xml.etree import ElementTree as ET
+
+from openpyxl import Workbook
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import apply_stylesheet, write_stylesheet
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+from openpyxl.worksheet._reader import WorksheetReader
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.xml.functions import tostring
+
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL_DOC = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_REL_PKG = 'http://schemas.openxmlformats.org/package/2006/relationships'
+TIPO_OFFICE_DOCUMENT = NS_REL_DOC + '/officeDocument'
+TIPO_SHARED_STRINGS = NS_REL_DOC + '/sharedStrings'
+TIPO_STYLES = NS_REL_DOC + '/styles'
+TIPO_CALC_CHAIN = NS_REL_DOC + '/calcChain'
+
+# Registros ZIP segun la especificacion (APPNOTE.TXT 4.3.7, 4.3.12 y 4.3.16); los
+# equivalentes de zipfile son internos y pueden cambiar entre versiones de Python
+FIRMA_CABECERA_LOCAL = b'PK\x03\x04'
+FORMATO_CABECERA_LOCAL = '<4s2B4HL2L2H'
+LARGO_CABECERA_LOCAL = struct.calcsize(FORMATO_CABECERA_LOCAL)
+CAMPO_LARGO_NOMBRE = 10
+CAMPO_LARGO_EXTRA = 11
+FIRMA_DIRECTORIO_CENTRAL = b'PK\x01\x02'
+FORMATO_DIRECTORIO_CENTRAL = '<4s4B4HL2L5H2L'
+FIRMA_FIN_DIRECTORIO = b'PK\x05\x06'
+FORMATO_FIN_DIRECTORIO = '<4s4H2LH'
+FIRMA_DESCRIPTOR = b'PK\x07\x08'
+# Por encima de esto los tamanos y offsets pueden requerir registros ZIP64
+LIMITE_ZIP64 = (1 << 31) - 1
+
+
+class HojaNoSoportada(Exception):
+    """El paquete o la hoja no admite edicion parcial; usar load_workbook completo."""
+
+
+def _resolver_target(base_parte, target):
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_parte), target))
+
+
+def _ruta_rels(parte):
+    carpeta, nombre = posixpath.split(parte)
+    return posixpath.join(carpeta, '_rels', f'{nombre}.rels')
+
+
+def serializar_hoja(ws):
+    """XML de la parte de una hoja, con strings inline y estilos del libro de `ws`."""
+    ws._drawing = SpreadsheetDrawing()
+    ws._drawing.charts = ws._charts
+    ws._drawing.images = ws._images
+    out = BytesIO()
+    writer = WorksheetWriter(ws, out)
+    writer.write()
+    if len(writer._rels):
+        raise HojaNoSoportada('La hoja generada requiere relaciones nuevas')
+    if len(ws.parent.shared_strings):
+        raise HojaNoSoportada('La hoja generada usa strings compartidos')
+    return out.getvalue()
+
+
+class LibroXlsxPerezoso:
+    """
+    Acceso perezoso a un .xlsx sin cargar todas las hojas:
+    - localiza la hoja por xl/workbook.xml + relaciones
+    - carga solo esa hoja con openpyxl (estilos y strings compartidos del paquete)
+    - al guardar, reescribe esa parte y copia el resto de miembros del zip byte a byte
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._zip = zipfile.ZipFile(ruta)
+        self._miembros = {info.filename: info for info in self._zip.infolist()}
+        self._reemplazos = {}
+        self._eliminados = set()
+        self._estilos_originales = None
+        self._leer_indice()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def _leer_xml(self, parte):
+        try:
+            return ET.fromstring(self._zip.read(parte))
+        except KeyError:
+            raise HojaNoSoportada(f'Falta la parte {parte} en el paquete')
+
+    def _leer_indice(self):
+        rels_pkg = self._leer_xml('_rels/.rels')
+        self.parte_libro = None
+        for rel in rels_pkg.iter(f'{{{NS_REL_PKG}}}Relationship'):
+            if rel.get('Type') == TIPO_OFFICE_DOCUMENT:
+                self.parte_libro = _resolver_target('', rel.get('Target'))
+                break
+        if not self.parte_libro:
+            raise HojaNoSoportada('No se encontro el workbook principal')
+
+        self.rels_libro = _ruta_rels(self.parte_libro)
+        relaciones = {}
+        self.parte_strings = None
+        self.parte_estilos = None
+        self.parte_calc_chain = None
+        for rel in self._leer_xml(self.rels_libro).iter(f'{{{NS_REL_PKG}}}Relationship'):
+            destino = _resolver_target(self.parte_libro, rel.get('Target'))
+            relaciones[rel.get('Id')] = destino
+            tipo = rel.get('Type')
+            if tipo == TIPO_SHARED_STRINGS:
+                self.parte_strings = destino
+            elif tipo == TIPO_STYLES:
+                self.parte_estilos = destino
+            elif tipo == TIPO_CALC_CHAIN:
+                self.parte_calc_chain = destino
+
+        libro = self._leer_xml(self.parte_libro)
+        props = libro.find(f'{{{NS_MAIN}}}workbookPr')
+        self.fecha_1904 = props is not None and props.get('date1904') in ('1', 'true')
+
+        self._hojas = {}
+        for sheet in libro.iter(f'{{{NS_MAIN}}}sheet'):
+            rel_id = sheet.get(f'{{{NS_REL_DOC}}}id')
+            if rel_id in relaciones:
+                self._hojas[sheet.get('name')] = relaciones[rel_id]
+
+    @property
+    def nombres_hojas(self):
+        return list(self._hojas)
+
+    def ruta_parte(self, nombre_hoja):
+        try:
+            return self._hojas[nombre_hoja]
+        except KeyError:
+            raise HojaNoSoportada(f'La hoja "{nombre_hoja}" no existe en el libro')
+
+    def leer_parte(self, parte):
+        if parte in self._reemplazos:
+            return self._reemplazos[parte]
+        return self._zip.read(parte)
+
+    def reemplazar_parte(self, parte, datos):
+        if parte not in self._miembros:
+            raise HojaNoSoportada(f'La parte {parte} no existe en el paquete')
+        self._reemplazos[parte] = datos
+
+    def libro_con_estilos(self):
+        """Workbook vacio con la tabla de estilos del paquete (mismos indices de estilo)."""
+        wb = Workbook()
+        wb.remove(wb.active)
+        if self.fecha_1904:
+            wb.epoch = CALENDAR_MAC_1904
+        apply_stylesheet(self._zip, wb)
+        self._estilos_originales = len(wb._cell_styles)
+        return wb
+
+    def cargar_hoja(self, nombre_hoja, wb=None):
+        """Devuelve la hoja como Worksheet de openpyxl dentro de un libro de una sola hoja."""
+        parte = self.ruta_parte(nombre_hoja)
+        if _ruta_rels(parte) in self._miembros:
+            raise HojaNoSoportada(f'La hoja "{nombre_hoja}" tiene relaciones (dibujos, comentarios o tablas)')
+
+        if wb is None:
+            wb = self.libro_con_estilos()
+
+        strings = []
+        if self.parte_strings:
+            with self._zip.open(self.parte_strings) as src:
+                strings = read_string_table(src)
+
+        ws = wb.create_sheet(nombre_hoja)
+        with self._zip.open(parte) as fh:
+            WorksheetReader(ws, fh, strings, False, False).bind_all()
+        return ws
+
+    def actualizar_hoja(self, ws):
+        """Serializa la hoja cargada con cargar_hoja() sobre su parte original."""
+        self.reemplazar_parte(self.ruta_parte(ws.title), serializar_hoja(ws))
+        self.actualizar_estilos(ws.parent)
+        self.descartar_calc_chain()
+
+    def actualizar_estilos(self, wb):
+        """Reescribe styles.xml solo si el libro agrego estilos nuevos."""
+        if self._estilos_originales is not None and len(wb._cell_styles) > self._estilos_originales:
+            if not self.parte_estilos:
+                raise HojaNoSoportada('El libro no tiene tabla de estilos')
+            self.reemplazar_parte(self.parte_estilos, tostring(write_stylesheet(wb)))
+
+    def descartar_calc_chain(self):
+        """calcChain referencia celdas con formula; Excel lo reconstruye si falta."""
+        parte = self.parte_calc_chain
+        if not parte or parte not in self._miembros or parte in self._eliminados:
+            return
+        nombre = posixpath.basename(parte)
+        rels = self.leer_parte(self.rels_libro).decode('utf-8')
+        rels = re.sub(r'<Relationship\b[^>]*Target="[^"]*' + re.escape(nombre) + r'"[^>]*/>', '', rels)
+        self.reemplazar_parte(self.rels_libro, rels.encode('utf-8'))
+
+        tipos = self.leer_parte('[Content_Types].xml').decode('utf-8')
+        tipos = re.sub(r'<Override\b[^>]*PartName="/' + re.escape(parte) + r'"[^>]*/>', '', tipos)
+        self.reemplazar_parte('[Content_Types].xml', tipos.encode('utf-8'))
+        self._eliminados.add(parte)
+
+    def guardar(self, destino=None):
+        """Escribe el paquete: partes reemplazadas recomprimidas, el resto copiado en crudo."""
+        if destino is None:
+            destino = self.ruta
+        temporal = f'{destino}.tmp'
+
+        entradas = []
+        try:
+            with open(self.ruta, 'rb') as origen, open(temporal, 'wb') as out:
+                for info in self._zip.infolist():
+                    if info.filename in self._eliminados:
+                        continue
+                    offset = out.tell()
+                    if info.filename in self._reemplazos:
+                        info = self._escribir_miembro(out, info, self._reemplazos[info.filename])
+                    else:
+                        self._copiar_miembro_crudo(origen, out, info)
+                    entradas.append((info, offset))
+
+                inicio_directorio = out.tell()
+                for info, offset in entradas:
+                    out.write(self._registro_central(info, offset))
+                fin_directorio = out.tell()
+                out.write(struct.pack(
+                    FORMATO_FIN_DIRECTORIO,
+                    FIRMA_FIN_DIRECTORIO,
+                    0,
+                    0,
+                    len(entradas),
+                    len(entradas),
+                    fin_directorio - inicio_directorio,
+                    inicio_directorio,
+                    0,
+                ))
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        self.cerrar()
+        os.replace(temporal, destino)
+        return destino
+
+    def _copiar_miembro_crudo(self, origen, out, info):
+        if info.file_size >= LIMITE_ZIP64 or info.header_offset >= LIMITE_ZIP64:
+            raise HojaNoSoportada('Los paquetes ZIP64 no se copian en crudo')
+
+        origen.seek(info.header_offset)
+        cabecera = origen.read(LARGO_CABECERA_LOCAL)
+        if len(cabecera) != LARGO_CABECERA_LOCAL:
+            raise HojaNoSoportada(f'Miembro truncado: {info.filename}')
+        campos = struct.unpack(FORMATO_CABECERA_LOCAL, cabecera)
+        if campos[0] != FIRMA_CABECERA_LOCAL:
+            raise HojaNoSoportada(f'Cabecera local invalida en {info.filename}')
+
+        largo = (
+            LARGO_CABECERA_LOCAL
+            + campos[CAMPO_LARGO_NOMBRE]
+            + campos[CAMPO_LARGO_EXTRA]
+            + info.compress_size
+        )
+        if info.flag_bits & 0x08:
+            origen.seek(info.header_offset + largo)
+            firma = origen.read(4)
+            largo += 16 if firma == FIRMA_DESCRIPTOR else 12
+
+        origen.seek(info.header_offset)
+        pendiente = largo
+        while pendiente:
+            bloque = origen.read(min(pendiente, 1024 * 1024))
+            if not bloque:
+                raise HojaNoSoportada(f'Miembro truncado: {info.filename}')
+            out.write(bloque)
+            pendiente -= len(bloque)
+
+    def _escribir_miembro(self, out, info_original, datos):
+        compresor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        comprimido = compresor.compress(datos) + compresor.flush()
+
+        info = zipfile.ZipInfo(info_original.filename, date_time=time.localtime(time.time())[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.create_system = info_original.create_system
+        info.external_attr = info_original.external_attr
+        info.flag_bits = 0x800 if not info.filename.isascii() else 0
+        info.CRC = zlib.crc32(datos)
+        info.compress_size = len(comprimido)
+        info.file_size = len(datos)
+        info.extra = b''
+
+        nombre = info.filename.encode('utf-8' if info.flag_bits & 0x800 else 'ascii')
+        dostime, dosdate = self._fecha_dos(info.date_time)
+        out.write(struct.pack(
+            FORMATO_CABECERA_LOCAL,
+            FIRMA_CABECERA_LOCAL,
+            info.extract_version,
+            info.reserved,
+            info.flag_bits,
+            info.compress_type,
+            dostime,
+            dosdate,
+            info.CRC,
+            info.compress_size,
+            info.file_size,
+            len(nombre),
+            0,
+        ))
+        out.write(nombre)
+        out.write(comprimido)
+        return info
+
+    def _fecha_dos(self, date_time):
+        anio, mes, dia, hora, minuto, segundo = date_time
+        dosdate = (max(anio, 1980) - 1980) << 9 | mes << 5 | dia
+        dostime = hora << 11 | minuto << 5 | (segundo // 2)
+        return dostime, dosdate
+
+    def _registro_central(self, info, offset):
+        if info.flag_bits & 0x800:
+            nombre = info.filename.encode('utf-8')
+        else:
+            nombre = info.filename.encode('cp437')
+        dostime, dosdate = self._fecha_dos(info.date_time)
+        cabecera = struct.pack(
+            FORMATO_DIRECTORIO_CENTRAL,
+            FIRMA_DIRECTORIO_CENTRAL,
+            info.create_version,
+            info.create_system,
+            info.extract_version,
+            info.reserved,
+            info.flag_bits,
+            info.compress_type,
+            dostime,
+            dosdate,
+            info.CRC,
+            info.compress_size,
+            info.file_size,
+            len(nombre),
+            len(info.extra),
+            len(info.comment),
+            0,
+            info.internal_attr,
+            info.external_attr,
+            offset,
+        )
+        return cabecera + nombre + info.extra + info.comment
@@ -0,0 +1,132 @@
+"""
+PATCH /api/config: semantica JSON Merge Patch (RFC 7396), If-Match con 412 y
+escritura atomica de configuracion.json.
+"""
+
+import contextlib
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / 'src'))
+
+import config_archivo  # noqa: E402
+import web_server  # noqa: E402
+
+
+def test_null_borra_y_los_objetos_se_fusionan():
+    actual = {'a': 1, 'b': {'c': 2, 'd': 3}, 'lista': [1, 2], 'e': 'x'}
+    parche = {'a': None, 'b': {'d': None, 'f': 4}, 'lista': [3], 'nuevo': {'g': None, 'h': 5}}
+
+    assert config_archivo.fusionar_parche(actual, parche) == {
+        'b': {'c': 2, 'f': 4},
+        'lista': [3],
+        'e': 'x',
+        'nuevo': {'h': 5},
+    }
+    # El original no se modifica
+    assert actual == {'a': 1, 'b': {'c': 2, 'd': 3}, 'lista': [1, 2], 'e': 'x'}
+
+
+def test_un_valor_no_objeto_reemplaza_completo():
+    assert config_archivo.fusionar_parche({'a': {'b': 1}}, {'a': 7}) == {'a': 7}
+    assert config_archivo.fusionar_parche({'a': 7}, {'a': {'b': None, 'c': 1}}) == {'a': {'c': 1}}
+    assert config_archivo.fusionar_parche({'a': 1}, ['x']) == ['x']
+
+
+def _temporales(carpeta):
+    return list(carpeta.glob('.configuracion_*.tmp'))
+
+
+def test_aplicar_parche_escribe_atomico_sin_temporales(tmp_path):
+    ruta = tmp_path / 'configuracion.json'
+    ruta.write_text(json.dumps({'sueldo': {'valor_fijo': 1}, 'otro': True}), encoding='utf-8')
+
+    nueva = config_archivo.aplicar_parche(str(ruta), {'sueldo': {'valor_fijo': 2}})
+
+    assert nueva == {'sueldo': {'valor_fijo': 2}, 'otro': True}
+    assert json.loads(ruta.read_text(encoding='utf-8')) == nueva
+    assert _temporales(tmp_path) == []
+
+
+def test_escritura_fallida_deja_el_archivo_anterior(tmp_path):
+    ruta = tmp_path / 'configuracion.json'
+    ruta.write_text('{"a": 1}', encoding='utf-8')
+
+    with pytest.raises(TypeError):
+        config_archivo.aplicar_parche(str(ruta), {'b': object()})
+
+    assert ruta.read_text(encoding='utf-8') == '{"a": 1}'
+    assert _temporales(tmp_path) == []
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    ruta = tmp_path / 'configuracion.json'
+    ruta.write_text((RAIZ / 'config' / 'configuracion.example.json').read_text(encoding='utf-8-sig'), encoding='utf-8')
+    monkeypatch.setattr(web_server, 'CONFIG_FILE', ruta)
+    monkeypatch.setattr(web_server, 'CONFIG_CACHE', web_server.CacheConfig(ruta))
+    return ruta
+
+
+def _pedir(metodo, cuerpo=b'', **cabeceras):
+    cabeceras = {clave.replace('_', '-'): valor for clave, valor in cabeceras.items()}
+    if not isinstance(cuerpo, bytes):
+        cuerpo = json.dumps(cuerpo).encode('utf-8')
+    with contextlib.redirect_stdout(io.StringIO()):
+        return web_server.atender_api(web_server.Peticion(metodo, '/api/config', cabeceras, cuerpo))
+
+
+def _leer(ruta):
+    return json.loads(ruta.read_text(encoding='utf-8'))
+
+
+def test_patch_aplica_solo_las_rutas_enviadas(config):
+    etag = _pedir('GET').cabeceras['ETag']
+    antes = _leer(config)
+
+    respuesta = _pedir('PATCH', {'sueldo': {'valor_fijo': 123, 'moneda': None}, 'historial_saldos': None},
+                       content_type='application/merge-patch+json', if_match=etag)
+
+    assert respuesta.estado == 200
+    assert respuesta.cabeceras['ETag'] != etag
+    assert respuesta.cabeceras['ETag'] == _pedir('GET').cabeceras['ETag']
+    despues = _leer(config)
+    assert despues['sueldo']['valor_fijo'] == 123
+    assert 'historial_saldos' not in despues and 'historial_saldos' in antes
+    assert 'moneda' not in despues['sueldo']
+    assert {k: v for k, v in despues.items() if k not in ('sueldo', 'historial_saldos')} == \
+        {k: v for k, v in antes.items() if k not in ('sueldo', 'historial_saldos')}
+    assert _temporales(config.parent) == []
+
+
+@pytest.mark.parametrize('cuerpo', [[{'sueldo': None}], 'texto', 5, b'{no es json'])
+def test_patch_que_no_es_objeto_da_400(config, cuerpo):
+    antes = config.read_bytes()
+    assert _pedir('PATCH', cuerpo, content_type='application/merge-patch+json').estado == 400
+    assert config.read_bytes() == antes
+
+
+def test_patch_con_etag_vencido_da_412(config):
+    etag_viejo = _pedir('GET').cabeceras['ETag']
+    assert _pedir('PATCH', {'sueldo': {'valor_fijo': 1}}, if_match=etag_viejo).estado == 200
+    antes = config.read_bytes()
+
+    respuesta = _pedir('PATCH', {'sueldo': {'valor_fijo': 2}}, if_match=etag_viejo)
+
+    assert respuesta.estado == 412
+    assert respuesta.cabeceras['ETag'] == _pedir('GET').cabeceras['ETag']
+    assert config.read_bytes() == antes
+    # Un ETag debil nunca satisface If-Match
+    assert _pedir('PATCH', {'sueldo': {'valor_fijo': 2}}, if_match='W/' + respuesta.cabeceras['ETag']).estado == 412
+
+
+def test_patch_con_otro_content_type_da_415(config):
+    with pytest.raises(web_server.ErrorHttp) as error:
+        _pedir('PATCH', {'a': 1}, content_type='text/plain')
+    assert error.value.estado == 415
@@ -0,0 +1,151 @@
+"""
+Subida condicional con conflicto sobre el Drive simulado: lo que local cambio fuera
+de H:K (hojas nuevas, fijos reconstruidos, hojas retiradas) no se pierde al fusionar
+con una edicion concurrente del celular.
+"""
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+import google_drive_v2  # noqa: E402
+from drive_simulado import HttpDriveSimulado  # noqa: E402
+from excel_mensual import GeneradorExcelMensual  # noqa: E402
+
+
+def _gasto(concepto, monto=1000):
+    return {'monto': monto, 'concepto': concepto, 'categoria': 'Otros', 'fecha': '2026-10-01'}
+
+
+class Escenario:
+    """Excel ya sincronizado en un Drive simulado y un libro local descargado de el."""
+
+    def __init__(self, carpeta):
+        config = json.loads((RAIZ / 'config' / 'configuracion.example.json').read_text(encoding='utf-8'))
+        config['google_drive'] = {
+            'archivo_excel_id': '',
+            'carpeta_backup_id': '',
+            'subida': {'espera_base_s': 0.01},
+            'simulado': {'directorio': str(carpeta / 'drive')},
+            'cambios': {'intervalo_s': 0},
+        }
+        self.config_path = str(carpeta / 'configuracion.json')
+        self._guardar_config(config)
+        self.carpeta = carpeta
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert google_drive_v2.sincronizar_con_drive(self.config_path, 'actual')['success']
+        self.file_id = self.config['google_drive']['archivo_excel_id']
+        self.simulado = HttpDriveSimulado(str(carpeta / 'drive'))
+        self.generador = GeneradorExcelMensual(self.config_path)
+        self.hoja = self.remoto().sheetnames[0]
+
+    @property
+    def config(self):
+        with open(self.config_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _guardar_config(self, config):
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+    def drive(self):
+        drive = google_drive_v2.GoogleDriveManager(self.config_path)
+        assert drive.autenticar()
+        return drive
+
+    def descargar(self, drive):
+        return drive.descargar_excel_drive(str(self.carpeta / 'local.xlsx'))
+
+    def remoto(self):
+        contenido = (self.carpeta / 'drive' / 'contenido' / self.file_id).read_bytes()
+        return openpyxl.load_workbook(io.BytesIO(contenido))
+
+    def editar_en_celular(self, *conceptos):
+        wb = self.remoto()
+        for concepto in conceptos:
+            self.generador.agregar_gasto_a_hoja(wb[self.hoja], _gasto(concepto))
+        datos = io.BytesIO()
+        wb.save(datos)
+        self.simulado.simular_edicion_remota(self.file_id, datos.getvalue())
+
+    def conceptos(self, hoja):
+        return sorted(fila[1] for fila in self.generador._extraer_registros_existentes(self.remoto()[hoja]))
+
+
+@pytest.fixture
+def escenario(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return Escenario(tmp_path)
+
+
+def test_hoja_nueva_local_sobrevive_a_edicion_remota(escenario):
+    drive = escenario.drive()
+    ruta = escenario.descargar(drive)
+    wb = openpyxl.load_workbook(ruta)
+    escenario.generador.agregar_gasto_a_hoja(wb[escenario.hoja], _gasto('local'))
+    # Lo que hace sincronizar_con_drive('siguiente') con un mes que aun no existe
+    escenario.generador.crear_o_actualizar_hoja_mes(wb, 'Enero', 2099)
+    wb.save(ruta)
+
+    escenario.editar_en_celular('celular')
+    assert drive.subir_excel_drive(ruta, actualizar=True)
+
+    assert escenario.remoto().sheetnames == [escenario.hoja, 'Enero 2099']
+    assert escenario.conceptos(escenario.hoja) == ['celular', 'local']
+    assert escenario.conceptos('Enero 2099') == []
+
+
+def test_fijos_reconstruidos_en_local_se_conservan(escenario):
+    drive = escenario.drive()
+    ruta = escenario.descargar(drive)
+
+    # Cambio de un gasto fijo y regeneracion de la hoja, como regenerar_rango_con_drive
+    config = escenario.config
+    clave = next(iter(config['gastos_fijos']))
+    config['gastos_fijos'][clave]['valor'] = 987654
+    escenario._guardar_config(config)
+    generador = GeneradorExcelMensual(escenario.config_path)
+    wb = openpyxl.load_workbook(ruta)
+    mes, anio = escenario.hoja.split()
+    generador.crear_o_actualizar_hoja_mes(wb, mes, int(anio))
+    wb.save(ruta)
+
+    escenario.editar_en_celular('celular')
+    assert drive.subir_excel_drive(ruta, actualizar=True)
+
+    ws = escenario.remoto()[escenario.hoja]
+    fijos = [ws[f'D{fila}'].value for fila in range(generador.FILA_FIJOS_DATA_INICIO, generador.FILA_FIJOS_DATA_FIN + 1)]
+    assert 987654 in fijos
+    assert escenario.conceptos(escenario.hoja) == ['celular']
+
+
+def test_hoja_retirada_en_local_no_vuelve(escenario):
+    drive = escenario.drive()
+    ruta = escenario.descargar(drive)
+    wb = openpyxl.load_workbook(ruta)
+    escenario.generador.crear_o_actualizar_hoja_mes(wb, 'Enero', 2020)
+    wb.save(ruta)
+    assert drive.subir_excel_drive(ruta, actualizar=True)
+
+    drive = escenario.drive()
+    ruta = escenario.descargar(drive)
+    wb = openpyxl.load_workbook(ruta)
+    # Lo que hace archivar_anios_cerrados con un anio ya archivado
+    wb.remove(wb['Enero 2020'])
+    wb.save(ruta)
+
+    escenario.editar_en_celular('celular')
+    assert drive.subir_excel_drive(ruta, actualizar=True)
+
+    assert escenario.remoto().sheetnames == [escenario.hoja]
+    assert escenario.conceptos(escenario.hoja) == ['celular']
@@ -0,0 +1,190 @@
+"""
+Parche directo del XML de la hoja (H:K): el libro resultante lo lee openpyxl con los
+mismos valores que la ruta openpyxl, sharedStrings queda consistente y un layout
+desconocido cae a la ruta openpyxl sin tocar el archivo.
+"""
+
+import contextlib
+import io
+import re
+import sys
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import openpyxl
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+from bot_whatsapp import GestorExcel  # noqa: E402
+from excel_mensual import GeneradorExcelMensual  # noqa: E402
+from variables_xml import LayoutNoReconocido, ParcheVariablesXml  # noqa: E402
+from xlsx_perezoso import LibroXlsxPerezoso  # noqa: E402
+
+CONFIG = str(RAIZ / 'config' / 'configuracion.example.json')
+HOJA = 'Febrero 2026'
+GASTOS = [
+    {'monto': 4500, 'concepto': 'pan & cafe <ñ> "x"', 'categoria': 'Alimentacion', 'fecha': '2026-02-10'},
+    {'monto': 12000.5, 'concepto': 'taxi', 'categoria': 'Transporte', 'fecha': '2026-02-10'},
+    {'monto': 3000, 'concepto': 'taxi', 'categoria': 'Transporte', 'fecha': '2026-02-11'},
+]
+
+RE_INLINE = re.compile(r'<c ([^>]*?) t="inlineStr"><is>(?:<t[^>]*/>|<t[^>]*>(.*?)</t>)</is></c>', re.S)
+TIPO_SST = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+CONTENIDO_SST = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+
+
+@pytest.fixture
+def generador():
+    return GeneradorExcelMensual(CONFIG)
+
+
+def _crear_libro(ruta, generador):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mes in ('Enero', 'Febrero'):
+            generador.crear_o_actualizar_hoja_mes(wb, mes, 2026)
+    wb.save(ruta)
+    return ruta
+
+
+def _con_shared_strings(ruta):
+    """Pasa los textos inline a sharedStrings con count/uniqueCount, como guarda Excel."""
+    with zipfile.ZipFile(ruta) as z:
+        miembros = {info.filename: z.read(info) for info in z.infolist()}
+
+    textos, indices, referencias = [], {}, 0
+
+    def _compartir(match):
+        nonlocal referencias
+        texto = match.group(2) or ''
+        if texto not in indices:
+            indices[texto] = len(textos)
+            textos.append(texto)
+        referencias += 1
+        return f'<c {match.group(1)} t="s"><v>{indices[texto]}</v></c>'
+
+    for nombre in [n for n in miembros if n.startswith('xl/worksheets/')]:
+        miembros[nombre] = RE_INLINE.sub(_compartir, miembros[nombre].decode('utf-8')).encode('utf-8')
+
+    si = ''.join(f'<si><t>{texto}</t></si>' for texto in textos)
+    miembros['xl/sharedStrings.xml'] = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        f'count="{referencias}" uniqueCount="{len(textos)}">{si}</sst>'
+    ).encode('utf-8')
+    rels = miembros['xl/_rels/workbook.xml.rels'].decode('utf-8')
+    miembros['xl/_rels/workbook.xml.rels'] = rels.replace(
+        '</Relationships>', f'<Relationship Id="rIdSst" Type="{TIPO_SST}" Target="sharedStrings.xml"/></Relationships>'
+    ).encode('utf-8')
+    tipos = miembros['[Content_Types].xml'].decode('utf-8')
+    miembros['[Content_Types].xml'] = tipos.replace(
+        '</Types>', f'<Override PartName="/xl/sharedStrings.xml" ContentType="{CONTENIDO_SST}"/></Types>'
+    ).encode('utf-8')
+
+    with zipfile.ZipFile(ruta, 'w', zipfile.ZIP_DEFLATED) as z:
+        for nombre, datos in miembros.items():
+            z.writestr(nombre, datos)
+    return ruta
+
+
+def _parchear(ruta, generador, gastos=GASTOS):
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        filas = ParcheVariablesXml(libro, HOJA, generador).agregar(gastos)
+        libro.guardar()
+    return filas
+
+
+def _esperado(ruta, generador, gastos=GASTOS):
+    """H:K que deja la ruta openpyxl con los mismos gastos."""
+    wb = openpyxl.load_workbook(ruta)
+    for gasto in gastos:
+        generador.agregar_gasto_a_hoja(wb[HOJA], gasto)
+    return _hk(wb[HOJA])
+
+
+def _hk(ws):
+    return [[ws[f'{col}{fila}'].value or None for col in 'HIJK'] for fila in range(4, 29)]
+
+
+@pytest.mark.parametrize('compartidos', [False, True], ids=['inline', 'sharedStrings'])
+def test_parche_equivale_a_la_ruta_openpyxl(tmp_path, generador, compartidos):
+    ruta = _crear_libro(tmp_path / 'libro.xlsx', generador)
+    if compartidos:
+        _con_shared_strings(ruta)
+    esperado = _esperado(ruta, generador)
+    enero = _hk(openpyxl.load_workbook(ruta)['Enero 2026'])
+
+    filas = _parchear(ruta, generador)
+
+    assert len(filas) == len(GASTOS)
+    wb = openpyxl.load_workbook(ruta)
+    assert _hk(wb[HOJA]) == esperado
+    assert [[4500, 'pan & cafe <ñ> "x"', 'Alimentacion', '2026-02-10']] == [
+        fila for fila in _hk(wb[HOJA]) if fila[1] == 'pan & cafe <ñ> "x"'
+    ]
+    assert wb[HOJA]['H29'].value == '=SUM(H4:H28)'
+    assert _hk(wb['Enero 2026']) == enero
+
+
+def test_shared_strings_quedan_consistentes(tmp_path, generador):
+    ruta = _con_shared_strings(_crear_libro(tmp_path / 'libro.xlsx', generador))
+    _parchear(ruta, generador)
+
+    with zipfile.ZipFile(ruta) as z:
+        sst = z.read('xl/sharedStrings.xml').decode('utf-8')
+        hojas = [z.read(n).decode('utf-8') for n in z.namelist() if n.startswith('xl/worksheets/')]
+    textos = re.findall(r'<si>.*?</si>', sst, re.S)
+    apertura = re.search(r'<sst\b[^>]*>', sst).group(0)
+    referencias = sum(len(re.findall(r'<c [^>]*t="s"', hoja)) for hoja in hojas)
+
+    assert f'uniqueCount="{len(textos)}"' in apertura
+    assert f'count="{referencias}"' in apertura
+    # Los textos repetidos reutilizan el indice existente
+    assert sum(escape('taxi') in si for si in textos) == 1
+    assert sum('Transporte' in si for si in textos) == 1
+
+
+def test_tabla_llena_no_escribe_de_mas(tmp_path, generador):
+    ruta = _crear_libro(tmp_path / 'libro.xlsx', generador)
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        libres = len(ParcheVariablesXml(libro, HOJA, generador).filas_libres())
+    gastos = [dict(GASTOS[1], concepto=f'gasto {i}') for i in range(libres + 3)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        filas = _parchear(ruta, generador, gastos)
+
+    assert len(filas) == libres
+    assert openpyxl.load_workbook(ruta)[HOJA]['H29'].value == '=SUM(H4:H28)'
+
+
+@pytest.mark.parametrize('celda, valor', [('I3', 'Detalle'), ('H29', '=SUM(H4:H20)')])
+def test_layout_desconocido_se_rechaza(tmp_path, generador, celda, valor):
+    ruta = _crear_libro(tmp_path / 'libro.xlsx', generador)
+    wb = openpyxl.load_workbook(ruta)
+    wb[HOJA][celda] = valor
+    wb.save(ruta)
+
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        with pytest.raises(LayoutNoReconocido):
+            ParcheVariablesXml(libro, HOJA, generador)
+
+
+def test_gestor_cae_a_openpyxl_con_layout_desconocido(tmp_path, generador, monkeypatch):
+    ruta = _crear_libro(tmp_path / 'libro.xlsx', generador)
+    wb = openpyxl.load_workbook(ruta)
+    wb[HOJA]['I3'] = 'Detalle'
+    wb.save(ruta)
+    antes = ruta.read_bytes()
+
+    gestor = GestorExcel(CONFIG)
+    monkeypatch.setattr(gestor, '_nombre_hoja_actual', lambda: (HOJA, 'Febrero', 2026))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not gestor._agregar_con_parche_xml(str(ruta), generador, GASTOS)
+        assert ruta.read_bytes() == antes
+        assert gestor._agregar_en_hoja_parcial(str(ruta), generador, GASTOS)
+
+    conceptos = [fila[1] for fila in _hk(openpyxl.load_workbook(ruta)[HOJA])]
+    assert conceptos.count('taxi') == 2
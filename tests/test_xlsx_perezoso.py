@@ -0,0 +1,153 @@
+"""
+Reescritura parcial del paquete xlsx: la hoja editada se recomprime, el resto de
+miembros se copia en crudo y el resultado lo abren zipfile y openpyxl sin perder nada.
+"""
+
+import contextlib
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+import openpyxl
+import pytest
+from openpyxl.comments import Comment
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / 'src'))
+
+from excel_mensual import GeneradorExcelMensual  # noqa: E402
+from xlsx_perezoso import HojaNoSoportada, LibroXlsxPerezoso  # noqa: E402
+
+HOJAS = ('Enero 2026', 'Febrero 2026', 'Marzo 2026')
+
+
+def _gasto(concepto, monto=1000):
+    return {'monto': monto, 'concepto': concepto, 'categoria': 'Otros', 'fecha': '2026-02-10'}
+
+
+@pytest.fixture
+def generador():
+    return GeneradorExcelMensual(str(RAIZ / 'config' / 'configuracion.example.json'))
+
+
+@pytest.fixture
+def ruta(tmp_path, generador):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for nombre in HOJAS:
+            mes, anio = nombre.split()
+            generador.crear_o_actualizar_hoja_mes(wb, mes, int(anio))
+    ruta = tmp_path / 'libro.xlsx'
+    wb.save(ruta)
+    return ruta
+
+
+def _miembros(ruta):
+    with zipfile.ZipFile(ruta) as z:
+        return {nombre: z.read(nombre) for nombre in z.namelist()}
+
+
+def _hk(ws):
+    return [[ws[f'{col}{fila}'].value for col in 'HIJK'] for fila in range(4, 29)]
+
+
+def test_guardar_reescribe_la_hoja_y_copia_el_resto(ruta, generador):
+    original = ruta.read_bytes()
+    antes = _miembros(ruta)
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        assert libro.nombres_hojas == list(HOJAS)
+        parte = libro.ruta_parte('Febrero 2026')
+        ws = libro.cargar_hoja('Febrero 2026')
+        generador.agregar_gasto_a_hoja(ws, _gasto('pan & cafe <ñ>', 4500))
+        libro.actualizar_hoja(ws)
+        libro.guardar()
+
+    with zipfile.ZipFile(ruta) as z:
+        assert z.testzip() is None
+    despues = _miembros(ruta)
+    assert set(despues) == set(antes)
+    assert despues[parte] != antes[parte]
+    # Lo que no se toco sale byte a byte igual
+    assert all(despues[n] == antes[n] for n in antes if n not in (parte, 'xl/styles.xml'))
+
+    wb = openpyxl.load_workbook(ruta)
+    assert wb.sheetnames == list(HOJAS)
+    ws = wb['Febrero 2026']
+    assert [4500, 'pan & cafe <ñ>', 'Otros', '2026-02-10'] in _hk(ws)
+    assert ws['H29'].value == '=SUM(H4:H28)'
+    assert _hk(wb['Enero 2026']) == _hk(openpyxl.load_workbook(io.BytesIO(original))['Enero 2026'])
+
+
+def test_guardar_en_otro_destino_no_modifica_el_origen(ruta, tmp_path, generador):
+    antes = ruta.read_bytes()
+    destino = tmp_path / 'copia.xlsx'
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        ws = libro.cargar_hoja('Marzo 2026')
+        generador.agregar_gasto_a_hoja(ws, _gasto('copia'))
+        libro.actualizar_hoja(ws)
+        libro.guardar(str(destino))
+
+    assert ruta.read_bytes() == antes
+    assert not (tmp_path / 'copia.xlsx.tmp').exists()
+    conceptos = [fila[1] for fila in _hk(openpyxl.load_workbook(destino)['Marzo 2026'])]
+    assert 'copia' in conceptos
+
+
+class _SinPosicion(io.RawIOBase):
+    """Destino no posicionable: zipfile escribe cada miembro con descriptor de datos."""
+
+    def __init__(self):
+        self.datos = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        return self.datos.write(datos)
+
+    def tell(self):
+        raise OSError('sin posicion')
+
+
+def test_miembros_con_descriptor_de_datos_se_copian_enteros(ruta, generador):
+    destino = _SinPosicion()
+    with zipfile.ZipFile(ruta) as origen, zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as z:
+        for info in origen.infolist():
+            z.writestr(info.filename, origen.read(info))
+    ruta.write_bytes(destino.datos.getvalue())
+    with zipfile.ZipFile(ruta) as z:
+        assert all(info.flag_bits & 0x08 for info in z.infolist())
+
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        ws = libro.cargar_hoja('Enero 2026')
+        generador.agregar_gasto_a_hoja(ws, _gasto('descriptor'))
+        libro.actualizar_hoja(ws)
+        libro.guardar()
+
+    with zipfile.ZipFile(ruta) as z:
+        assert z.testzip() is None
+    wb = openpyxl.load_workbook(ruta)
+    assert 'descriptor' in [fila[1] for fila in _hk(wb['Enero 2026'])]
+    assert wb['Marzo 2026']['H29'].value == '=SUM(H4:H28)'
+
+
+def test_hoja_con_relaciones_no_se_edita_en_parcial(ruta):
+    wb = openpyxl.load_workbook(ruta)
+    wb['Febrero 2026']['A1'].comment = Comment('nota', 'celular')
+    wb.save(ruta)
+
+    with LibroXlsxPerezoso(str(ruta)) as libro:
+        with pytest.raises(HojaNoSoportada):
+            libro.cargar_hoja('Febrero 2026')
+        # Las demas hojas siguen admitiendo la ruta parcial
+        assert libro.cargar_hoja('Enero 2026').title == 'Enero 2026'
+
+
+def test_paquete_sin_workbook_se_rechaza(tmp_path):
+    ruta = tmp_path / 'roto.xlsx'
+    with zipfile.ZipFile(ruta, 'w') as z:
+        z.writestr('_rels/.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"/>')
+    with pytest.raises(HojaNoSoportada):
+        LibroXlsxPerezoso(str(ruta))
@@ -1,6 +1,9 @@
 ﻿class ConfigManager {
     constructor() {
         this.config = null;
+        // Version guardada en el servidor (para enviar solo lo que cambio) y su ETag
+        this.configBase = null;
+        this.configEtag = null;
         this.currentSection = 'dashboard';
         this.editingGasto = null;
         this.editingDeuda = null;
@@ -21,7 +24,9 @@
             if (!response.ok) {
                 throw new Error('No se pudo cargar la configuración');
             }
+            this.configEtag = response.headers.get('ETag');
             this.config = await response.json();
+            this.configBase = this.clonar(this.config);
             this.config.presupuesto_variables = this.config.presupuesto_variables || 0;
             this.config.deudas_fijas = this.config.deudas_fijas || {};
             this.config.saldo_bancario = this.config.saldo_bancario || {
@@ -1196,29 +1201,32 @@
 
     async saveConfig(showSuccessToast = true) {
         try {
-            // Enviar los datos al servidor
-            const response = await fetch('/api/config', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(this.config, null, 2)
-            });
-            
-            if (!response.ok) {
-                throw new Error('Error al guardar en el servidor');
-            }
-            
-            const result = await response.json();
-            
-            if (result.status === 'ok') {
-                if (showSuccessToast) {
-                    this.showToast('Configuración guardada correctamente', 'success');
+            // Solo se envia lo que cambio desde la ultima version leida/guardada (JSON Merge Patch)
+            const parche = this.diferenciaParche(this.configBase, this.config);
+            if (parche !== undefined) {
+                let response = await this.enviarParcheConfig(parche);
+                if (response.status === 412) {
+                    // Otro cliente o el bot guardo antes: se toma su version y se reaplica el parche
+                    await this.refrescarVersionConfig(parche);
+                    response = await this.enviarParcheConfig(parche);
                 }
-                return true;
-            } else {
-                throw new Error('Respuesta del servidor no válida');
+
+                if (!response.ok) {
+                    throw new Error('Error al guardar en el servidor');
+                }
+
+                const result = await response.json();
+                if (result.status !== 'ok') {
+                    throw new Error('Respuesta del servidor no válida');
+                }
+                this.configEtag = response.headers.get('ETag') || this.configEtag;
+                this.configBase = this.aplicarParche(this.configBase, parche);
+            }
+
+            if (showSuccessToast) {
+                this.showToast('Configuración guardada correctamente', 'success');
             }
+            return true;
         } catch (error) {
             console.error('Error guardando configuración:', error);
             this.showToast('Error al guardar. Descargando archivo manualmente...', 'warning');
@@ -1241,6 +1249,77 @@
         }
     }
 
+    enviarParcheConfig(parche) {
+        const headers = { 'Content-Type': 'application/merge-patch+json' };
+        if (this.configEtag) {
+            headers['If-Match'] = this.configEtag;
+        }
+        return fetch('/api/config', {
+            method: 'PATCH',
+            headers,
+            body: JSON.stringify(parche)
+        });
+    }
+
+    async refrescarVersionConfig(parche) {
+        const response = await fetch('/api/config', { cache: 'no-cache' });
+        if (!response.ok) {
+            throw new Error('No se pudo releer la configuración');
+        }
+        this.configEtag = response.headers.get('ETag');
+        this.configBase = await response.json();
+        this.config = this.aplicarParche(this.configBase, parche);
+        this.updateUI();
+        this.renderAll();
+    }
+
+    clonar(valor) {
+        return valor === undefined ? undefined : JSON.parse(JSON.stringify(valor));
+    }
+
+    esObjetoPlano(valor) {
+        return valor !== null && typeof valor === 'object' && !Array.isArray(valor);
+    }
+
+    // Parche RFC 7396 que lleva de `antes` a `despues`; undefined si no hay cambios.
+    // Las listas se envian completas y una clave borrada va como null.
+    diferenciaParche(antes, despues) {
+        if (!this.esObjetoPlano(antes) || !this.esObjetoPlano(despues)) {
+            return JSON.stringify(antes) === JSON.stringify(despues) ? undefined : this.clonar(despues);
+        }
+        const parche = {};
+        Object.keys(antes).forEach((clave) => {
+            if (despues[clave] === undefined) {
+                parche[clave] = null;
+            }
+        });
+        Object.keys(despues).forEach((clave) => {
+            if (despues[clave] === undefined) {
+                return;
+            }
+            const cambio = this.diferenciaParche(antes[clave], despues[clave]);
+            if (cambio !== undefined) {
+                parche[clave] = cambio;
+            }
+        });
+        return Object.keys(parche).length ? parche : undefined;
+    }
+
+    aplicarParche(destino, parche) {
+        if (!this.esObjetoPlano(parche)) {
+            return this.clonar(parche);
+        }
+        const resultado = this.esObjetoPlano(destino) ? { ...destino } : {};
+        Object.entries(parche).forEach(([clave, valor]) => {
+            if (valor === null) {
+                delete resultado[clave];
+            } else {
+                resultado[clave] = this.aplicarParche(resultado[clave], valor);
+            }
+        });
+        return resultado;
+    }
+
     async generarExcel(tipo) {
         const monthMode = tipo === 'siguiente' ? 'siguiente' : 'actual';
         this.showToast(
@@ -1254,15 +1333,24 @@
                 throw new Error('No se pudo guardar la configuracion antes de sincronizar');
             }
 
-            const response = await fetch('/api/sync-drive', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ month_mode: monthMode }),
-            });
+            const operacion = this.nuevaOperacion('sync');
+            const dejarDeSeguir = this.seguirProgreso(operacion, (evento) => this.mostrarProgresoSync(evento));
+            let response;
+            let result;
+            try {
+                response = await fetch('/api/sync-drive', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({ month_mode: monthMode, operacion }),
+                });
+                result = await response.json();
+            } finally {
+                dejarDeSeguir();
+                this.ocultarProgresoSync();
+            }
 
-            const result = await response.json();
             if (!response.ok || !result.success) {
                 throw new Error(result.message || 'No se pudo crear/sincronizar la hoja');
             }
@@ -1572,12 +1660,14 @@ Para más información, revisa la documentación en docs/`);
             return;
         }
 
-        // Mostrar estado de sincronizacion solo en el boton principal.
+        // Estado de sincronizacion en el boton principal; el avance llega por /api/events.
         btnSync.classList.add('syncing');
         btnSync.disabled = true;
         if (statusDiv) {
             statusDiv.style.display = 'none';
         }
+        const operacion = this.nuevaOperacion('sync');
+        const dejarDeSeguir = this.seguirProgreso(operacion, (evento) => this.mostrarProgresoSync(evento));
 
         try {
             // Primero guardar la configuracion actual
@@ -1592,7 +1682,7 @@ Para más información, revisa la documentación en docs/`);
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ month_mode: 'actual' }),
+                body: JSON.stringify({ month_mode: 'actual', operacion }),
             });
 
             const result = await response.json();
@@ -1616,11 +1706,74 @@ Para más información, revisa la documentación en docs/`);
             this.showToast('Error al sincronizar: ' + error.message, 'error');
         } finally {
             // Restaurar boton
+            dejarDeSeguir();
             btnSync.classList.remove('syncing');
             btnSync.disabled = false;
-            if (statusDiv) {
-                statusDiv.style.display = 'none';
+            this.ocultarProgresoSync();
+        }
+    }
+
+    nuevaOperacion(prefijo) {
+        const aleatorio = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID().slice(0, 8)
+            : Math.random().toString(16).slice(2, 10);
+        return `${prefijo}-${aleatorio}`;
+    }
+
+    seguirProgreso(operacion, alEvento) {
+        // Sin EventSource solo se espera la respuesta del POST
+        if (typeof EventSource === 'undefined') {
+            return () => {};
+        }
+        const fuente = new EventSource(`/api/events?operacion=${encodeURIComponent(operacion)}`);
+        fuente.onmessage = (mensaje) => {
+            try {
+                alEvento(JSON.parse(mensaje.data));
+            } catch (error) {
+                console.warn('Evento de progreso invalido:', error);
             }
+        };
+        return () => fuente.close();
+    }
+
+    describirProgreso(evento) {
+        const etapas = {
+            autenticar: 'Autenticando',
+            preparar: 'Preparando',
+            metadatos: 'Consultando Drive',
+            especular: 'Preparando copia local',
+            descargar: 'Descargando',
+            libro: 'Actualizando hoja',
+            actualizar: 'Actualizando hoja',
+            guardar: 'Guardando',
+            subir: 'Subiendo',
+            enlace: 'Obteniendo enlace',
+        };
+        if (evento.tipo === 'bytes' && evento.total) {
+            const verbo = evento.direccion === 'subida' ? 'Subiendo' : 'Descargando';
+            return `${verbo}... ${Math.round((evento.bytes * 100) / evento.total)}%`;
+        }
+        if (evento.tipo === 'etapa' && evento.estado === 'inicio') {
+            return `${etapas[evento.nombre] || evento.nombre}...`;
+        }
+        return null;
+    }
+
+    mostrarProgresoSync(evento) {
+        const texto = this.describirProgreso(evento);
+        const statusDiv = document.getElementById('sync-status-header');
+        const statusTexto = document.getElementById('sync-status-texto');
+        if (!texto || !statusDiv || !statusTexto) {
+            return;
+        }
+        statusTexto.textContent = texto;
+        statusDiv.style.display = 'flex';
+    }
+
+    ocultarProgresoSync() {
+        const statusDiv = document.getElementById('sync-status-header');
+        if (statusDiv) {
+            statusDiv.style.display = 'none';
         }
     }
     showToast(message, type = 'info') {
@@ -3,22 +3,40 @@
 Servidor web para la interfaz de configuración del Control de Gastos
 """
 
+import asyncio
+import hashlib
+import html
 import http.server
+import socket
 import socketserver
 import webbrowser
 import os
+import queue
 import sys
 import json
 import threading
+import time
+from http import HTTPStatus
 from pathlib import Path
+from urllib.parse import parse_qs, unquote
 
 PORT = 8080
 WEB_DIR = Path(__file__).parent / "web"
+SRC_DIR = Path(__file__).parent / "src"
 CONFIG_FILE = Path(__file__).parent / "config" / "configuracion.json"
 BOT_INSTANCE = None
 BOT_LOCK = threading.Lock()
 MOJIBAKE_MARKERS = ("\u00C3", "\u00C2", "\u00E2")
 
+# Los modulos de src/ se importan entre si por nombre (`import eventos`): con src/ en el
+# path desde el inicio todos comparten la misma copia (un solo bus de eventos)
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+import config_archivo  # noqa: E402
+import metricas  # noqa: E402
+from pool_acotado import PoolAcotado, PoolSaturado  # noqa: E402
+
 
 def get_bot_instance():
     """Inicializar (lazy) una unica instancia del bot."""
@@ -31,7 +49,9 @@ def get_bot_instance():
     except ModuleNotFoundError:
         from bot_whatsapp import BotWhatsApp
 
-    BOT_INSTANCE = BotWhatsApp()
+    with BOT_LOCK:
+        if BOT_INSTANCE is None:
+            BOT_INSTANCE = BotWhatsApp()
     return BOT_INSTANCE
 
 
@@ -61,391 +81,1230 @@ def normalize_text_encoding(data):
         return fix_mojibake_text(data)
     return data
 
+# Conexiones persistentes (los dos modos): segundos sin peticiones antes de cerrar,
+# peticiones por conexion y tamanio maximo del cuerpo
+INACTIVIDAD_S = 75
+MAX_PETICIONES_CONEXION = 1000
+MAX_CUERPO = 16 * 1024 * 1024
+
+# Pools de la API: las rutas rapidas (config, salud, metricas) no esperan detras de
+# las lentas (Drive, escrituras del bot). Con el pool lleno se responde 503 + Retry-After
+WORKERS_RAPIDOS = 8
+COLA_RAPIDA = 64
+WORKERS_LENTOS = 4
+COLA_LENTA = 8
+# Mensajes por lote en /api/bot/messages
+MAX_MENSAJES_LOTE = 500
+# Procesos por regeneracion en /api/sync-drive/range: mas que nucleos no acelera
+MAX_WORKERS_REGENERACION = os.cpu_count() or 1
+# Modo hilos: un hilo por conexion, como mucho estas; las demas reciben 503 al conectar
+MAX_CONEXIONES_HILOS = 256
+
+# Cabeceras que se agregan a toda respuesta, en modo hilos y en modo asyncio
+CABECERAS_COMUNES = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, PATCH, OPTIONS',
+    'Access-Control-Allow-Headers': (
+        'Content-Type, Authorization, X-Requested-With, X-Operacion, Last-Event-ID, If-Match, If-None-Match'
+    ),
+    'Access-Control-Expose-Headers': 'ETag, Retry-After',
+    'Access-Control-Max-Age': '86400',
+}
+
+# Solo si la respuesta no trae su propio Cache-Control (la API; los estaticos traen el suyo)
+CABECERAS_SIN_CACHE = {
+    'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+
+
+def cabeceras_comunes(propias):
+    """Cabeceras comunes que faltan en `propias` (nombres en minusculas)."""
+    cabeceras = dict(CABECERAS_COMUNES)
+    if 'cache-control' not in propias:
+        cabeceras.update(CABECERAS_SIN_CACHE)
+    return {clave: valor for clave, valor in cabeceras.items() if clave.lower() not in propias}
+
+
+class Peticion:
+    """Peticion HTTP ya leida, independiente del servidor que la recibio."""
+
+    def __init__(self, metodo, ruta, cabeceras=None, cuerpo=b''):
+        self.metodo = metodo
+        self.ruta, _, self.consulta = ruta.partition('?')
+        self.cabeceras = {k.lower(): v for k, v in (cabeceras or {}).items()}
+        self.cuerpo = cuerpo or b''
+
+    def json(self):
+        return json.loads(self.cuerpo.decode('utf-8'))
+
+
+class Respuesta:
+    def __init__(self, estado=200, cuerpo=b'', tipo=None, cabeceras=None):
+        self.estado = estado
+        self.cuerpo = cuerpo
+        self.cabeceras = dict(cabeceras or {})
+        if tipo:
+            self.cabeceras['Content-type'] = tipo
+
+    @classmethod
+    def json(cls, datos, estado=200):
+        return cls(estado, json.dumps(datos, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+
+class RespuestaEventos(Respuesta):
+    """Canal text/event-stream: el servidor escribe los eventos del bus hasta que el cliente cierra."""
+
+    LATIDO_S = 15
+    COLA = 1000
+
+    def __init__(self, desde_id=None, operacion=None):
+        super().__init__(200, b'', 'text/event-stream; charset=utf-8', {
+            'Cache-Control': 'no-cache',
+            'Connection': 'close',
+            'X-Accel-Buffering': 'no',
+        })
+        self.desde_id = desde_id
+        self.operacion = operacion
+
+
+class ErrorHttp(Exception):
+    """Error que se responde como pagina de error HTML."""
+
+    def __init__(self, estado, mensaje=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def _eventos():
+    try:
+        import eventos
+    except ModuleNotFoundError:
+        from src import eventos
+    return eventos
+
+
+def _id_operacion(peticion, payload=None):
+    """Id de operacion elegido por el cliente para seguirla en /api/events (None = se genera)."""
+    valor = peticion.cabeceras.get('x-operacion')
+    if not valor and isinstance(payload, dict):
+        valor = payload.get('operacion')
+    return str(valor or '').strip()[:64] or None
+
+
+def _importar_google_drive_v2():
+    src_path = os.path.join(os.path.dirname(__file__), 'src')
+    if src_path not in sys.path:
+        sys.path.insert(0, src_path)
+
+    try:
+        import google_drive_v2
+    except ModuleNotFoundError:
+        from src import google_drive_v2
+    return google_drive_v2
+
+
+def _cargar_config_normalizada():
+    """Leer la configuración (o crear la de defecto), reparar mojibake y agregar claves nuevas"""
+    # Si el archivo no existe, crear uno por defecto
+    if not CONFIG_FILE.exists():
+        print(f"Archivo de configuración no encontrado en {CONFIG_FILE}")
+        print("Creando configuración por defecto...")
+
+        # Crear directorio config si no existe
+        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+        # Configuración por defecto
+        default_config = {
+            "usuario": {"nombre": ""},
+            "sueldo": {"valor_fijo": 4600000, "moneda": "COP"},
+            "presupuesto_variables": 0,
+            "saldo_bancario": {
+                "valor_actual": 0,
+                "moneda": "COP",
+                "ultima_actualizacion": None,
+                "notas": ""
+            },
+            "historial_saldos": {
+                "saldo_mes_anterior": 0,
+                "mes_anterior": "",
+                "saldos_mensuales": {}
+            },
+            "gastos_fijos": {
+                "arriendo": {"valor": 0, "dia_cargo": 1, "categoria": "Vivienda"},
+                "mercado_primera_quincena": {"valor": 0, "dia_cargo": 15, "categoria": "Alimentación"},
+                "mercado_segunda_quincena": {"valor": 0, "dia_cargo": 30, "categoria": "Alimentación"},
+                "servicio_gas": {"valor": 0, "dia_cargo": 10, "categoria": "Servicios"},
+                "descuento_quincenal": {"valor": 5000, "frecuencia": "quincenal", "categoria": "Descuentos"},
+                "gimnasio": {"valor": 0, "dia_cargo": 1, "categoria": "Salud/Bienestar"},
+                "netflix": {"valor": 0, "dia_cargo": 5, "categoria": "Entretenimiento"},
+                "movistar": {"valor": 0, "dia_cargo": 10, "categoria": "Servicios"},
+                "youtube_premium": {"valor": 0, "dia_cargo": 5, "categoria": "Entretenimiento"},
+                "google_drive": {"valor": 0, "dia_cargo": 1, "categoria": "Tecnología"},
+                "gamepass": {"valor": 0, "dia_cargo": 15, "categoria": "Entretenimiento"},
+                "mercadolibre": {"valor": 0, "dia_cargo": 1, "categoria": "Compras"}
+            },
+            "deudas_fijas": {},
+            "flujos_efectivo": {
+                "retiro_efectivo_items": ["gasto:arriendo"],
+                "movii_items": [
+                    "gasto:netflix",
+                    "gasto:youtube_premium",
+                    "gasto:google_drive",
+                    "gasto:mercadolibre",
+                    "gasto:hbo_max",
+                    "gasto:pago_app_fitia",
+                    "gasto:sub_facebook_don_j"
+                ],
+                "actualizado_en": None
+            },
+            "categorias_gastos": ["Vivienda", "Alimentación", "Servicios", "Transporte", "Salud/Bienestar", "Entretenimiento", "Tecnología", "Compras", "Educación", "Otros", "Descuentos"],
+            "google_drive": {"archivo_excel_id": "", "carpeta_backup_id": ""},
+            "whatsapp": {"numero_bot": "", "numero_usuario": ""},
+            "automatizacion": {"hora_creacion_hoja": "00:01", "formato_fecha": "YYYY-MM-DD"}
+        }
+
+        # Guardar configuración por defecto
+        config_archivo.escribir_config(CONFIG_FILE, default_config)
+
+        config = default_config
+        print(f"Configuración por defecto creada en: {CONFIG_FILE}")
+    else:
+        # Cargar configuración existente
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+
+    fixed_config = normalize_text_encoding(config)
+    config_was_fixed = fixed_config != config
+    config = fixed_config
+
+    # Compatibilidad: agregar claves nuevas si no existen
+    if 'presupuesto_variables' not in config:
+        config['presupuesto_variables'] = 0
+    if 'deudas_fijas' not in config or not isinstance(config.get('deudas_fijas'), dict):
+        config['deudas_fijas'] = {}
+    if 'saldo_bancario' not in config or not isinstance(config.get('saldo_bancario'), dict):
+        config['saldo_bancario'] = {
+            'valor_actual': 0,
+            'moneda': 'COP',
+            'ultima_actualizacion': None,
+            'notas': ''
+        }
+    if 'historial_saldos' not in config or not isinstance(config.get('historial_saldos'), dict):
+        config['historial_saldos'] = {
+            'saldo_mes_anterior': 0,
+            'mes_anterior': '',
+            'saldos_mensuales': {}
+        }
+    if 'saldos_mensuales' not in config['historial_saldos'] or not isinstance(config['historial_saldos'].get('saldos_mensuales'), dict):
+        config['historial_saldos']['saldos_mensuales'] = {}
+    if 'flujos_efectivo' not in config or not isinstance(config.get('flujos_efectivo'), dict):
+        config['flujos_efectivo'] = {
+            'retiro_efectivo_items': ['gasto:arriendo'],
+            'movii_items': [
+                'gasto:netflix',
+                'gasto:youtube_premium',
+                'gasto:google_drive',
+                'gasto:mercadolibre',
+                'gasto:hbo_max',
+                'gasto:pago_app_fitia',
+                'gasto:sub_facebook_don_j'
+            ],
+            'actualizado_en': None
+        }
+    if 'retiro_efectivo_items' not in config['flujos_efectivo'] or not isinstance(config['flujos_efectivo'].get('retiro_efectivo_items'), list):
+        config['flujos_efectivo']['retiro_efectivo_items'] = ['gasto:arriendo']
+    if 'movii_items' not in config['flujos_efectivo'] or not isinstance(config['flujos_efectivo'].get('movii_items'), list):
+        config['flujos_efectivo']['movii_items'] = [
+            'gasto:netflix',
+            'gasto:youtube_premium',
+            'gasto:google_drive',
+            'gasto:mercadolibre',
+            'gasto:hbo_max',
+            'gasto:pago_app_fitia',
+            'gasto:sub_facebook_don_j'
+        ]
+
+    if config_was_fixed:
+        config_archivo.escribir_config(CONFIG_FILE, config)
+
+    return config
+
+
+class CacheConfig:
+    """
+    Configuracion normalizada ya serializada, con ETag fuerte (sha256 del JSON).
+    Se valida con os.stat (mtime, tamanio, inodo): mientras el archivo no cambie
+    no se vuelve a leer, normalizar ni serializar. Si cambio solo el mtime
+    (mismo contenido), se conserva la entrada.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # (firma del archivo, sha256 del contenido en disco, etag, cuerpo)
+        self._entrada = None
+
+    def _firma(self):
+        try:
+            estado = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return (estado.st_mtime_ns, estado.st_size, estado.st_ino)
+
+    def obtener(self):
+        """(etag, cuerpo JSON en bytes) de la configuracion actual."""
+        entrada = self._entrada
+        firma = self._firma()
+        if entrada is not None and firma is not None and entrada[0] == firma:
+            return entrada[2], entrada[3]
+
+        # Primero el lock de escritura de la config (la normalizacion puede reescribirla)
+        with config_archivo.LOCK, self._lock:
+            entrada = self._entrada
+            firma = self._firma()
+            if entrada is not None and firma is not None and entrada[0] == firma:
+                return entrada[2], entrada[3]
+
+            if entrada is not None and firma is not None:
+                with open(self.ruta, 'rb') as f:
+                    contenido = hashlib.sha256(f.read()).hexdigest()
+                if contenido == entrada[1]:
+                    self._entrada = (firma, contenido, entrada[2], entrada[3])
+                    return entrada[2], entrada[3]
+
+            config = _cargar_config_normalizada()
+            cuerpo = json.dumps(config, ensure_ascii=False).encode('utf-8')
+            # Firma y hash despues de cargar: la carga puede haber reescrito el archivo
+            firma = self._firma()
+            with open(self.ruta, 'rb') as f:
+                contenido = hashlib.sha256(f.read()).hexdigest()
+            etag = f'"{hashlib.sha256(cuerpo).hexdigest()[:32]}"'
+            self._entrada = (firma, contenido, etag, cuerpo)
+            return etag, cuerpo
+
+    def invalidar(self):
+        self._entrada = None
+
+
+CONFIG_CACHE = CacheConfig(CONFIG_FILE)
+
+
+def etag_coincide(if_none_match, etag):
+    """Comparacion debil de If-None-Match (RFC 7232) contra un ETag."""
+    if not if_none_match:
+        return False
+    candidatos = [valor.strip() for valor in if_none_match.split(',')]
+    return '*' in candidatos or etag in [c[2:] if c.startswith('W/') else c for c in candidatos]
+
+
+def serve_config(peticion):
+    """Servir el archivo de configuración (cacheado; 304 si If-None-Match coincide)"""
+    try:
+        etag, cuerpo = CONFIG_CACHE.obtener()
+    except Exception as e:
+        print(f"Error sirviendo configuración: {e}")
+        raise ErrorHttp(500, str(e))
+
+    # no-cache (no no-store): el navegador guarda la copia y revalida con el ETag
+    cabeceras = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_coincide(peticion.cabeceras.get('if-none-match'), etag):
+        return Respuesta(304, cabeceras=cabeceras)
+    return Respuesta(200, cuerpo, 'application/json; charset=utf-8', cabeceras)
+
+
+def etag_coincide_fuerte(if_match, etag):
+    """Comparacion fuerte de If-Match (RFC 7232): un ETag debil nunca coincide."""
+    candidatos = [valor.strip() for valor in if_match.split(',')]
+    return '*' in candidatos or etag in candidatos
+
+
+def save_config(peticion):
+    """Guardar el archivo de configuración completo (PATCH envia solo lo que cambio)"""
+    try:
+        config = peticion.json()
+
+        # Guardar configuración (atomico, el directorio se crea si no existe)
+        config_archivo.escribir_config(CONFIG_FILE, config)
+        CONFIG_CACHE.invalidar()
+
+        print(f"Configuración guardada exitosamente en: {CONFIG_FILE}")
+        return Respuesta.json({'status': 'ok', 'message': 'Configuración guardada'})
+    except Exception as e:
+        print(f"Error guardando configuración: {e}")
+        raise ErrorHttp(500, str(e))
+
+
+def patch_config(peticion):
+    """
+    Actualizar solo las rutas enviadas (JSON Merge Patch, RFC 7396). Con If-Match
+    el parche se aplica solo si la configuracion sigue en esa version (si no, 412).
+    """
+    tipo = peticion.cabeceras.get('content-type', '')
+    if tipo and 'json' not in tipo.lower():
+        raise ErrorHttp(415, 'Se espera application/merge-patch+json')
+    try:
+        parche = peticion.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return Respuesta.json({'status': 'error', 'message': 'JSON invalido en el body.'}, 400)
+    if not isinstance(parche, dict):
+        return Respuesta.json({'status': 'error', 'message': 'El parche debe ser un objeto JSON.'}, 400)
+
+    if_match = peticion.cabeceras.get('if-match')
+    try:
+        with metricas.lock_medido(config_archivo.LOCK, 'config'):
+            etag_actual, _cuerpo = CONFIG_CACHE.obtener()
+            if if_match and not etag_coincide_fuerte(if_match, etag_actual):
+                respuesta = Respuesta.json({
+                    'status': 'error',
+                    'message': 'La configuración cambió; vuelve a leerla y reintenta.'
+                }, 412)
+                respuesta.cabeceras['ETag'] = etag_actual
+                return respuesta
+            config_archivo.aplicar_parche(CONFIG_FILE, parche)
+            CONFIG_CACHE.invalidar()
+            etag, _cuerpo = CONFIG_CACHE.obtener()
+    except Exception as e:
+        print(f"Error actualizando configuración: {e}")
+        raise ErrorHttp(500, str(e))
+
+    print(f"Configuración actualizada ({', '.join(parche) or 'sin cambios'})")
+    respuesta = Respuesta.json({'status': 'ok', 'message': 'Configuración actualizada'})
+    respuesta.cabeceras['ETag'] = etag
+    return respuesta
+
+
+def serve_docs(peticion):
+    """Servir archivos de documentación Markdown"""
+    try:
+        # Extraer el nombre del archivo de la URL
+        archivo = unquote(peticion.ruta[len('/api/docs/'):])
+        docs_dir = (Path(__file__).parent / "docs").resolve()
+        archivo_path = (docs_dir / archivo).resolve()
+
+        # Verificar que el archivo existe y está en el directorio docs
+        if not archivo_path.is_file() or docs_dir not in archivo_path.parents:
+            raise ErrorHttp(404, "Documento no encontrado")
+
+        # Leer el archivo
+        with open(archivo_path, 'r', encoding='utf-8') as f:
+            contenido = f.read()
+
+        return Respuesta(200, contenido.encode('utf-8'), 'text/plain; charset=utf-8')
+
+    except ErrorHttp:
+        raise
+    except Exception as e:
+        print(f"Error sirviendo documentación: {e}")
+        raise ErrorHttp(500, str(e))
+
+
+def bot_health(peticion):
+    """Verificar estado del bot para clientes moviles/web."""
+    try:
+        get_bot_instance()
+        return Respuesta.json({
+            'success': True,
+            'status': 'ok',
+            'message': 'Bot disponible'
+        })
+    except Exception as e:
+        return Respuesta.json({
+            'success': False,
+            'status': 'error',
+            'message': f'Bot no disponible: {e}'
+        }, 500)
+
+
+def bot_message(peticion):
+    """Procesar un mensaje del bot y ejecutar la logica existente."""
+    try:
+        if not peticion.cuerpo:
+            return Respuesta.json({
+                'success': False,
+                'message': 'Body vacio. Envia JSON con el campo "mensaje".'
+            }, 400)
+
+        payload = peticion.json()
+        if not isinstance(payload, dict):
+            raise ValueError('El body JSON debe ser un objeto.')
+
+        mensaje = str(payload.get('mensaje', '')).strip()
+        numero_remitente = payload.get('numero_remitente')
+
+        if not mensaje:
+            return Respuesta.json({
+                'success': False,
+                'message': 'El campo "mensaje" es obligatorio.'
+            }, 400)
+
+        bot = get_bot_instance()
+        eventos = _eventos()
+        # Sin lock global: el bot serializa solo lo que escribe (Excel agrupado, configuracion)
+        with eventos.operacion('bot', _id_operacion(peticion, payload)):
+            respuesta = bot.procesar_entrada(mensaje, numero_remitente=numero_remitente)
+            id_operacion = eventos.operacion_actual()
+
+        return Respuesta.json({
+            'success': True,
+            'mensaje': mensaje,
+            'respuesta': respuesta,
+            'operacion': id_operacion,
+        })
+
+    except json.JSONDecodeError:
+        return Respuesta.json({
+            'success': False,
+            'message': 'JSON invalido en el body.'
+        }, 400)
+    except Exception as e:
+        print(f"Error procesando mensaje del bot: {e}")
+        import traceback
+        traceback.print_exc()
+        return Respuesta.json({
+            'success': False,
+            'message': f'Error del bot: {e}'
+        }, 500)
+
+
+def bot_messages(peticion):
+    """Procesar varios mensajes del bot (cola offline del celular) con una sola escritura del Excel."""
+    try:
+        payload = peticion.json() if peticion.cuerpo else None
+        if isinstance(payload, list):
+            payload = {'mensajes': payload}
+        mensajes = payload.get('mensajes') if isinstance(payload, dict) else None
+        if not isinstance(mensajes, list) or not mensajes:
+            return Respuesta.json({
+                'success': False,
+                'message': 'Envia JSON con "mensajes": [{"mensaje": "...", "fecha": "...", "clave": "..."}].'
+            }, 400)
+        if len(mensajes) > MAX_MENSAJES_LOTE:
+            return Respuesta.json({
+                'success': False,
+                'message': f'Como maximo {MAX_MENSAJES_LOTE} mensajes por lote.'
+            }, 413)
+
+        bot = get_bot_instance()
+        eventos = _eventos()
+        with eventos.operacion('bot', _id_operacion(peticion, payload), mensajes=len(mensajes)):
+            resultados = bot.procesar_lote(mensajes, numero_remitente=payload.get('numero_remitente'))
+            id_operacion = eventos.operacion_actual()
+
+        return Respuesta.json({
+            'success': all(resultado['estado'] != 'error' for resultado in resultados),
+            'registrados': sum(1 for resultado in resultados if resultado['estado'] == 'registrado'),
+            'resultados': resultados,
+            'operacion': id_operacion,
+        })
+
+    except json.JSONDecodeError:
+        return Respuesta.json({
+            'success': False,
+            'message': 'JSON invalido en el body.'
+        }, 400)
+    except Exception as e:
+        print(f"Error procesando lote del bot: {e}")
+        import traceback
+        traceback.print_exc()
+        return Respuesta.json({
+            'success': False,
+            'message': f'Error del bot: {e}'
+        }, 500)
+
+
+def sync_drive(peticion):
+    """Crear/actualizar hoja mensual (actual o siguiente) y sincronizar con Drive."""
+    try:
+        month_mode = 'actual'
+
+        payload = peticion.json() if peticion.cuerpo else {}
+        if isinstance(payload, dict):
+            month_mode = str(payload.get('month_mode', 'actual')).strip() or 'actual'
+
+        sincronizar_con_drive = _importar_google_drive_v2().sincronizar_con_drive
+
+        print(f"Iniciando sincronización con Drive (month_mode={month_mode})...")
+        eventos = _eventos()
+        with eventos.operacion('sync', _id_operacion(peticion, payload), month_mode=month_mode) as fin:
+            result = sincronizar_con_drive(config_path=str(CONFIG_FILE), month_mode=month_mode)
+            fin.update(ok=bool(result.get('success')), mensaje=result.get('message'), etapas=result.get('etapas'))
+            result['operacion'] = eventos.operacion_actual()
+
+        return Respuesta.json(result, 200 if result.get('success') else 500)
+
+    except json.JSONDecodeError:
+        return Respuesta.json({
+            'success': False,
+            'message': 'JSON inválido en el body.'
+        }, 400)
+    except Exception as e:
+        print(f"Error en sincronización: {e}")
+        import traceback
+        traceback.print_exc()
+        return Respuesta.json({
+            'success': False,
+            'message': str(e)
+        }, 500)
+
+
+def sync_drive_range(peticion):
+    """Regenerar en paralelo las hojas de un rango de meses y subir el Excel una sola vez."""
+    try:
+        payload = peticion.json() if peticion.cuerpo else {}
+        if not isinstance(payload, dict):
+            payload = {}
+
+        desde = str(payload.get('desde', '')).strip()
+        hasta = str(payload.get('hasta', '')).strip() or desde
+        workers = payload.get('workers')
+        if workers is not None:
+            workers = int(workers)
+            if workers <= 0:
+                return Respuesta.json({
+                    'success': False,
+                    'message': 'workers debe ser un entero mayor que 0.'
+                }, 400)
+            workers = min(workers, MAX_WORKERS_REGENERACION)
+
+        regenerar_rango_con_drive = _importar_google_drive_v2().regenerar_rango_con_drive
+
+        print(f"Iniciando regeneración de hojas {desde} a {hasta}...")
+        eventos = _eventos()
+        with eventos.operacion('sync-range', _id_operacion(peticion, payload), desde=desde, hasta=hasta) as fin:
+            result = regenerar_rango_con_drive(
+                config_path=str(CONFIG_FILE),
+                desde=desde,
+                hasta=hasta,
+                workers=workers,
+            )
+            fin.update(ok=bool(result.get('success')), mensaje=result.get('message'))
+            result['operacion'] = eventos.operacion_actual()
+
+        return Respuesta.json(result, 200 if result.get('success') else 500)
+
+    except (json.JSONDecodeError, ValueError):
+        return Respuesta.json({
+            'success': False,
+            'message': 'Body inválido: se espera {"desde": "YYYY-MM", "hasta": "YYYY-MM", "workers": N}.'
+        }, 400)
+    except Exception as e:
+        print(f"Error en regeneración: {e}")
+        import traceback
+        traceback.print_exc()
+        return Respuesta.json({
+            'success': False,
+            'message': str(e)
+        }, 500)
+
+
+def eventos_sse(peticion):
+    """
+    Canal SSE con el progreso de sync, descargas/subidas y mensajes del bot.
+    `?operacion=<id>` filtra una operacion (y reenvia sus eventos ya publicados);
+    `Last-Event-ID` o `?desde=<id>` reenvian los posteriores a ese id.
+    """
+    consulta = parse_qs(peticion.consulta)
+    desde = peticion.cabeceras.get('last-event-id') or consulta.get('desde', [''])[0]
+    try:
+        desde_id = int(desde) if desde else None
+    except ValueError:
+        raise ErrorHttp(400, 'Last-Event-ID invalido')
+    return RespuestaEventos(desde_id, consulta.get('operacion', [''])[0] or None)
+
+
+def serve_metrics(peticion):
+    """Metricas del proceso (peticiones, locks, Drive, Excel, parser) en formato Prometheus."""
+    return Respuesta(200, metricas.REGISTRO.exponer().encode('utf-8'), metricas.TIPO_CONTENIDO)
+
+
+# (metodo, ruta) -> funcion(peticion) -> Respuesta; las rutas terminadas en '/' son prefijos
+RUTAS_API = {
+    ('GET', '/api/config'): serve_config,
+    ('GET', '/api/docs/'): serve_docs,
+    ('GET', '/api/bot/health'): bot_health,
+    ('GET', '/api/events'): eventos_sse,
+    ('GET', '/api/metrics'): serve_metrics,
+    ('POST', '/api/config'): save_config,
+    ('PATCH', '/api/config'): patch_config,
+    ('POST', '/api/sync-drive'): sync_drive,
+    ('POST', '/api/sync-drive/range'): sync_drive_range,
+    ('POST', '/api/bot/message'): bot_message,
+    ('POST', '/api/bot/messages'): bot_messages,
+}
+
+# Rutas que esperan a Drive o escriben el Excel: van al pool lento
+RUTAS_LENTAS = {
+    ('POST', '/api/sync-drive'),
+    ('POST', '/api/sync-drive/range'),
+    ('POST', '/api/bot/message'),
+    ('POST', '/api/bot/messages'),
+}
+
+
+def buscar_ruta(metodo, ruta):
+    """(ruta registrada, funcion) de la API para (metodo, ruta); (None, None) si no hay."""
+    funcion = RUTAS_API.get((metodo, ruta))
+    if funcion is not None:
+        return ruta, funcion
+    for (metodo_ruta, prefijo), candidata in RUTAS_API.items():
+        if metodo_ruta == metodo and prefijo.endswith('/') and ruta.startswith(prefijo):
+            return prefijo, candidata
+    return None, None
+
+
+def registrar_peticion(metodo, ruta, estado, inicio):
+    """Cuenta la peticion y su duracion por ruta registrada (no por URL, para acotar las series)."""
+    estado = str(estado)
+    metricas.PETICIONES_HTTP.inc(metodo, ruta, estado)
+    metricas.DURACION_HTTP.observar(time.perf_counter() - inicio, metodo, ruta, estado)
+
+
+def atender_api(peticion):
+    """Ejecuta la ruta de la API (bloqueante); None si la peticion no es de la API."""
+    ruta, funcion = buscar_ruta(peticion.metodo, peticion.ruta)
+    if funcion is None:
+        return None
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        respuesta = funcion(peticion)
+        estado = respuesta.estado
+        return respuesta
+    except ErrorHttp as e:
+        estado = e.estado
+        raise
+    finally:
+        registrar_peticion(peticion.metodo, ruta, estado, inicio)
+
+
+def crear_pools(workers=None, workers_lentos=None):
+    """Pools acotados de la API: 'rapida' y 'lenta' (ver RUTAS_LENTAS)."""
+    return {
+        'rapida': PoolAcotado('rapida', workers or WORKERS_RAPIDOS, COLA_RAPIDA, reintentar_s=1),
+        'lenta': PoolAcotado('lenta', workers_lentos or WORKERS_LENTOS, COLA_LENTA, reintentar_s=5),
+    }
+
+
+def enviar_api(pools, peticion):
+    """
+    Encola atender_api en el pool de la ruta y devuelve el Future; None si la
+    peticion no es de la API. PoolSaturado (ya contado como 503) si no hay cupo.
+    """
+    ruta, funcion = buscar_ruta(peticion.metodo, peticion.ruta)
+    if funcion is None:
+        return None
+    pool = pools['lenta' if (peticion.metodo, ruta) in RUTAS_LENTAS else 'rapida']
+    inicio = time.perf_counter()
+    try:
+        return pool.enviar(atender_api, peticion)
+    except PoolSaturado:
+        registrar_peticion(peticion.metodo, ruta, 503, inicio)
+        raise
+
+
+def respuesta_saturado(error):
+    respuesta = Respuesta.json({
+        'success': False,
+        'message': f'Servidor ocupado, reintenta en {error.reintentar_s} s.'
+    }, 503)
+    respuesta.cabeceras['Retry-After'] = str(error.reintentar_s)
+    return respuesta
+
+
+# Respuesta cruda para conexiones que superan el limite (aun no se leyo la peticion)
+RESPUESTA_SIN_CONEXIONES = (
+    b'HTTP/1.1 503 Service Unavailable\r\n'
+    b'Retry-After: 1\r\n'
+    b'Content-Length: 0\r\n'
+    b'Connection: close\r\n\r\n'
+)
+
+
+def respuesta_error(estado, mensaje=None):
+    try:
+        descripcion = HTTPStatus(estado).phrase
+    except ValueError:
+        descripcion = 'Error'
+    texto = html.escape(mensaje or descripcion)
+    cuerpo = (
+        f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Error {estado}</title></head>'
+        f'<body><h1>Error {estado}</h1><p>{texto}</p></body></html>\n'
+    )
+    return Respuesta(estado, cuerpo.encode('utf-8'), 'text/html; charset=utf-8')
+
+
+_RECURSOS = None
+_LOCK_RECURSOS = threading.Lock()
+
+
+def recursos_estaticos():
+    """Archivos de web/ con huella y variantes comprimidas (se crean la primera vez)."""
+    global _RECURSOS
+    with _LOCK_RECURSOS:
+        if _RECURSOS is None:
+            try:
+                from recursos_estaticos import RecursosEstaticos
+            except ModuleNotFoundError:
+                from src.recursos_estaticos import RecursosEstaticos
+            _RECURSOS = RecursosEstaticos(WEB_DIR)
+        return _RECURSOS
+
+
+def servir_estatico(peticion):
+    """Archivo de web/: URLs con huella con cache inmutable, el resto se revalida con ETag."""
+    inicio = time.perf_counter()
+    resultado = recursos_estaticos().responder(unquote(peticion.ruta), peticion.cabeceras)
+    estado = resultado[0] if resultado is not None else 404
+    registrar_peticion(peticion.metodo, 'estaticos', estado, inicio)
+    if resultado is None:
+        raise ErrorHttp(404, 'File not found')
+    estado, cuerpo, cabeceras = resultado
+    return Respuesta(estado, cuerpo, cabeceras=cabeceras)
+
+
 class CustomHandler(http.server.SimpleHTTPRequestHandler):
-    """Handler personalizado para servir archivos y manejar API"""
+    """
+    Handler personalizado para servir archivos y manejar API.
+    Habla HTTP/1.1: la conexion queda abierta entre peticiones (tambien en
+    pipeline) hasta `timeout` segundos de inactividad o `max_peticiones`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo salen en dos send(): sin Nagle el segundo no espera al ACK retardado
+    disable_nagle_algorithm = True
+    timeout = INACTIVIDAD_S
+    max_peticiones = MAX_PETICIONES_CONEXION
+    conexiones = 0
+    _lock_conexiones = threading.Lock()
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=str(WEB_DIR), **kwargs)
+
+    def setup(self):
+        super().setup()
+        self.peticiones_atendidas = 0
+        self._cabeceras_enviadas = set()
+        with CustomHandler._lock_conexiones:
+            CustomHandler.conexiones += 1
+
+    def finish(self):
+        with CustomHandler._lock_conexiones:
+            CustomHandler.conexiones -= 1
+        super().finish()
+
+    def handle_one_request(self):
+        if self.peticiones_atendidas:
+            # Conexion persistente: que venza la inactividad o el cliente cierre no es un error
+            try:
+                if not self.rfile.peek(1):
+                    self.close_connection = True
+                    return
+            except (socket.timeout, ConnectionError):
+                self.close_connection = True
+                return
+        self.peticiones_atendidas += 1
+        super().handle_one_request()
+
+    def _leer_cuerpo(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+            raise ErrorHttp(411, 'Se requiere Content-Length')
+        try:
+            largo = int(self.headers.get('Content-Length', '0') or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            self.close_connection = True
+            raise ErrorHttp(400, 'Content-Length invalido')
+        if largo > MAX_CUERPO:
+            # El cuerpo no se lee: la conexion ya no se puede reutilizar
+            self.close_connection = True
+            raise ErrorHttp(413, 'Cuerpo demasiado grande')
+        return self.rfile.read(largo) if largo > 0 else b''
+
+    def _enviar(self, respuesta):
+        self.send_response(respuesta.estado)
+        for clave, valor in respuesta.cabeceras.items():
+            self.send_header(clave, valor)
+        # 204/304 no llevan cuerpo ni Content-Length; el resto siempre lo declara
+        if respuesta.estado not in (204, 304):
+            self.send_header('Content-Length', str(len(respuesta.cuerpo)))
+        self.end_headers()
+        if self.command != 'HEAD' and respuesta.estado not in (204, 304):
+            self.wfile.write(respuesta.cuerpo)
+
+    def _atender(self, metodo):
+        try:
+            peticion = Peticion(metodo, self.path, dict(self.headers.items()), self._leer_cuerpo())
+            futuro = enviar_api(self.server.pools, peticion)
+            respuesta = futuro.result() if futuro is not None else None
+            if respuesta is None and metodo in ('GET', 'HEAD'):
+                respuesta = servir_estatico(peticion)
+            if respuesta is None:
+                raise ErrorHttp(404)
+        except ErrorHttp as e:
+            self.log_error('code %d, message %s', e.estado, e.mensaje)
+            respuesta = respuesta_error(e.estado, e.mensaje)
+        except PoolSaturado as e:
+            self.log_error('%s', e)
+            respuesta = respuesta_saturado(e)
+        except Exception as e:
+            print(f"Error atendiendo {metodo} {self.path}: {e}")
+            self.close_connection = True
+            respuesta = respuesta_error(500, str(e))
+        if isinstance(respuesta, RespuestaEventos):
+            self._transmitir_eventos(respuesta)
+            return
+        self._enviar(respuesta)
+
+    def _transmitir_eventos(self, respuesta):
+        eventos = _eventos()
+        cola = queue.Queue(maxsize=respuesta.COLA)
+
+        def _recibir(evento):
+            # Un cliente lento pierde eventos en lugar de frenar a quien publica
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                pass
+
+        desuscribir = eventos.suscribir(_recibir, respuesta.desde_id, respuesta.operacion)
+        try:
+            self.send_response(respuesta.estado)
+            for clave, valor in respuesta.cabeceras.items():
+                self.send_header(clave, valor)
+            self.end_headers()
+            self.wfile.write(b'retry: 3000\n\n')
+            while True:
+                try:
+                    datos = eventos.formato_sse(cola.get(timeout=respuesta.LATIDO_S))
+                except queue.Empty:
+                    # Comentario SSE: mantiene viva la conexion y detecta clientes que se fueron
+                    datos = b': ping\n\n'
+                self.wfile.write(datos)
+        except OSError:
+            pass
+        finally:
+            desuscribir()
     
     def do_GET(self):
         """Manejar peticiones GET"""
-        path = self.path.split('?', 1)[0]
-
-        if path == '/api/config':
-            self.serve_config()
-        elif path.startswith('/api/docs/'):
-            self.serve_docs()
-        elif path == '/api/bot/health':
-            self.bot_health()
-        elif path == '/':
-            self.path = '/index.html'
-            return super().do_GET()
-        else:
-            return super().do_GET()
+        self._atender('GET')
+
+    def do_HEAD(self):
+        """Manejar peticiones HEAD (solo cabeceras de archivos estaticos)"""
+        self._atender('HEAD')
     
     def do_POST(self):
         """Manejar peticiones POST"""
-        path = self.path.split('?', 1)[0]
+        self._atender('POST')
 
-        if path == '/api/config':
-            self.save_config()
-        elif path == '/api/sync-drive':
-            self.sync_drive()
-        elif path == '/api/bot/message':
-            self.bot_message()
-        else:
-            self.send_error(404)
+    def do_PATCH(self):
+        """Manejar peticiones PATCH (parches de configuracion)"""
+        self._atender('PATCH')
 
     def do_OPTIONS(self):
         """Responder preflight CORS para clientes web/móviles (Flutter, navegadores)."""
-        self.send_response(204)
-        self.end_headers()
-    
-    def serve_config(self):
-        """Servir el archivo de configuración"""
-        try:
-            # Si el archivo no existe, crear uno por defecto
-            if not CONFIG_FILE.exists():
-                print(f"Archivo de configuración no encontrado en {CONFIG_FILE}")
-                print("Creando configuración por defecto...")
-                
-                # Crear directorio config si no existe
-                CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-                
-                # Configuración por defecto
-                default_config = {
-                    "usuario": {"nombre": ""},
-                    "sueldo": {"valor_fijo": 4600000, "moneda": "COP"},
-                    "presupuesto_variables": 0,
-                    "saldo_bancario": {
-                        "valor_actual": 0,
-                        "moneda": "COP",
-                        "ultima_actualizacion": None,
-                        "notas": ""
-                    },
-                    "historial_saldos": {
-                        "saldo_mes_anterior": 0,
-                        "mes_anterior": "",
-                        "saldos_mensuales": {}
-                    },
-                    "gastos_fijos": {
-                        "arriendo": {"valor": 0, "dia_cargo": 1, "categoria": "Vivienda"},
-                        "mercado_primera_quincena": {"valor": 0, "dia_cargo": 15, "categoria": "Alimentación"},
-                        "mercado_segunda_quincena": {"valor": 0, "dia_cargo": 30, "categoria": "Alimentación"},
-                        "servicio_gas": {"valor": 0, "dia_cargo": 10, "categoria": "Servicios"},
-                        "descuento_quincenal": {"valor": 5000, "frecuencia": "quincenal", "categoria": "Descuentos"},
-                        "gimnasio": {"valor": 0, "dia_cargo": 1, "categoria": "Salud/Bienestar"},
-                        "netflix": {"valor": 0, "dia_cargo": 5, "categoria": "Entretenimiento"},
-                        "movistar": {"valor": 0, "dia_cargo": 10, "categoria": "Servicios"},
-                        "youtube_premium": {"valor": 0, "dia_cargo": 5, "categoria": "Entretenimiento"},
-                        "google_drive": {"valor": 0, "dia_cargo": 1, "categoria": "Tecnología"},
-                        "gamepass": {"valor": 0, "dia_cargo": 15, "categoria": "Entretenimiento"},
-                        "mercadolibre": {"valor": 0, "dia_cargo": 1, "categoria": "Compras"}
-                    },
-                    "deudas_fijas": {},
-                    "flujos_efectivo": {
-                        "retiro_efectivo_items": ["gasto:arriendo"],
-                        "movii_items": [
-                            "gasto:netflix",
-                            "gasto:youtube_premium",
-                            "gasto:google_drive",
-                            "gasto:mercadolibre",
-                            "gasto:hbo_max",
-                            "gasto:pago_app_fitia",
-                            "gasto:sub_facebook_don_j"
-                        ],
-                        "actualizado_en": None
-                    },
-                    "categorias_gastos": ["Vivienda", "Alimentación", "Servicios", "Transporte", "Salud/Bienestar", "Entretenimiento", "Tecnología", "Compras", "Educación", "Otros", "Descuentos"],
-                    "google_drive": {"archivo_excel_id": "", "carpeta_backup_id": ""},
-                    "whatsapp": {"numero_bot": "", "numero_usuario": ""},
-                    "automatizacion": {"hora_creacion_hoja": "00:01", "formato_fecha": "YYYY-MM-DD"}
-                }
-                
-                # Guardar configuración por defecto
-                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(default_config, f, indent=2, ensure_ascii=False)
-                
-                config = default_config
-                print(f"Configuración por defecto creada en: {CONFIG_FILE}")
-            else:
-                # Cargar configuración existente
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-
-            fixed_config = normalize_text_encoding(config)
-            config_was_fixed = fixed_config != config
-            config = fixed_config
-            
-            # Compatibilidad: agregar claves nuevas si no existen
-            if 'presupuesto_variables' not in config:
-                config['presupuesto_variables'] = 0
-            if 'deudas_fijas' not in config or not isinstance(config.get('deudas_fijas'), dict):
-                config['deudas_fijas'] = {}
-            if 'saldo_bancario' not in config or not isinstance(config.get('saldo_bancario'), dict):
-                config['saldo_bancario'] = {
-                    'valor_actual': 0,
-                    'moneda': 'COP',
-                    'ultima_actualizacion': None,
-                    'notas': ''
-                }
-            if 'historial_saldos' not in config or not isinstance(config.get('historial_saldos'), dict):
-                config['historial_saldos'] = {
-                    'saldo_mes_anterior': 0,
-                    'mes_anterior': '',
-                    'saldos_mensuales': {}
-                }
-            if 'saldos_mensuales' not in config['historial_saldos'] or not isinstance(config['historial_saldos'].get('saldos_mensuales'), dict):
-                config['historial_saldos']['saldos_mensuales'] = {}
-            if 'flujos_efectivo' not in config or not isinstance(config.get('flujos_efectivo'), dict):
-                config['flujos_efectivo'] = {
-                    'retiro_efectivo_items': ['gasto:arriendo'],
-                    'movii_items': [
-                        'gasto:netflix',
-                        'gasto:youtube_premium',
-                        'gasto:google_drive',
-                        'gasto:mercadolibre',
-                        'gasto:hbo_max',
-                        'gasto:pago_app_fitia',
-                        'gasto:sub_facebook_don_j'
-                    ],
-                    'actualizado_en': None
-                }
-            if 'retiro_efectivo_items' not in config['flujos_efectivo'] or not isinstance(config['flujos_efectivo'].get('retiro_efectivo_items'), list):
-                config['flujos_efectivo']['retiro_efectivo_items'] = ['gasto:arriendo']
-            if 'movii_items' not in config['flujos_efectivo'] or not isinstance(config['flujos_efectivo'].get('movii_items'), list):
-                config['flujos_efectivo']['movii_items'] = [
-                    'gasto:netflix',
-                    'gasto:youtube_premium',
-                    'gasto:google_drive',
-                    'gasto:mercadolibre',
-                    'gasto:hbo_max',
-                    'gasto:pago_app_fitia',
-                    'gasto:sub_facebook_don_j'
-                ]
-
-            if config_was_fixed:
-                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=2, ensure_ascii=False)
-
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps(config, ensure_ascii=False).encode('utf-8'))
-            
-        except Exception as e:
-            print(f"Error sirviendo configuración: {e}")
-            self.send_error(500, str(e))
-    
-    def save_config(self):
-        """Guardar el archivo de configuración"""
         try:
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            config = json.loads(post_data.decode('utf-8'))
-            
-            # Crear directorio config si no existe
-            CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Guardar configuración
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-            
-            print(f"Configuración guardada exitosamente en: {CONFIG_FILE}")
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({'status': 'ok', 'message': 'Configuración guardada'}, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            print(f"Error guardando configuración: {e}")
-            self.send_error(500, str(e))
+            self._leer_cuerpo()
+        except ErrorHttp as e:
+            self._enviar(respuesta_error(e.estado, e.mensaje))
+            return
+        self._enviar(Respuesta(204))
+
+    def send_header(self, keyword, value):
+        self._cabeceras_enviadas.add(keyword.lower())
+        super().send_header(keyword, value)
     
-    def serve_docs(self):
-        """Servir archivos de documentación Markdown"""
+    def end_headers(self):
+        """Agregar headers para CORS, cache y keep-alive"""
+        enviadas = self._cabeceras_enviadas
+        for clave, valor in cabeceras_comunes(enviadas).items():
+            self.send_header(clave, valor)
+        if 'connection' not in enviadas:
+            if self.peticiones_atendidas >= self.max_peticiones:
+                self.close_connection = True
+            if self.close_connection:
+                self.send_header('Connection', 'close')
+            else:
+                self.send_header('Connection', 'keep-alive')
+                restantes = self.max_peticiones - self.peticiones_atendidas
+                self.send_header('Keep-Alive', f'timeout={int(self.timeout)}, max={restantes}')
+        self._cabeceras_enviadas = set()
+        super().end_headers()
+
+
+class ServidorAsync:
+    """
+    Servidor HTTP/1.1 sobre asyncio con las mismas rutas que CustomHandler:
+    - una corrutina por conexion (no un hilo): miles de conexiones keep-alive
+      inactivas cuestan unos pocos KB cada una
+    - las rutas de la API corren en los pools acotados (rapido y lento) para no
+      bloquear el bucle de eventos; con el pool lleno se responde 503
+    - conexiones persistentes con Content-Length en cada respuesta; se cierran
+      tras `inactividad_s` sin peticiones o `MAX_PETICIONES` peticiones
+    """
+
+    MAX_CABECERAS = 64 * 1024
+    MAX_CUERPO = MAX_CUERPO
+    INACTIVIDAD_S = INACTIVIDAD_S
+    MAX_PETICIONES = MAX_PETICIONES_CONEXION
+    # Una conexion inactiva cuesta pocos KB: el limite es mucho mas alto que en modo hilos
+    MAX_CONEXIONES = 4096
+
+    def __init__(self, port=PORT, workers=None, inactividad_s=None, workers_lentos=None):
+        self.port = port
+        self.inactividad_s = self.INACTIVIDAD_S if inactividad_s is None else inactividad_s
+        self.pools = crear_pools(workers, workers_lentos)
+        self.conexiones = 0
+        metricas.REGISTRO.medidor(
+            'control_gastos_http_conexiones_asyncio', 'Conexiones abiertas en modo asyncio', lambda: self.conexiones
+        )
+
+    async def _leer_peticion(self, reader):
+        """Lee una peticion completa; None si el cliente cerro o quedo inactivo."""
         try:
-            # Extraer el nombre del archivo de la URL
-            archivo = self.path.replace('/api/docs/', '')
-            docs_dir = Path(__file__).parent / "docs"
-            archivo_path = docs_dir / archivo
-            
-            # Verificar que el archivo existe y está en el directorio docs
-            if not archivo_path.exists() or not str(archivo_path).startswith(str(docs_dir)):
-                self.send_error(404, "Documento no encontrado")
-                return
-            
-            # Leer el archivo
-            with open(archivo_path, 'r', encoding='utf-8') as f:
-                contenido = f.read()
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(contenido.encode('utf-8'))
-            
-        except Exception as e:
-            print(f"Error sirviendo documentación: {e}")
-            self.send_error(500, str(e))
+            bloque = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.inactividad_s)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise ErrorHttp(431, 'Cabeceras demasiado grandes')
 
-    def bot_health(self):
-        """Verificar estado del bot para clientes moviles/web."""
+        linea, *lineas = bloque.decode('latin-1').rstrip('\r\n').split('\r\n')
         try:
-            get_bot_instance()
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': True,
-                'status': 'ok',
-                'message': 'Bot disponible'
-            }, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'status': 'error',
-                'message': f'Bot no disponible: {e}'
-            }, ensure_ascii=False).encode('utf-8'))
+            metodo, objetivo, version = linea.split(' ', 2)
+        except ValueError:
+            raise ErrorHttp(400, 'Linea de peticion invalida')
+        cabeceras = {}
+        for cabecera in lineas:
+            clave, _, valor = cabecera.partition(':')
+            cabeceras[clave.strip().lower()] = valor.strip()
 
-    def bot_message(self):
-        """Procesar un mensaje del bot y ejecutar la logica existente."""
+        if 'chunked' in cabeceras.get('transfer-encoding', '').lower():
+            raise ErrorHttp(411, 'Se requiere Content-Length')
         try:
-            content_length = int(self.headers.get('Content-Length', '0'))
-            if content_length <= 0:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'message': 'Body vacio. Envia JSON con el campo "mensaje".'
-                }, ensure_ascii=False).encode('utf-8'))
-                return
+            largo = int(cabeceras.get('content-length') or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            raise ErrorHttp(400, 'Content-Length invalido')
+        if largo > self.MAX_CUERPO:
+            raise ErrorHttp(413, 'Cuerpo demasiado grande')
+        cuerpo = await reader.readexactly(largo) if largo else b''
 
-            post_data = self.rfile.read(content_length)
-            payload = json.loads(post_data.decode('utf-8'))
-            if not isinstance(payload, dict):
-                raise ValueError('El body JSON debe ser un objeto.')
+        conexion = cabeceras.get('connection', '').lower()
+        mantener = conexion != 'close' if version == 'HTTP/1.1' else conexion == 'keep-alive'
+        return Peticion(metodo.upper(), objetivo, cabeceras, cuerpo), mantener
 
-            mensaje = str(payload.get('mensaje', '')).strip()
-            numero_remitente = payload.get('numero_remitente')
+    async def _responder(self, peticion):
+        if peticion.metodo == 'OPTIONS':
+            return Respuesta(204)
+        futuro = enviar_api(self.pools, peticion)
+        if futuro is not None:
+            return await asyncio.wrap_future(futuro)
+        if peticion.metodo in ('GET', 'HEAD'):
+            return servir_estatico(peticion)
+        raise ErrorHttp(404)
 
-            if not mensaje:
-                self.send_response(400)
-                self.send_header('Content-type', 'application/json; charset=utf-8')
-                self.end_headers()
-                self.wfile.write(json.dumps({
-                    'success': False,
-                    'message': 'El campo "mensaje" es obligatorio.'
-                }, ensure_ascii=False).encode('utf-8'))
-                return
+    def _escribir(self, writer, respuesta, mantener, metodo='GET', restantes=0):
+        estado = respuesta.estado
+        razon = HTTPStatus(estado).phrase if estado in HTTPStatus._value2member_map_ else ''
+        cabeceras = cabeceras_comunes({clave.lower() for clave in respuesta.cabeceras})
+        cabeceras.update(respuesta.cabeceras)
+        if estado not in (204, 304) and not isinstance(respuesta, RespuestaEventos):
+            cabeceras['Content-Length'] = str(len(respuesta.cuerpo))
+        cabeceras['Connection'] = 'keep-alive' if mantener else 'close'
+        if mantener:
+            cabeceras['Keep-Alive'] = f'timeout={int(self.inactividad_s)}, max={restantes}'
+        cabecera = f'HTTP/1.1 {estado} {razon}\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in cabeceras.items()) + '\r\n'
+        writer.write(cabecera.encode('latin-1'))
+        if metodo != 'HEAD' and estado not in (204, 304):
+            writer.write(respuesta.cuerpo)
 
-            bot = get_bot_instance()
-            with BOT_LOCK:
-                respuesta = bot.procesar_entrada(mensaje, numero_remitente=numero_remitente)
+    async def _transmitir_eventos(self, writer, respuesta):
+        eventos = _eventos()
+        loop = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=respuesta.COLA)
 
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': True,
-                'mensaje': mensaje,
-                'respuesta': respuesta
-            }, ensure_ascii=False).encode('utf-8'))
-
-        except json.JSONDecodeError:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'message': 'JSON invalido en el body.'
-            }, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            print(f"Error procesando mensaje del bot: {e}")
-            import traceback
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'message': f'Error del bot: {e}'
-            }, ensure_ascii=False).encode('utf-8'))
-    
-    def end_headers(self):
-        """Agregar headers para CORS"""
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Requested-With')
-        self.send_header('Access-Control-Max-Age', '86400')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
-        super().end_headers()
+        def _encolar(evento):
+            if not cola.full():
+                cola.put_nowait(evento)
 
+        def _recibir(evento):
+            # Se publica desde hilos de la API: el evento entra a la cola en el bucle
+            loop.call_soon_threadsafe(_encolar, evento)
 
-    def sync_drive(self):
-        """Crear/actualizar hoja mensual (actual o siguiente) y sincronizar con Drive."""
+        desuscribir = eventos.suscribir(_recibir, respuesta.desde_id, respuesta.operacion)
         try:
-            content_length = int(self.headers.get('Content-Length', '0') or 0)
-            month_mode = 'actual'
+            self._escribir(writer, respuesta, False)
+            writer.write(b'retry: 3000\n\n')
+            await writer.drain()
+            while True:
+                try:
+                    datos = eventos.formato_sse(await asyncio.wait_for(cola.get(), respuesta.LATIDO_S))
+                except asyncio.TimeoutError:
+                    datos = b': ping\n\n'
+                writer.write(datos)
+                await writer.drain()
+        finally:
+            desuscribir()
 
-            if content_length > 0:
-                raw_body = self.rfile.read(content_length)
-                if raw_body:
-                    payload = json.loads(raw_body.decode('utf-8'))
-                    if isinstance(payload, dict):
-                        month_mode = str(payload.get('month_mode', 'actual')).strip() or 'actual'
+    async def _atender_conexion(self, reader, writer):
+        if self.conexiones >= self.MAX_CONEXIONES:
+            metricas.RECHAZOS_CONEXION.inc('asyncio')
+            writer.write(RESPUESTA_SIN_CONEXIONES)
+            writer.close()
+            return
+        self.conexiones += 1
+        atendidas = 0
+        try:
+            while True:
+                try:
+                    leida = await self._leer_peticion(reader)
+                    if leida is None:
+                        break
+                    peticion, mantener = leida
+                    atendidas += 1
+                    mantener = mantener and atendidas < self.MAX_PETICIONES
+                    try:
+                        respuesta = await self._responder(peticion)
+                    except ErrorHttp as e:
+                        respuesta = respuesta_error(e.estado, e.mensaje)
+                    except PoolSaturado as e:
+                        respuesta = respuesta_saturado(e)
+                    except Exception as e:
+                        print(f"Error atendiendo {peticion.metodo} {peticion.ruta}: {e}")
+                        respuesta = respuesta_error(500, str(e))
+                except ErrorHttp as e:
+                    # Peticion mal formada: se responde y se cierra la conexion
+                    self._escribir(writer, respuesta_error(e.estado, e.mensaje), False)
+                    await writer.drain()
+                    break
 
-            src_path = os.path.join(os.path.dirname(__file__), 'src')
-            if src_path not in sys.path:
-                sys.path.insert(0, src_path)
+                if isinstance(respuesta, RespuestaEventos):
+                    await self._transmitir_eventos(writer, respuesta)
+                    break
+                self._escribir(writer, respuesta, mantener, peticion.metodo, self.MAX_PETICIONES - atendidas)
+                await writer.drain()
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.conexiones -= 1
+            writer.close()
 
-            try:
-                from google_drive_v2 import sincronizar_con_drive
-            except ModuleNotFoundError:
-                from src.google_drive_v2 import sincronizar_con_drive
+    async def _servir(self, al_iniciar=None):
+        servidor = await asyncio.start_server(
+            self._atender_conexion, '', self.port, limit=self.MAX_CABECERAS, backlog=1024, reuse_address=True
+        )
+        if al_iniciar:
+            al_iniciar()
+        async with servidor:
+            await servidor.serve_forever()
 
-            print(f"Iniciando sincronización con Drive (month_mode={month_mode})...")
-            result = sincronizar_con_drive(config_path=str(CONFIG_FILE), month_mode=month_mode)
+    def serve_forever(self, al_iniciar=None):
+        try:
+            asyncio.run(self._servir(al_iniciar))
+        finally:
+            for pool in self.pools.values():
+                pool.cerrar()
 
-            status_code = 200 if result.get('success') else 500
-            self.send_response(status_code)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps(result, ensure_ascii=False).encode('utf-8'))
 
-        except json.JSONDecodeError:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'message': 'JSON inválido en el body.'
-            }, ensure_ascii=False).encode('utf-8'))
-        except Exception as e:
-            print(f"Error en sincronización: {e}")
-            import traceback
-            traceback.print_exc()
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(json.dumps({
-                'success': False,
-                'message': str(e)
-            }, ensure_ascii=False).encode('utf-8'))
+metricas.REGISTRO.medidor(
+    'control_gastos_http_conexiones_hilos', 'Conexiones abiertas en modo hilos', lambda: CustomHandler.conexiones
+)
+metricas.REGISTRO.medidor(
+    'control_gastos_eventos_suscriptores', 'Clientes conectados a /api/events', lambda: _eventos().BUS.suscriptores()
+)
 
 
 class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    """Servidor HTTP concurrente para evitar bloqueo global por request."""
+    """
+    Servidor HTTP concurrente para evitar bloqueo global por request:
+    - un hilo por conexion (solo lee, escribe y sirve estaticos), como mucho
+      `max_conexiones`; pasado el limite la conexion recibe 503 y se cierra
+    - la API corre en los pools acotados de `crear_pools`
+    """
     allow_reuse_address = True
     daemon_threads = True
+    request_queue_size = 128
+    max_conexiones = MAX_CONEXIONES_HILOS
+
+    def __init__(self, direccion, handler, bind_and_activate=True, workers=None, workers_lentos=None):
+        self.pools = crear_pools(workers, workers_lentos)
+        self._cupos_conexion = threading.BoundedSemaphore(self.max_conexiones)
+        super().__init__(direccion, handler, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        if not self._cupos_conexion.acquire(blocking=False):
+            metricas.RECHAZOS_CONEXION.inc('hilos')
+            try:
+                request.settimeout(1)
+                request.sendall(RESPUESTA_SIN_CONEXIONES)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._cupos_conexion.release()
+            raise
 
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._cupos_conexion.release()
+
+    def server_close(self):
+        super().server_close()
+        for pool in self.pools.values():
+            pool.cerrar()
+
+
+def iniciar_sondeo_drive():
+    """Arrancar el sondeo de cambios en Drive si google_drive.cambios.sondeo_s > 0."""
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        sondeo_s = float(((config.get('google_drive') or {}).get('cambios') or {}).get('sondeo_s', 0) or 0)
+    except (OSError, ValueError, AttributeError):
+        return None
+    if sondeo_s <= 0:
+        return None
+
+    src_path = os.path.join(os.path.dirname(__file__), 'src')
+    if src_path not in sys.path:
+        sys.path.insert(0, src_path)
+    try:
+        from drive_cambios import iniciar_sondeo
+    except ModuleNotFoundError:
+        from src.drive_cambios import iniciar_sondeo
 
-def start_server(port=PORT, open_browser=False):
-    """Iniciar el servidor web"""
+    print(f"Sondeo de cambios en Drive cada {sondeo_s:.0f}s")
+    return iniciar_sondeo(str(CONFIG_FILE), sondeo_s)
+
+
+def _anunciar_servidor(port, open_browser, modo):
+    url = f"http://localhost:{port}"
+    print(f"\n{'='*60}")
+    print(f"  SERVIDOR WEB INICIADO ({modo})")
+    print(f"{'='*60}")
+    print(f"\n  Interfaz disponible en: {url}")
+    print(f"\n  Presiona Ctrl+C para detener el servidor")
+    print(f"{'='*60}\n")
+
+    if open_browser:
+        webbrowser.open(url)
+
+
+def start_server(port=PORT, open_browser=False, modo_async=False, workers=None, workers_lentos=None):
+    """Iniciar el servidor web (hilos por conexion o asyncio con `modo_async`)"""
     
     # Verificar que existe el directorio web
     if not WEB_DIR.exists():
@@ -453,21 +1312,19 @@ def start_server(port=PORT, open_browser=False):
         print("Asegúrate de estar en el directorio correcto del proyecto.")
         return False
     
+    iniciar_sondeo_drive()
+    print(f"Recursos estaticos listos: {recursos_estaticos().precargar()} archivos")
+
     # Intentar usar el puerto especificado, si está ocupado buscar otro
     while True:
         try:
-            with ThreadingTCPServer(("", port), CustomHandler) as httpd:
-                url = f"http://localhost:{port}"
-                print(f"\n{'='*60}")
-                print(f"  SERVIDOR WEB INICIADO")
-                print(f"{'='*60}")
-                print(f"\n  Interfaz disponible en: {url}")
-                print(f"\n  Presiona Ctrl+C para detener el servidor")
-                print(f"{'='*60}\n")
-                
-                if open_browser:
-                    webbrowser.open(url)
-                
+            if modo_async:
+                ServidorAsync(port, workers, workers_lentos=workers_lentos).serve_forever(
+                    al_iniciar=lambda: _anunciar_servidor(port, open_browser, 'asyncio')
+                )
+                break
+            with ThreadingTCPServer(("", port), CustomHandler, workers=workers, workers_lentos=workers_lentos) as httpd:
+                _anunciar_servidor(port, open_browser, 'hilos')
                 httpd.serve_forever()
                 break
         except OSError as e:
@@ -484,11 +1341,18 @@ def main():
     parser = argparse.ArgumentParser(description='Servidor web para Control de Gastos')
     parser.add_argument('--port', '-p', type=int, default=PORT, help=f'Puerto (default: {PORT})')
     parser.add_argument('--no-browser', action='store_true', help='No abrir navegador automáticamente')
+    parser.add_argument('--async', dest='modo_async', action='store_true',
+                        help='Servidor asyncio (keep-alive, API en un pool de hilos)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Hilos para las rutas rapidas de la API (default: {WORKERS_RAPIDOS})')
+    parser.add_argument('--workers-lentos', type=int, default=None,
+                        help=f'Hilos para sync con Drive y mensajes del bot (default: {WORKERS_LENTOS})')
     
     args = parser.parse_args()
     
     try:
-        start_server(port=args.port, open_browser=not args.no_browser)
+        start_server(port=args.port, open_browser=not args.no_browser,
+                     modo_async=args.modo_async, workers=args.workers, workers_lentos=args.workers_lentos)
     except KeyboardInterrupt:
         print("\n\nServidor detenido.")
         sys.exit(0)